@@ -1,26 +1,38 @@
 import argparse
 import sys
-from src.kb.rag.answer import AnswerEngine
+from src.kb.rag.answer import MIN_EVIDENCE_SCORE, AnswerEngine
+from src.kb.embedding.backends import BACKENDS
 
 def main():
     parser = argparse.ArgumentParser(description="Ask a question to the local knowledge base.")
     parser.add_argument("query", type=str, help="The question to ask.")
     parser.add_argument("--index-path", type=str, default="./data/index", help="Path to the index.")
+    parser.add_argument("--backend", type=str, default="torch", choices=BACKENDS, help="Embedding inference backend.")
+    parser.add_argument("--collection", action="append", default=None, help="Answer from this collection only (repeatable; default: all).")
+    parser.add_argument("--min-score", type=float, default=MIN_EVIDENCE_SCORE,
+                        help="Reranker score the best chunk needs before the LLM is asked (0 to always ask).")
+    parser.add_argument("--cache-answers", action="store_true", help="Reuse the answer to a similar earlier question.")
+    parser.add_argument("--no-cache", action="store_true", help="Don't reuse (or store) the results of similar earlier questions.")
     
     args = parser.parse_args()
     
     print(f"Loading Answer Engine (LLM: qwen3:8b)...")
     try:
-        engine = AnswerEngine(index_path=args.index_path)
+        engine = AnswerEngine(index_path=args.index_path, embedding_backend=args.backend, min_score=args.min_score,
+                              cache_size=0 if args.no_cache else 1000, cache_answers=args.cache_answers)
     except Exception as e:
         print(f"Error initializing engine: {e}")
         return
 
+    if args.collection is not None and not hasattr(engine.retriever.vector_store, "collections"):
+        print("Index has no collections (see ingest --collections); answering from all of it.")
+        args.collection = None
+
     print("-" * 50)
     print(f"Question: {args.query}")
     print("-" * 50)
     
-    answer_text, sources = engine.answer(args.query)
+    answer_text, sources = engine.answer(args.query, collections=args.collection)
     
     print("\n" + "="*20 + " ANSWER " + "="*20 + "\n")
     print(answer_text)
@@ -29,7 +41,8 @@ def main():
     print("\nSources Used:")
     for i, doc in enumerate(sources, 1):
         source = doc.metadata.get("source", "Unknown")
-        print(f"{i}. {source}")
+        score = f" (score: {doc.score:.4f})" if doc.score is not None else ""
+        print(f"{i}. {source}{score}")
 
 if __name__ == "__main__":
     main()
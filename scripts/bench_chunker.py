@@ -0,0 +1,121 @@
+import argparse
+import random
+import time
+from typing import List
+from src.kb.chunking.chunker import Chunker
+from src.kb.schema import Document
+
+
+class LegacyChunker(Chunker):
+    """The original Chunker, which re-encodes every fragment it looks at (reference for the benchmark)."""
+
+    def split_text(self, text: str) -> List[str]:
+        return self._legacy_split(text, self.separators)
+
+    def _legacy_split(self, text: str, separators: List[str]) -> List[str]:
+        separator = separators[-1]
+        for sep in separators:
+            if sep == "":
+                separator = ""
+                break
+            if sep in text:
+                separator = sep
+                break
+        splits = text.split(separator) if separator else list(text)
+        new_splits = []
+        for s in splits:
+            if self._token_len(s) <= self.chunk_size:
+                new_splits.append(s)
+            else:
+                idx = separators.index(separator)
+                if idx + 1 < len(separators):
+                    new_splits.extend(self._legacy_split(s, separators[idx + 1:]))
+                else:
+                    new_splits.append(s)
+        return self._legacy_merge(new_splits, separator)
+
+    def _legacy_merge(self, splits: List[str], separator: str) -> List[str]:
+        docs = []
+        current_doc: List[str] = []
+        total_len = 0
+        separator_len = self._token_len(separator)
+        for d in splits:
+            _len = self._token_len(d)
+            if total_len + _len + (separator_len if current_doc else 0) > self.chunk_size:
+                if total_len > self.chunk_size and not current_doc:
+                    docs.append(d)
+                    continue
+                if current_doc:
+                    doc = separator.join(current_doc)
+                    if doc.strip():
+                        docs.append(doc)
+                    while total_len > self.chunk_overlap and current_doc:
+                        removed = current_doc.pop(0)
+                        total_len -= (self._token_len(removed) + separator_len)
+            current_doc.append(d)
+            total_len += _len + (separator_len if len(current_doc) > 1 else 0)
+        if current_doc:
+            doc = separator.join(current_doc)
+            if doc.strip():
+                docs.append(doc)
+        return docs
+
+
+WORDS = ("the voltage regulator shall operate within spec under load error code E1042 "
+         "API get_retriever returns tuple a an of to in is for on with as by at from").split()
+CJK = "模型向量检索文档引用结论数据性能测试中文混合排版标准规范要求"
+
+
+def make_pages(kind: str, n_pages: int, page_chars: int, seed: int = 0) -> List[Document]:
+    rng = random.Random(seed)
+    pages = []
+    for p in range(n_pages):
+        parts, size = [], 0
+        while size < page_chars:
+            if kind == "cjk":
+                part = "".join(rng.choice(CJK) for _ in range(rng.randint(20, 80))) + "。"
+            else:
+                part = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 20))) + "."
+            parts.append(part)
+            size += len(part) + 1
+        # html: one line per sentence, no blank lines; pdf: whitespace collapsed; cjk: no spaces at all
+        joiner = {"html": "\n", "pdf": " ", "cjk": ""}[kind]
+        pages.append(Document(content=joiner.join(parts), metadata={"file_name": f"{kind}.bench", "page_number": p + 1}))
+    return pages
+
+
+def bench(chunker: Chunker, pages: List[Document], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunker.split_documents(pages)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Chunker throughput against the original implementation.")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per corpus.")
+    parser.add_argument("--page-chars", type=int, default=50000, help="Characters per page.")
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs.")
+    args = parser.parse_args()
+
+    new = Chunker(args.chunk_size, args.chunk_overlap)
+    legacy = LegacyChunker(args.chunk_size, args.chunk_overlap)
+
+    print(f"{'corpus':<8} {'MB':>6} {'legacy s':>10} {'new s':>8} {'legacy MB/s':>12} {'new MB/s':>9} {'speedup':>8}")
+    for kind in ("html", "pdf", "cjk"):
+        pages = make_pages(kind, args.pages, args.page_chars)
+        mb = sum(len(p.content.encode("utf-8")) for p in pages) / 1e6
+
+        same = [c.content for c in new.split_documents(pages)] == [c.content for c in legacy.split_documents(pages)]
+        t_legacy = bench(legacy, pages, args.repeat)
+        t_new = bench(new, pages, args.repeat)
+        print(f"{kind:<8} {mb:>6.2f} {t_legacy:>10.3f} {t_new:>8.3f} {mb / t_legacy:>12.2f} {mb / t_new:>9.2f} "
+              f"{t_legacy / t_new:>7.1f}x{'' if same else '  (OUTPUT DIFFERS)'}")
+
+
+if __name__ == "__main__":
+    main()
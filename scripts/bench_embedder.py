@@ -0,0 +1,73 @@
+import argparse
+import os
+import random
+import time
+from typing import List
+import numpy as np
+from src.kb.chunking.chunker import Chunker
+from src.kb.index.vector_store import Embedder, VectorStore
+from src.kb.ingestion.loader import LOADERS, load_document
+
+
+def corpus_from_index(index_path: str) -> List[str]:
+    store = VectorStore(index_path)
+    return [doc.content for doc in store.metadata]
+
+
+def corpus_from_files(data_dir: str, max_files: int) -> List[str]:
+    paths = []
+    for root, _, files in os.walk(data_dir):
+        paths.extend(os.path.join(root, f) for f in files if os.path.splitext(f)[1].lower() in LOADERS)
+    random.Random(0).shuffle(paths)
+    documents = []
+    for path in paths[:max_files]:
+        try:
+            documents.extend(load_document(path))
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+    return [c.content for c in Chunker().split_documents(documents)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunks/sec of fixed-size vs length-bucketed embedding batches.")
+    parser.add_argument("--model", type=str, default="BAAI/bge-m3")
+    parser.add_argument("--index-path", type=str, default="./data/index", help="Take chunks from this index...")
+    parser.add_argument("--data-dir", type=str, default=None, help="...or load and chunk files from here instead.")
+    parser.add_argument("--max-files", type=int, default=50, help="Files to load with --data-dir.")
+    parser.add_argument("--limit", type=int, default=1000, help="Chunks to embed.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Fixed batch size of the baseline.")
+    parser.add_argument("--max-batch-tokens", type=int, default=16384)
+    args = parser.parse_args()
+
+    texts = corpus_from_files(args.data_dir, args.max_files) if args.data_dir else corpus_from_index(args.index_path)
+    # Keep the corpus's natural mix of short and long chunks, in file order
+    texts = texts[:args.limit]
+    if not texts:
+        print("No chunks found.")
+        return
+
+    # In-process: the benchmark times the local model (embedder.model) directly
+    embedder = Embedder(args.model, max_batch_tokens=args.max_batch_tokens, use_server=False)
+    lengths = embedder._token_lengths(texts)
+    print(f"{len(texts)} chunks, tokens: min {min(lengths)}, median {int(np.median(lengths))}, max {max(lengths)}")
+
+    # Warm-up so model initialisation isn't timed
+    embedder.model.encode(texts[:8], normalize_embeddings=True)
+
+    start = time.perf_counter()
+    baseline = embedder.model.encode(texts, batch_size=args.batch_size, normalize_embeddings=True, show_progress_bar=False)
+    t_baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bucketed = embedder._encode(texts, show_progress_bar=False)
+    t_bucketed = time.perf_counter() - start
+
+    n_batches = len(embedder._length_batches(lengths))
+    agreement = float(np.min(np.sum(np.asarray(baseline) * bucketed, axis=1)))
+    print(f"fixed batch_size={args.batch_size}: {len(texts) / t_baseline:8.1f} chunks/s ({t_baseline:.1f}s)")
+    print(f"token budget {args.max_batch_tokens} ({n_batches} batches): {len(texts) / t_bucketed:8.1f} chunks/s ({t_bucketed:.1f}s)")
+    print(f"speedup {t_baseline / t_bucketed:.2f}x, min cosine between runs {agreement:.5f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from src.kb.index.vector_store import VectorStore
+from src.kb.schema import Document
+
+
+def memory_mb() -> dict:
+    """Resident memory of this process (Linux), in MB: private (anonymous) and file-backed (shareable) pages."""
+    usage = {"RssAnon": float("nan"), "RssFile": float("nan")}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key = line.split(":")[0]
+                if key in usage:
+                    usage[key] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return usage
+
+
+def build(index_path: str, n: int, dim: int, precision: str, index_type: str, batch: int = 20000):
+    rng = np.random.RandomState(0)
+    store = VectorStore(index_path, precision=precision, index_type=index_type)
+    for start in range(0, n, batch):
+        count = min(batch, n - start)
+        vectors = rng.randn(count, dim).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        docs = [Document(content=f"synthetic chunk {i}", metadata={"source": f"/bench/file_{i // 100}.pdf", "chunk_id": str(i)})
+                for i in range(start, start + count)]
+        store.add_documents(docs, vectors)
+        print(f"  {start + count:,}/{n:,} vectors", end="\r", flush=True)
+    store.save()
+    print()
+
+
+def measure(index_path: str, mmap: bool):
+    """Runs in a fresh process: open time, first/steady query latency and memory."""
+    before = memory_mb()
+    start = time.perf_counter()
+    store = VectorStore(index_path, mmap=mmap)
+    opened = time.perf_counter() - start
+
+    query = np.random.RandomState(1).randn(store.index.d).astype(np.float32)
+    query /= np.linalg.norm(query)
+    start = time.perf_counter()
+    store.search(query, top_k=10)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(5):
+        store.search(query, top_k=10)
+    steady = (time.perf_counter() - start) / 5
+    after = memory_mb()
+    print(json.dumps({"open": opened, "first": first, "steady": steady,
+                      "private": after["RssAnon"] - before["RssAnon"], "shared": after["RssFile"] - before["RssFile"]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to open a large index with and without memory mapping.")
+    parser.add_argument("--vectors", type=int, default=300_000, help="Synthetic vectors to index.")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--precision", type=str, default="fp32")
+    parser.add_argument("--index-type", type=str, default="flat")
+    parser.add_argument("--index-path", type=str, default=None, help="Benchmark this existing index instead of a synthetic one.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per mode.")
+    parser.add_argument("--measure", choices=["mmap", "read"], default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.index_path, args.measure == "mmap")
+        return
+
+    tmp_dir = None
+    index_path = args.index_path
+    if index_path is None:
+        tmp_dir = tempfile.mkdtemp(prefix="kb_bench_")
+        index_path = os.path.join(tmp_dir, "index")
+        print(f"Building a {args.vectors:,} x {args.dim} {args.precision} {args.index_type} index in {index_path}...")
+        build(index_path, args.vectors, args.dim, args.precision, args.index_type)
+    segments_dir = os.path.join(index_path, "segments")
+    size_mb = sum(os.path.getsize(os.path.join(segments_dir, f)) for f in os.listdir(segments_dir)) / (1 << 20)
+
+    try:
+        print(f"Segments {size_mb:.0f} MB; each run is a fresh process (page cache warm after the first)")
+        print(f"{'mode':<6} {'open ms':>9} {'1st query ms':>13} {'query ms':>9} {'private MB':>11} {'shared MB':>10}")
+        for mode in ("read", "mmap"):
+            for _ in range(args.runs):
+                out = subprocess.run(
+                    [sys.executable, "-m", "scripts.bench_startup", "--measure", mode, "--index-path", index_path],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                r = json.loads(out.strip().splitlines()[-1])
+                print(f"{mode:<6} {r['open'] * 1000:9.1f} {r['first'] * 1000:13.1f} {r['steady'] * 1000:9.1f} "
+                      f"{r['private']:11.0f} {r['shared']:10.0f}")
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
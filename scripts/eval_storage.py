@@ -0,0 +1,52 @@
+import argparse
+import random
+import numpy as np
+from src.kb.eval.storage import evaluate_storage
+from src.kb.index.vector_store import PRECISIONS, get_retriever
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs memory of compact vector storage settings.")
+    parser.add_argument("--index-path", type=str, default="./data/index", help="Index whose chunks are evaluated.")
+    parser.add_argument("--queries-file", type=str, default=None,
+                        help="Eval queries, one per line (default: sample chunk openings as pseudo-queries).")
+    parser.add_argument("--num-queries", type=int, default=200, help="Pseudo-queries to sample without --queries-file.")
+    parser.add_argument("--dims", type=str, default="full,512,256", help="Comma-separated dimensions to try ('full' = no truncation).")
+    parser.add_argument("--top-k", type=int, default=10, help="Recall@k cut-off.")
+    parser.add_argument("--project-chunks", type=int, default=1_000_000, help="Corpus size for the projected memory column.")
+    args = parser.parse_args()
+
+    embedder, store = get_retriever(index_path=args.index_path)
+    if not store.metadata:
+        print("Index is empty.")
+        return
+
+    # Exact fp32 baseline vectors: read back from an exact index, otherwise re-embed (served from the embedding cache)
+    if store.precision == "fp32" and not store.dim and store.built_type != "ivfpq":
+        _, vectors = store.vectors()
+    else:
+        print(f"Index is stored as {store.precision}/{store.dim}; re-embedding {len(store.metadata)} chunks for the fp32 baseline...")
+        vectors = embedder.embed_documents(store.metadata)
+
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        sample = random.Random(0).sample(store.metadata, min(args.num_queries, len(store.metadata)))
+        texts = [doc.content[:200] for doc in sample]
+    queries = np.stack([embedder.embed_query(t) for t in texts])
+
+    full = vectors.shape[1]
+    dims = sorted({full if d == "full" else min(int(d), full) for d in args.dims.split(",")}, reverse=True)
+    settings = [(precision, None if dim == full else dim) for dim in dims for precision in PRECISIONS]
+    results = evaluate_storage(vectors, queries, settings, k=args.top_k)
+
+    print(f"{len(vectors)} chunks, {len(texts)} queries, recall@{args.top_k} vs exact fp32/{full}")
+    print(f"{'precision':<10} {'dim':>5} {'B/vector':>9} {'index MB':>9} {'MB @ ' + format(args.project_chunks, ','):>16} {'recall':>7} {'ms/query':>9}")
+    for r in results:
+        projected = r.bytes_per_vector * args.project_chunks / 1e6
+        print(f"{r.precision:<10} {r.dim:>5} {r.bytes_per_vector:>9} {r.index_bytes / 1e6:>9.2f} {projected:>16.0f} {r.recall:>7.3f} {r.ms_per_query:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import platform
+import sys
+import time
+import numpy as np
+from src.kb.embedding.backends import default_model_dir, cosine_parity, load_onnx_model
+
+SAMPLE_TEXTS = [
+    "What is the operating voltage range of the regulator?",
+    "电源管理芯片的工作电压范围是多少？",
+    "The API returns a tuple of (embedder, store) for the given index path.",
+    "检索增强生成系统首先召回相关文档，然后由大模型根据引用作答。",
+    "Error code E1042 indicates that the calibration table is missing.",
+    "模型量化可以在几乎不损失精度的情况下显著提升 CPU 推理速度。",
+    "Section 4.2 describes the thermal shutdown behaviour under sustained load.",
+    "Short query",
+]
+
+
+def default_quantization_config() -> str:
+    """Picks the int8 kernel set for this CPU."""
+    machine = platform.machine().lower()
+    if machine in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return "avx2"
+    if "avx512_vnni" in flags or "avx512vnni" in flags:
+        return "avx512_vnni"
+    if "avx512" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def export(model_name: str, output: str, quantization_config: str):
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    print(f"Exporting {model_name} to ONNX (fp32)...")
+    model = SentenceTransformer(model_name, backend="onnx")
+    model.save(output)
+    print(f"Quantizing to int8 ({quantization_config})...")
+    export_dynamic_quantized_onnx_model(model, quantization_config, output)
+    print(f"Saved to {output}")
+
+
+def check(model_name: str, output: str, threshold: float, texts) -> bool:
+    """Compares each exported backend against the fp32 PyTorch embeddings."""
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_name).encode(texts, normalize_embeddings=True)
+    ok = True
+    for backend in ("onnx", "onnx-int8"):
+        model = load_onnx_model(model_name, backend, output)
+        model.encode(texts[:2], normalize_embeddings=True)  # warm-up
+        start = time.perf_counter()
+        embeddings = model.encode(texts, normalize_embeddings=True)
+        elapsed = time.perf_counter() - start
+        cosine = cosine_parity(np.asarray(reference), np.asarray(embeddings))
+        passed = float(cosine.min()) >= threshold
+        ok = ok and passed
+        print(f"{backend:<10} min cosine {cosine.min():.5f}, mean {cosine.mean():.5f}, "
+              f"{len(texts) / elapsed:.1f} texts/s  {'OK' if passed else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX and int8-quantized ONNX.")
+    parser.add_argument("--model", type=str, default="BAAI/bge-m3", help="HF model name (uses the local HF cache).")
+    parser.add_argument("--output", type=str, default=None, help="Output directory (default: ./data/cache/models/<model>).")
+    parser.add_argument("--quantization", type=str, default=None, choices=["arm64", "avx2", "avx512", "avx512_vnni"],
+                        help="int8 kernel set (default: detected from this CPU).")
+    parser.add_argument("--skip-export", action="store_true", help="Only run the parity check on an existing export.")
+    parser.add_argument("--no-check", action="store_true", help="Skip the parity check against fp32 PyTorch.")
+    parser.add_argument("--threshold", type=float, default=0.99, help="Minimum cosine similarity to fp32 embeddings.")
+    parser.add_argument("--texts-file", type=str, default=None, help="Texts for the parity check, one per line.")
+    args = parser.parse_args()
+
+    output = args.output or default_model_dir(args.model)
+    if not args.skip_export:
+        export(args.model, output, args.quantization or default_quantization_config())
+
+    if args.no_check:
+        return
+    texts = SAMPLE_TEXTS
+    if args.texts_file:
+        with open(args.texts_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    print(f"Parity check on {len(texts)} texts (threshold {args.threshold})...")
+    if not check(args.model, output, args.threshold, texts):
+        print("Parity check failed: do not use this export.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,29 +4,16 @@ import sys
 
 print("Loading libraries (this may take a few seconds)...", flush=True)
 
-from typing import List
-from tqdm import tqdm
-from src.kb.ingestion.pdf_loader import load_pdf
-from src.kb.ingestion.html_loader import load_html
+from src.kb.ingestion.loader import LOADERS
+from src.kb.ingestion.pipeline import IngestPipeline
 from src.kb.chunking.chunker import Chunker
-from src.kb.index.vector_store import get_retriever
-from src.kb.schema import Document
-
-# Supported extensions
-LOADERS = {
-    ".pdf": load_pdf,
-    ".html": load_html,
-    ".htm": load_html
-}
-
-def load_document(file_path: str) -> List[Document]:
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext in LOADERS:
-        # print(f"Loading {file_path}...") # Reduced noise
-        return LOADERS[ext](file_path)
-    else:
-        # print(f"Skipping unsupported file: {file_path}")
-        return []
+from src.kb.chunking.dedup import NearDuplicateDetector
+from src.kb.index.vector_store import PRECISIONS, get_retriever
+from src.kb.index.shards import ShardedVectorStore
+from src.kb.index.index_types import INDEX_TYPES
+from src.kb.embedding.backends import BACKENDS
+from src.kb.embedding.pool import parse_size
+from src.kb.ingestion.manifest import IngestManifest, normalize_path
 
 def main():
     parser = argparse.ArgumentParser(description="Ingest documents into the vector store.")
@@ -35,72 +22,164 @@ def main():
     parser.add_argument("--reset", action="store_true", help="Reset the index before ingesting.")
     parser.add_argument("--limit", type=int, default=None, help="Limit the number of documents to process (for testing).")
     parser.add_argument("--filename", type=str, default=None, help="Ingest a specific file only (by name).")
+    parser.add_argument("--force", action="store_true", help="Re-ingest files even if the manifest says they are unchanged.")
+    parser.add_argument("--backend", type=str, default="torch", choices=BACKENDS, help="Embedding inference backend.")
+    parser.add_argument("--workers", type=int, default=0, help="Load files on a pool of N processes (0 = load in this process).")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-file load timeout in seconds (with --workers).")
+    parser.add_argument("--chunk-threads", type=int, default=1, help="Threads used to tokenize pages while chunking.")
+    parser.add_argument("--dedup-threshold", type=float, default=0.9, help="Jaccard similarity above which chunks are treated as near-duplicates.")
+    parser.add_argument("--no-dedup", action="store_true", help="Embed every chunk, even near-duplicates.")
+    parser.add_argument("--precision", type=str, default=None, choices=PRECISIONS, help="Vector storage precision (re-encodes an existing index).")
+    parser.add_argument("--dim", type=int, default=None, help="Truncate stored vectors to this many dimensions (0 = full).")
+    parser.add_argument("--index-type", type=str, default=None, choices=INDEX_TYPES, help="ANN index type (auto = chosen by vector count; rebuilds an existing index).")
+    parser.add_argument("--hnsw-m", type=int, default=None, help="HNSW graph degree (build-time).")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cell count (build-time; default ~4*sqrt(n)).")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW search breadth (recall vs latency).")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF cells visited per query (recall vs latency).")
+    parser.add_argument("--compact", action="store_true", help="Rebuild the index as one segment, without vectors of deleted chunks.")
+    parser.add_argument("--collections", action="store_true", help="Split the index into one collection per top-level folder of --data-dir (searched in parallel, selectable per query).")
+    parser.add_argument("--collection", action="append", default=None, help="Apply --precision/--dim/--index-type/--compact to this collection only (repeatable).")
+    parser.add_argument("--embed-workers", type=int, default=0, help="Embed on a pool of N processes, each with its own model copy (0 = in this process).")
+    parser.add_argument("--embed-memory", type=str, default=None, help="Memory ceiling for the embedding pool, e.g. 12G (default: memory available).")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks embedded and indexed per batch.")
+    parser.add_argument("--cache-dir", type=str, default="./data/processed", help="Parsed-text cache directory.")
+    parser.add_argument("--no-cache", action="store_true", help="Always re-parse files instead of using the parsed-text cache.")
+    parser.add_argument("--checkpoint-every", type=int, default=20, help="Save index and manifest every N batches.")
     
     args = parser.parse_args()
     
-    # Initialize components
-    print("Initializing components (downloading models if needed)...")
-    chunker = Chunker()
-    embedder, store = get_retriever(index_path=args.index_path)
-    
+    manifest = IngestManifest(os.path.join(args.index_path, "manifest.json"))
     if args.reset:
-        print("Resetting index...")
-        store.index = None
-        store.metadata = []
-        
-    documents = []
+        manifest.clear()
     
     # Walk directory
-    if os.path.exists(args.data_dir):
-        print("Scanning files...")
-        file_list = []
-        for root, _, files in os.walk(args.data_dir):
-            for file in files:
-                # Filter by filename if provided
-                if args.filename and args.filename.lower() not in file.lower():
-                    continue
-                    
-                file_list.append(os.path.join(root, file))
-                
-        if not file_list:
-            if args.filename:
-                print(f"File '{args.filename}' not found in {args.data_dir}.")
-            else:
-                print("No files found.")
-            return
-
-        print(f"Found {len(file_list)} files. Loading...")
-        for file_path in tqdm(file_list, desc="Loading Files"):
-            docs = load_document(file_path)
-            documents.extend(docs)
-            if args.limit and len(documents) >= args.limit:
-                print(f"Reached limit of {args.limit} documents.")
-                documents = documents[:args.limit]
-                break
-    else:
+    if not os.path.exists(args.data_dir):
         print(f"Data directory {args.data_dir} does not exist.")
         return
 
-    if not documents:
-        print("No documents found to ingest.")
+    print("Scanning files...")
+    file_list = []
+    for root, _, files in os.walk(args.data_dir):
+        for file in sorted(files):
+            # Filter by filename if provided
+            if args.filename and args.filename.lower() not in file.lower():
+                continue
+            if os.path.splitext(file)[1].lower() not in LOADERS:
+                continue
+                
+            file_list.append(os.path.join(root, file))
+            
+    if not file_list and args.filename:
+        print(f"File '{args.filename}' not found in {args.data_dir}.")
         return
 
-    print(f"Loaded {len(documents)} raw documents/pages.")
-    
-    # Chunking
-    print("Chunking...")
-    chunked_docs = chunker.split_documents(documents)
-    print(f"Generated {len(chunked_docs)} chunks.")
-    
-    # Embedding
-    print("Embedding (on CPU)...")
-    embeddings = embedder.embed_documents(chunked_docs)
-    print("Done.")
+    # Deletions are only detected on a full scan of the data directory
+    plan = manifest.plan(file_list, scope=None if args.filename else args.data_dir)
+    if args.force:
+        # Known hashes let the parsed-text cache serve these without re-reading the files
+        for file_path in plan.unchanged:
+            plan.hashes[normalize_path(file_path)] = manifest.get(file_path).sha256
+        plan.changed.extend(plan.unchanged)
+        plan.unchanged = []
+    print(f"Found {len(file_list)} files: {len(plan.new)} new, {len(plan.changed)} changed, "
+          f"{len(plan.unchanged)} unchanged, {len(plan.deleted)} deleted.")
+
+    index_params = {k: v for k, v in (("hnsw_m", args.hnsw_m), ("nlist", args.nlist),
+                                       ("ef_search", args.ef_search), ("nprobe", args.nprobe)) if v is not None}
+    storage_change = (args.precision is not None or args.dim is not None or args.index_type is not None
+                      or bool(index_params) or args.compact or args.collections)
+    if not plan.to_ingest and not plan.deleted and not args.reset and not storage_change:
+        # Persist refreshed mtimes of touched-but-identical files
+        manifest.save()
+        print("Index is up to date.")
+        return
+
+    # Initialize components
+    print("Initializing components (downloading models if needed)...")
+    chunker = Chunker()
+    # Read in full rather than mapped: ingestion modifies the index
+    embedder, store = get_retriever(index_path=args.index_path, backend=args.backend, mmap=False)
     
-    # Indexing
-    print("Indexing...", end=" ", flush=True)
-    store.add_documents(chunked_docs, embeddings)
-    store.save()
+    if args.collections and not isinstance(store, ShardedVectorStore):
+        sharded = ShardedVectorStore(args.index_path, data_dir=args.data_dir, precision=store.precision, dim=store.dim,
+                                     index_type=store.index_type, index_params=store.index_params, mmap=False)
+        if len(store.metadata) and not args.reset:
+            # Vectors are moved as stored, not re-embedded
+            print(f"Splitting {len(store.metadata)} chunks into collections...")
+            sharded.import_store(store)
+        sharded.save()
+        print(f"Collections: {', '.join(sharded.collections) or '(none yet)'}")
+        store.clear()
+        store.save()
+        store = sharded
+
+    if args.reset:
+        print("Resetting index...")
+        store.clear()
+
+    if args.collection and not isinstance(store, ShardedVectorStore):
+        print("Index has no collections (see --collections); --collection is ignored.")
+    # Storage settings apply to all collections unless --collection names some
+    scope = {"collections": args.collection} if isinstance(store, ShardedVectorStore) and args.collection else {}
+
+    if storage_change:
+        precision = args.precision or store.precision
+        dim = store.dim if args.dim is None else (args.dim or None)
+        if (precision, dim) != (store.precision, store.dim):
+            print(f"Re-encoding index as {precision}" + (f", {dim} dims" if dim else "") + "...")
+            store.rebuild(precision, dim, **scope)
+        if args.index_type is not None or index_params:
+            # The index itself is rebuilt on the next save
+            store.set_index_type(args.index_type or store.index_type, **scope, **index_params)
+        if args.compact:
+            print(f"Compacting index ({len(store.tombstones)} deleted vectors)...")
+            store.compact(**scope)
+
+    # Purge files that disappeared from the data dir
+    if plan.deleted:
+        removed = store.delete_by_source(plan.deleted)
+        print(f"Removed {removed} chunks of {len(plan.deleted)} deleted files.")
+    for file_path in plan.deleted:
+        manifest.remove(file_path)
+
+    if args.embed_workers > 1:
+        started = embedder.start_pool(args.embed_workers, memory_limit=parse_size(args.embed_memory) if args.embed_memory else None)
+        if started < args.embed_workers:
+            print(f"Memory ceiling allows {started} embedding workers (asked for {args.embed_workers}).")
+        if started:
+            print(f"Embedding on {started} worker processes.")
+
+    # Stream load -> chunk -> embed -> index in batches, checkpointing as we go
+    pipeline = IngestPipeline(
+        chunker, embedder, store, manifest,
+        batch_size=args.batch_size, checkpoint_every=args.checkpoint_every,
+        chunk_threads=args.chunk_threads,
+        dedup=None if args.no_dedup else NearDuplicateDetector(threshold=args.dedup_threshold),
+    )
+    try:
+        stats = pipeline.run(
+            plan.to_ingest, workers=args.workers, timeout=args.timeout,
+            limit=args.limit, hashes=plan.hashes,
+            cache_dir=None if args.no_cache else args.cache_dir,
+        )
+    finally:
+        embedder.stop_pool()
+    if stats.limit_reached:
+        print(f"Reached limit of {args.limit} documents.")
+
+    if stats.failed:
+        print(f"Failed to load {len(stats.failed)} files:")
+        for result in stats.failed:
+            print(f"  {result.file_path}: {result.error.splitlines()[0]}")
+
+    if pipeline.dedup is not None and pipeline.dedup.stats.duplicates:
+        dedup_stats = pipeline.dedup.stats
+        print(f"Skipped embedding {dedup_stats.duplicates} near-duplicate chunks "
+              f"({dedup_stats.saved_ratio:.1%} of chunks, {dedup_stats.exact} exact, "
+              f"{dedup_stats.saved_chars:,} chars not embedded).")
+
+    print(f"Indexed {stats.chunks} chunks from {stats.files} files ({stats.pages} pages, "
+          f"{stats.cached} files from cache) in {stats.batches} batches.")
     print("Saved index.")
 
 if __name__ == "__main__":
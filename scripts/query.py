@@ -1,34 +1,62 @@
 import argparse
 from src.kb.index.vector_store import get_retriever
+from src.kb.embedding.backends import BACKENDS
+
+def print_results(query, results):
+    print(f"\nQuery: {query}\n")
+    if not results:
+        print("No results found.")
+    else:
+        for i, doc in enumerate(results):
+            print(f"--- Result {i+1} ---")
+            print(f"Source: {doc.metadata.get('file_name', 'Unknown')}" +
+                  (f" [{doc.metadata['category']}]" if doc.metadata.get("category") else ""))
+            print(f"Page/Chunk: {doc.metadata.get('page_number', 'N/A')} / {doc.metadata.get('chunk_index', 'N/A')}")
+            print(f"Score: {doc.score:.4f}")
+            print(f"Content:\n{doc.content.strip()[:500]}...") # Preview
+            print("\n")
 
 def main():
     parser = argparse.ArgumentParser(description="Query the knowledge base.")
-    parser.add_argument("query", type=str, help="The query string.")
+    parser.add_argument("query", type=str, nargs="?", default=None, help="The query string.")
+    parser.add_argument("--queries-file", type=str, default=None, help="Run every query in this file (one per line) as one batch.")
     parser.add_argument("--index-path", type=str, default="./data/index", help="Path to the index.")
     parser.add_argument("--top-k", type=int, default=3, help="Number of results to return.")
-    
+    parser.add_argument("--backend", type=str, default="torch", choices=BACKENDS, help="Embedding inference backend.")
+    parser.add_argument("--ef-search", type=int, default=None, help="HNSW search breadth (default: the value saved with the index).")
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF cells visited per query (default: the value saved with the index).")
+    parser.add_argument("--collection", action="append", default=None, help="Search only this collection (repeatable; default: all).")
+
     args = parser.parse_args()
-    
+    if (args.query is None) == (args.queries_file is None):
+        parser.error("give either a query or --queries-file")
+
     # Load index
-    embedder, store = get_retriever(index_path=args.index_path)
-    
+    embedder, store = get_retriever(index_path=args.index_path, backend=args.backend)
+    store.set_search_params(ef_search=args.ef_search, nprobe=args.nprobe)
+
+    if args.collection is not None and not hasattr(store, "collections"):
+        print("Index has no collections (see ingest --collections); searching all of it.")
+        args.collection = None
+    scope = {"collections": args.collection} if args.collection is not None else {}
+
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+        # One embedding call and one index search for the whole file
+        results = store.search_batch(embedder.embed_queries(queries), top_k=args.top_k, **scope)
+        for query, query_results in zip(queries, results):
+            print_results(query, query_results)
+        return
+
     # Embed query
     query_emb = embedder.embed_query(args.query)
-    
+
     # Search
-    results = store.search(query_emb, top_k=args.top_k)
-    
+    results = store.search(query_emb, top_k=args.top_k, **scope)
+
     # Display results
-    print(f"\nQuery: {args.query}\n")
-    if not results:
-        print("No results found.")
-    else:
-        for i, doc in enumerate(results):
-            print(f"--- Result {i+1} ---")
-            print(f"Source: {doc.metadata.get('file_name', 'Unknown')}")
-            print(f"Page/Chunk: {doc.metadata.get('page_number', 'N/A')} / {doc.metadata.get('chunk_index', 'N/A')}")
-            print(f"Content:\n{doc.content.strip()[:500]}...") # Preview
-            print("\n")
+    print_results(args.query, results)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,61 @@
+import argparse
+import os
+import signal
+import sys
+
+print("Loading libraries (this may take a few seconds)...", flush=True)
+
+from src.kb.embedding.backends import BACKENDS
+from src.kb.index.vector_store import Embedder
+from src.kb.retrieve.retriever import Reranker
+from src.kb.serving.model_server import ModelServer, key_file, server_address
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host the embedding and rerank models for all local entry points.")
+    parser.add_argument("--model", type=str, default="BAAI/bge-m3", help="Embedding model.")
+    parser.add_argument("--backend", type=str, default="torch", choices=BACKENDS, help="Embedding inference backend.")
+    parser.add_argument("--reranker", type=str, default="BAAI/bge-reranker-large", help="Rerank model.")
+    parser.add_argument("--no-reranker", action="store_true", help="Only host the embedding model.")
+    parser.add_argument("--cache-dir", type=str, default="./data/cache/embeddings", help="Embedding cache directory.")
+    parser.add_argument("--max-batch", type=int, default=256, help="Most items coalesced into one model call.")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="How long to wait for concurrent requests to join a batch.")
+    args = parser.parse_args()
+
+    address = server_address()
+    if address is None:
+        print("KB_MODEL_SERVER is off; set it to host:port or unix:/path.")
+        sys.exit(1)
+
+    print("Loading models...")
+    embedder = Embedder(args.model, cache_dir=args.cache_dir, backend=args.backend, use_server=False)
+    reranker = None if args.no_reranker else Reranker(args.reranker, use_server=False)
+    server = ModelServer(embedder, reranker, max_items=args.max_batch, max_wait=args.max_wait_ms / 1000)
+
+    # Fresh secret per run, readable by this user only
+    path = key_file()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    authkey = os.urandom(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+
+    def stop(signum, frame):
+        server.shutdown()
+    signal.signal(signal.SIGTERM, stop)
+
+    print(f"Serving {server.info()} on {address}. Ctrl+C to stop.")
+    try:
+        server.serve_forever(address, authkey)
+    except KeyboardInterrupt:
+        server.shutdown()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+        print("Model server stopped.")
+
+
+if __name__ == "__main__":
+    main()
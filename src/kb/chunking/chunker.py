@@ -1,5 +1,7 @@
 import tiktoken
-from typing import List, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional
 from src.kb.schema import Document
 
 class text_splitter:
@@ -84,24 +86,48 @@ class text_splitter:
         return final_chunks
 
 class Chunker:
-    """Chunks documents into smaller pieces."""
+    """
+    Chunks documents into smaller pieces.
+
+    Recursive separator-based splitting ("\n\n" -> "\n" -> " " -> characters) with
+    token-budget merging and overlap. Each distinct fragment of a document is
+    tokenized once; the merge and overlap steps work on the resulting length arrays
+    instead of re-encoding text. Boundaries are identical to the original
+    implementation (tests/data/chunker_golden.json).
+    """
     
     def __init__(self, chunk_size: int = 800, chunk_overlap: int = 100):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
         self.separators = ["\n\n", "\n", " ", ""]
+        # Token length of single characters (character-level fallback), shared across documents
+        self._char_lens: Dict[str, int] = {}
 
     def _token_len(self, text: str) -> int:
-        return len(self.tokenizer.encode(text))
+        return len(self.tokenizer.encode_ordinary(text))
+
+    def split_documents(self, documents: List[Document], num_threads: int = 1, batch_size: int = 64) -> List[Document]:
+        """
+        Chunks `documents`, keeping input order (and therefore `chunk_id`s) stable.
+
+        With num_threads > 1, pages are processed in batches of `batch_size`: the
+        first-level fragments of the whole batch are tokenized with tiktoken's
+        batch encoder (which releases the GIL), then the pages are split on a
+        thread pool.
+        """
+        if num_threads > 1 and len(documents) > 1:
+            all_chunks: List[List[str]] = []
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                for start in range(0, len(documents), batch_size):
+                    texts = [doc.content for doc in documents[start:start + batch_size]]
+                    memo = self._prefill(texts, num_threads)
+                    all_chunks.extend(executor.map(lambda text: self.split_text(text, memo), texts))
+        else:
+            all_chunks = [self.split_text(doc.content) for doc in documents]
 
-    def split_documents(self, documents: List[Document]) -> List[Document]:
         chunked_docs = []
-        
-        for doc in documents:
-            text = doc.content
-            chunks = self._recursive_split(text, self.separators)
-            
+        for doc, chunks in zip(documents, all_chunks):
             for i, chunk in enumerate(chunks):
                 new_meta = doc.metadata.copy()
                 new_meta["chunk_index"] = i
@@ -110,56 +136,81 @@ class Chunker:
                 
         return chunked_docs
 
-    def _recursive_split(self, text: str, separators: List[str]) -> List[str]:
+    def split_text(self, text: str, memo: Optional[Dict[str, int]] = None) -> List[str]:
+        """Splits one text into chunks of at most ~chunk_size tokens."""
+        # Memo of fragment -> token length: repeated lines/words (boilerplate) are encoded once
+        if memo is None:
+            memo = {}
+        return self._recursive_split(text, self.separators, memo)
+
+    def _prefill(self, texts: List[str], num_threads: int) -> Dict[str, int]:
+        """Token lengths of the first-level fragments of `texts`, encoded as one threaded batch."""
+        fragments = set()
+        for text in texts:
+            separator = self._pick_separator(text, self.separators)
+            if separator:
+                fragments.update(text.split(separator))
+        fragments.update(self.separators)
+        fragments = list(fragments)
+        encoded = self.tokenizer.encode_ordinary_batch(fragments, num_threads=num_threads)
+        return {fragment: len(tokens) for fragment, tokens in zip(fragments, encoded)}
+
+    def _lengths(self, pieces: List[str], memo: Dict[str, int]) -> List[int]:
+        encode = self.tokenizer.encode_ordinary
+        lengths = []
+        for piece in pieces:
+            n = memo.get(piece)
+            if n is None:
+                n = memo[piece] = len(encode(piece))
+            lengths.append(n)
+        return lengths
+
+    @staticmethod
+    def _pick_separator(text: str, separators: List[str]) -> str:
+        """First separator present in `text` ("" means character split)."""
+        for sep in separators:
+            if sep == "" or sep in text:
+                return sep
+        return separators[-1]
+
+    def _recursive_split(self, text: str, separators: List[str], memo: Dict[str, int]) -> List[str]:
         """Recursively split text using the given separators."""
-        final_chunks = []
-        
         # 1. Find the appropriate separator
-        separator = separators[-1]
-        for sep in separators:
-            if sep == "":
-                separator = ""
-                break
-            if sep in text:
-                separator = sep
-                break
+        separator = self._pick_separator(text, separators)
                 
-        # 2. Split text
+        # 2. Split text and measure every piece once
         if separator:
             splits = text.split(separator)
+            lengths = self._lengths(splits, memo)
         else:
             splits = list(text) # Character split
+            lengths = self._lengths(splits, self._char_lens)
             
-        # 3. Process splits
-        new_splits = []
-        for s in splits:
-            if self._token_len(s) <= self.chunk_size:
+        # 3. Recurse into pieces that are still too large
+        next_separators = separators[separators.index(separator) + 1:]
+        new_splits: List[str] = []
+        new_lengths: List[int] = []
+        for s, n in zip(splits, lengths):
+            if n <= self.chunk_size or not next_separators:
+                # Oversized pieces with no separator left are kept to avoid data loss
                 new_splits.append(s)
+                new_lengths.append(n)
             else:
-                # If a segment is too large, recurse with the next separator
-                try:
-                    idx = separators.index(separator)
-                    if idx + 1 < len(separators):
-                        sub_chunks = self._recursive_split(s, separators[idx+1:])
-                        new_splits.extend(sub_chunks)
-                    else:
-                        # Fallback: keep even if too big (or we could force slice)
-                        # For now, we'll just keep it to avoid data loss
-                        new_splits.append(s) 
-                except ValueError:
-                     new_splits.append(s)
+                sub_chunks = self._recursive_split(s, next_separators, memo)
+                new_splits.extend(sub_chunks)
+                new_lengths.extend(self._lengths(sub_chunks, memo))
 
         # 4. Merge splits into chunks
-        return self._merge_splits(new_splits, separator)
+        return self._merge_splits(new_splits, new_lengths, separator, memo)
 
-    def _merge_splits(self, splits: List[str], separator: str) -> List[str]:
+    def _merge_splits(self, splits: List[str], lengths: List[int], separator: str, memo: Dict[str, int]) -> List[str]:
         docs = []
-        current_doc: List[str] = []
+        current_doc: Deque[str] = deque()
+        current_lens: Deque[int] = deque()
         total_len = 0
-        separator_len = self._token_len(separator)
+        separator_len = self._lengths([separator], memo)[0]
 
-        for d in splits:
-            _len = self._token_len(d)
+        for d, _len in zip(splits, lengths):
             if total_len + _len + (separator_len if current_doc else 0) > self.chunk_size:
                 if total_len > self.chunk_size:
                     # Single chunk is too big, add it anyway
@@ -172,14 +223,13 @@ class Chunker:
                     if doc.strip():
                         docs.append(doc)
                     
-                    # Reset with overlap
-                    # Simple overlap: keep the last 20% of items or similar
-                    # Better overlap: keep items until overlap size is met
+                    # Reset with overlap: drop leading pieces until the overlap budget is met
                     while total_len > self.chunk_overlap and current_doc:
-                        removed = current_doc.pop(0)
-                        total_len -= (self._token_len(removed) + separator_len)
+                        current_doc.popleft()
+                        total_len -= current_lens.popleft() + separator_len
             
             current_doc.append(d)
+            current_lens.append(_len)
             total_len += _len + (separator_len if len(current_doc) > 1 else 0)
 
         if current_doc:
@@ -0,0 +1,140 @@
+import hashlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+import numpy as np
+from src.kb.schema import Document
+
+# Keys copied into a representative's "duplicates" list for every collapsed chunk
+LOCATION_KEYS = ("source", "file_name", "page_number", "chunk_id")
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+
+@dataclass
+class DedupStats:
+    chunks: int = 0
+    duplicates: int = 0
+    exact: int = 0
+    saved_chars: int = 0
+
+    @property
+    def saved_ratio(self) -> float:
+        return self.duplicates / self.chunks if self.chunks else 0.0
+
+
+def location_of(doc: Document) -> Dict:
+    return {k: doc.metadata.get(k) for k in LOCATION_KEYS if k in doc.metadata}
+
+
+class NearDuplicateDetector:
+    """
+    MinHash/LSH near-duplicate filter for chunks, applied before embedding.
+
+    Chunks are shingled into character k-grams (works for CJK and English alike),
+    summarised by a MinHash signature and bucketed with LSH banding; candidates
+    are confirmed by estimated Jaccard similarity >= `threshold`. A duplicate is
+    not returned for embedding: its location is appended to the first-seen
+    chunk's metadata["duplicates"], so one stored vector cites every copy.
+
+    State is kept for the lifetime of the detector, so duplicates are found
+    across all files of an ingest run.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, bands: int = 16, shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=(num_perm, 1)).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=(num_perm, 1)).astype(np.uint64)
+
+        self._exact: Dict[bytes, Document] = {}
+        self._buckets: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(bands)]
+        self._signatures: List[np.ndarray] = []
+        self._representatives: List[Document] = []
+        # Representatives that gained duplicates since the last pop_updated()
+        self._updated: Dict[int, Document] = {}
+        self.stats = DedupStats()
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (uint32[num_perm]) of the character shingles of `text`."""
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        k = self.shingle_size
+        if len(codes) < k:
+            codes = np.concatenate([codes, np.zeros(k - len(codes), dtype=np.uint64)])
+
+        # Polynomial hash of every k-gram, vectorised (wraps mod 2^64), folded to 32 bits
+        shingles = np.zeros(len(codes) - k + 1, dtype=np.uint64)
+        for i in range(k):
+            shingles = shingles * np.uint64(1000003) + codes[i:len(codes) - k + 1 + i]
+        shingles = np.unique((shingles ^ (shingles >> np.uint64(32))) & np.uint64(0xFFFFFFFF))
+
+        hashed = (self._a * shingles[None, :] + self._b) % _MERSENNE_PRIME
+        return (hashed.min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _find(self, signature: np.ndarray, keys: List[bytes]) -> Tuple[int, float]:
+        best, best_score = -1, 0.0
+        checked = set()
+        for band, key in enumerate(keys):
+            for candidate in self._buckets[band].get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                score = float(np.mean(self._signatures[candidate] == signature))
+                if score > best_score:
+                    best, best_score = candidate, score
+        return best, best_score
+
+    def _merge(self, representative: Document, duplicate: Document):
+        representative.metadata.setdefault("duplicates", []).append(location_of(duplicate))
+        self._updated[id(representative)] = representative
+        self.stats.duplicates += 1
+        self.stats.saved_chars += len(duplicate.content)
+
+    def pop_updated(self) -> List[Document]:
+        """Representatives whose duplicates changed since the last call (to write back to the store)."""
+        updated, self._updated = list(self._updated.values()), {}
+        return updated
+
+    def filter(self, chunks: List[Document]) -> List[Document]:
+        """Returns the chunks that still need embedding; duplicates are merged away."""
+        unique = []
+        for chunk in chunks:
+            self.stats.chunks += 1
+            normalized = self._normalize(chunk.content)
+
+            digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+            representative = self._exact.get(digest)
+            if representative is not None:
+                self.stats.exact += 1
+                self._merge(representative, chunk)
+                continue
+
+            signature = self.signature(normalized)
+            keys = self._band_keys(signature)
+            match, score = self._find(signature, keys)
+            if match >= 0 and score >= self.threshold:
+                self._merge(self._representatives[match], chunk)
+                continue
+
+            idx = len(self._signatures)
+            self._signatures.append(signature)
+            self._representatives.append(chunk)
+            self._exact[digest] = chunk
+            for band, key in enumerate(keys):
+                self._buckets[band][key].append(idx)
+            unique.append(chunk)
+        return unique
@@ -0,0 +1,56 @@
+import os
+import re
+import glob
+from typing import Optional
+import numpy as np
+
+# "torch": fp32 PyTorch (default)
+# "onnx": exported fp32 ONNX graph on onnxruntime
+# "onnx-int8": dynamically int8-quantized ONNX graph on onnxruntime
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+MODELS_DIR = "./data/cache/models"
+
+
+def default_model_dir(model_name: str) -> str:
+    """Where scripts/export_onnx.py writes the artifacts for `model_name`."""
+    return os.path.join(MODELS_DIR, re.sub(r"[^A-Za-z0-9._-]+", "_", model_name))
+
+
+def onnx_file(model_dir: str, backend: str) -> str:
+    """Relative path of the ONNX graph for `backend` inside an exported model directory."""
+    if backend == "onnx":
+        candidates = [os.path.join(model_dir, "onnx", "model.onnx")]
+    elif backend == "onnx-int8":
+        candidates = sorted(glob.glob(os.path.join(model_dir, "onnx", "model_qint8_*.onnx")))
+    else:
+        raise ValueError(f"Not an ONNX backend: {backend}")
+
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return os.path.relpath(candidate, model_dir).replace(os.sep, "/")
+    raise FileNotFoundError(
+        f"No {backend} model in {model_dir}. Create it with: "
+        f"python -m scripts.export_onnx --output {model_dir}"
+    )
+
+
+def load_onnx_model(model_name: str, backend: str, model_dir: Optional[str] = None):
+    """Loads the exported ONNX (fp32 or int8) version of `model_name` as a SentenceTransformer."""
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = model_dir or default_model_dir(model_name)
+    file_name = onnx_file(model_dir, backend)
+    return SentenceTransformer(model_dir, backend="onnx", model_kwargs={"file_name": file_name})
+
+
+def cache_namespace(model_name: str, backend: str) -> str:
+    """Embedding-cache namespace: quantized backends produce (slightly) different vectors."""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def cosine_parity(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """Row-wise cosine similarity between two embedding matrices."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return np.sum(reference * candidate, axis=1)
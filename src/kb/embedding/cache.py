@@ -0,0 +1,268 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Normalisation applied before hashing: NFC, collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache for one model.
+
+    Vectors live in a flat file of (key, float32 vector) records
+    (`vectors.bin`) that is read through a memory map; a small SQLite table
+    maps the hash of the normalised text to a row and a last-used timestamp.
+    When the file grows past `max_bytes` the least recently used entries are
+    evicted and the file is compacted.
+
+    Safe for several writers (the UI, ingest and query scripts share a cache):
+    rows are allocated and appended under the database write lock, and a row
+    is only returned if it still holds the key looked up, so a lookup racing a
+    compaction in another process misses instead of returning another text's
+    vector.
+    """
+
+    VECTORS_FILE = "vectors.bin"
+    INDEX_FILE = "index.sqlite"
+    # Vector file of caches from before records carried their key; discarded
+    LEGACY_VECTORS_FILE = "vectors.f32"
+    KEY_BYTES = 16
+
+    def __init__(self, model_name: str, cache_dir: str = "./data/cache/embeddings", max_bytes: int = 2 << 30):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9._-]+", "_", model_name))
+        os.makedirs(self.path, exist_ok=True)
+        self.vectors_file = os.path.join(self.path, self.VECTORS_FILE)
+
+        self._lock = threading.RLock()
+        # Writers in other processes hold the write lock briefly; wait for them
+        self._db = sqlite3.connect(os.path.join(self.path, self.INDEX_FILE), timeout=60, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+
+        legacy = os.path.join(self.path, self.LEGACY_VECTORS_FILE)
+        if os.path.exists(legacy):
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                if os.path.exists(legacy):
+                    self._db.execute("DELETE FROM entries")
+                    os.remove(legacy)
+
+        self.dim: Optional[int] = None
+        self._mmap: Optional[np.memmap] = None
+        self._mmap_id = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @property
+    def nbytes(self) -> int:
+        return os.path.getsize(self.vectors_file) if os.path.exists(self.vectors_file) else 0
+
+    def _record(self) -> np.dtype:
+        return np.dtype([("key", f"V{self.KEY_BYTES}"), ("vector", "<f4", (self.dim,))])
+
+    def _load_dim(self) -> Optional[int]:
+        # Set by the first writer, possibly in another process
+        if self.dim is None:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            self.dim = int(row[0]) if row else None
+        return self.dim
+
+    def _rows_on_disk(self) -> int:
+        return self.nbytes // self._record().itemsize if self._load_dim() else 0
+
+    def _vectors(self) -> Optional[np.memmap]:
+        """Memory map over the vector file, re-opened when the file has grown or been compacted."""
+        rows = self._rows_on_disk()
+        if rows == 0:
+            return None
+        stat = os.stat(self.vectors_file)
+        if self._mmap is None or self._mmap.shape[0] != rows or self._mmap_id != (stat.st_ino, stat.st_mtime_ns):
+            self._mmap = np.memmap(self.vectors_file, dtype=self._record(), mode="r", shape=(rows,))
+            self._mmap_id = (stat.st_ino, stat.st_mtime_ns)
+        return self._mmap
+
+    def get_many(self, texts: List[str]) -> Tuple[List[Optional[np.ndarray]], List[bytes]]:
+        """
+        Looks up `texts`. Returns (vectors, keys) where vectors[i] is None on a miss.
+        """
+        keys = [text_key(t) for t in texts]
+        found = {}
+        unique = list(set(keys))
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, row in self._db.execute(f"SELECT key, row FROM entries WHERE key IN ({placeholders})", batch):
+                    found[key] = row
+
+            mmap = self._vectors() if found else None
+            if mmap is not None:
+                for i, key in enumerate(keys):
+                    row = found.get(key)
+                    # A row renumbered by a compaction since the lookup holds another key
+                    if row is not None and row < mmap.shape[0] and mmap[row]["key"].tobytes() == key:
+                        vectors[i] = np.array(mmap[row]["vector"])
+
+            hit_keys = [(time.time(), key) for key in found]
+            if hit_keys:
+                with self._db:
+                    self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", hit_keys)
+
+        n_hits = sum(v is not None for v in vectors)
+        self.hits += n_hits
+        self.misses += len(texts) - n_hits
+        return vectors, keys
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        """Appends vectors for `keys` (as returned by get_many) and evicts if over budget."""
+        if len(keys) == 0:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+        # Keep the first occurrence of each new key
+        seen = set()
+        new_rows = []
+        for i, key in enumerate(keys):
+            if key not in seen:
+                seen.add(key)
+                new_rows.append(i)
+
+        with self._lock, self._db:
+            # Rows are allocated under the write lock, so concurrent writers never share one
+            self._db.execute("BEGIN IMMEDIATE")
+            if self._load_dim() is None:
+                self.dim = int(vectors.shape[1])
+                self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dim {vectors.shape[1]} does not match cache dim {self.dim}")
+
+            records = np.zeros(len(new_rows), dtype=self._record())
+            records["key"] = np.frombuffer(b"".join(keys[i] for i in new_rows), dtype=f"V{self.KEY_BYTES}")
+            records["vector"] = vectors[new_rows]
+            start = self._rows_on_disk()
+            # At the last whole record: a partial one left by a crashed writer is overwritten
+            with open(self.vectors_file, "r+b" if os.path.exists(self.vectors_file) else "wb") as f:
+                f.seek(start * records.itemsize)
+                f.write(records.tobytes())
+                f.truncate()
+            now = time.time()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                [(keys[i], start + n, now) for n, i in enumerate(new_rows)],
+            )
+
+        if self.nbytes > self.max_bytes:
+            self.evict(int(self.max_bytes * 0.8))
+
+    def evict(self, target_bytes: int):
+        """Keeps the most recently used entries that fit in `target_bytes` and compacts the file."""
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            if not self._load_dim():
+                return
+            keep_rows = max(0, target_bytes // self._record().itemsize)
+            kept = self._db.execute(
+                "SELECT key, row, last_used FROM entries ORDER BY last_used DESC LIMIT ?", (keep_rows,)
+            ).fetchall()
+            kept.sort(key=lambda kr: kr[1])
+
+            mmap = self._vectors()
+            rows_on_disk = mmap.shape[0] if mmap is not None else 0
+            kept = [(key, row, last_used) for key, row, last_used in kept
+                    if row < rows_on_disk and mmap[row]["key"].tobytes() == key]
+            tmp_path = self.vectors_file + ".tmp"
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(kept), 4096):
+                    rows = [row for _, row, _ in kept[start:start + 4096]]
+                    f.write(np.ascontiguousarray(mmap[rows]).tobytes())
+            self._mmap = None
+            del mmap
+            os.replace(tmp_path, self.vectors_file)
+
+            self._db.execute("DELETE FROM entries")
+            self._db.executemany(
+                "INSERT INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                [(key, n, last_used) for n, (key, _, last_used) in enumerate(kept)],
+            )
+
+    def close(self):
+        with self._lock:
+            self._mmap = None
+            self._db.close()
+
+
+class QueryCache:
+    """
+    Bounded LRU of query embeddings, keyed by model and normalised query text.
+
+    Streamlit reruns and re-submitted questions hit the in-memory LRU; with a
+    `persistent` EmbeddingCache behind it, separate CLI invocations share
+    query embeddings too. Thread-safe (the UI shares one engine across sessions).
+    """
+
+    def __init__(self, model_name: str, max_size: int = 1024, persistent: Optional[EmbeddingCache] = None):
+        self.model_name = model_name
+        self.max_size = max_size
+        self.persistent = persistent
+        self._entries: "OrderedDict[Tuple[str, bytes], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        key = (self.model_name, text_key(query))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self.persistent is not None:
+                vector = self.persistent.get_many([query])[0][0]
+                if vector is not None:
+                    self._remember(key, vector)
+                    self.hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, query: str, vector: np.ndarray):
+        key = (self.model_name, text_key(query))
+        vector = np.array(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            if self.persistent is not None:
+                self.persistent.put_many([key[1]], vector[None, :])
+
+    def _remember(self, key: Tuple[str, bytes], vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,247 @@
+import os
+import re
+import queue
+import traceback
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+# Rough per-worker memory on top of the weights: activations for one batch of
+# `max_batch_tokens` tokens (bytes per token per embedding dimension)
+ACTIVATION_BYTES_PER_TOKEN_DIM = 64
+# Used when the model does not expose its parameters (e.g. ONNX)
+DEFAULT_MODEL_BYTES = 3 << 30
+# How long the parent waits for a worker to load its model
+STARTUP_TIMEOUT = 600.0
+
+
+def parse_size(size: str) -> int:
+    """Parses '512M', '8G', '8GB' or a plain byte count."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*", size.upper())
+    if not match:
+        raise ValueError(f"Invalid size: {size}")
+    number, unit = match.groups()
+    return int(float(number) * (1 << (10 * " KMGT".index(unit or " "))))
+
+
+def available_memory() -> Optional[int]:
+    """Physical memory currently available, in bytes (None if unknown)."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def estimate_model_bytes(model) -> int:
+    """Size of the model weights, from its parameters when it has them."""
+    parameters = getattr(model, "parameters", None)
+    if callable(parameters):
+        try:
+            total = sum(p.numel() * p.element_size() for p in parameters())
+            if total:
+                return total
+        except Exception:
+            pass
+    return DEFAULT_MODEL_BYTES
+
+
+def workers_within_limit(requested: int, model_bytes: int, dim: int, max_batch_tokens: int,
+                         memory_limit: Optional[int]) -> int:
+    """How many of `requested` workers fit in `memory_limit` (0 = none, embed in-process)."""
+    if memory_limit is None:
+        return requested
+    per_worker = model_bytes + max_batch_tokens * dim * ACTIVATION_BYTES_PER_TOKEN_DIM
+    return max(0, min(requested, memory_limit // per_worker))
+
+
+def load_model(model_name: str, backend: str = "torch", model_dir: Optional[str] = None):
+    """Model loader used inside the worker processes."""
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    from src.kb.embedding.backends import load_onnx_model
+    return load_onnx_model(model_name, backend, model_dir)
+
+
+def _limit_threads(threads: int):
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _worker_main(loader: Callable, loader_args: tuple, threads: int, tasks, results):
+    """
+    Worker loop: loads its own copy of the model, then encodes batches and
+    writes the vectors straight into the parent's shared output buffer.
+    """
+    _limit_threads(threads)
+    try:
+        model = loader(*loader_args)
+        dim = model.get_sentence_embedding_dimension()
+    except Exception:
+        results.put(("failed", None, traceback.format_exc()))
+        return
+    results.put(("ready", None, dim))
+
+    attached: Optional[shared_memory.SharedMemory] = None
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, shm_name, capacity, rows, texts = task
+            try:
+                if attached is None or attached.name != shm_name:
+                    if attached is not None:
+                        attached.close()
+                    attached = shared_memory.SharedMemory(name=shm_name)
+                vectors = model.encode(texts, batch_size=len(texts), normalize_embeddings=True, show_progress_bar=False)
+                np.ndarray((capacity, dim), dtype=np.float32, buffer=attached.buf)[rows] = vectors
+                results.put(("done", task_id, len(rows)))
+            except Exception:
+                results.put(("error", task_id, traceback.format_exc()))
+    finally:
+        if attached is not None:
+            attached.close()
+
+
+class EmbeddingPool:
+    """
+    Shards embedding batches across worker processes, each with its own model copy.
+
+    The parent hands out length-bucketed batches through a queue (workers that
+    finish early simply take the next one); workers write their vectors by row
+    into one preallocated float32 buffer in shared memory, so results arrive in
+    the caller's order with no pickling or concatenation of embeddings.
+
+    The buffer is reused between calls: the array returned by `encode` is a view
+    that stays valid until the next call.
+    """
+
+    def __init__(self, model_name: str, workers: int, backend: str = "torch", model_dir: Optional[str] = None,
+                 threads_per_worker: Optional[int] = None, loader: Callable = load_model,
+                 mp_context: Optional[multiprocessing.context.BaseContext] = None):
+        # Spawn by default: forking a process that has already started torch threads can deadlock
+        self._ctx = mp_context or multiprocessing.get_context("spawn")
+        self.workers = workers
+        threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._processes = [
+            self._ctx.Process(target=_worker_main, args=(loader, (model_name, backend, model_dir), threads, self._tasks, self._results), daemon=True)
+            for _ in range(workers)
+        ]
+        # Workers must share the parent's resource tracker, or each one would
+        # claim (and warn about) the output buffers it attaches to
+        resource_tracker.ensure_running()
+        for p in self._processes:
+            p.start()
+
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        # Old buffers still referenced by arrays handed out earlier
+        self._retired: List[shared_memory.SharedMemory] = []
+        self._capacity = 0
+        self._next_task = 0
+        self.dim = None
+        try:
+            for _ in range(workers):
+                status, _, payload = self._get_result(STARTUP_TIMEOUT)
+                if status != "ready":
+                    raise RuntimeError(f"Embedding worker failed to start:\n{payload}")
+                self.dim = payload
+        except Exception:
+            self.close()
+            raise
+
+    def _get_result(self, timeout: float):
+        waited = 0.0
+        while True:
+            try:
+                return self._results.get(timeout=1.0)
+            except queue.Empty:
+                waited += 1.0
+                dead = [p for p in self._processes if not p.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Embedding worker exited unexpectedly (exit code {dead[0].exitcode})")
+                if waited >= timeout:
+                    raise TimeoutError("Timed out waiting for embedding workers")
+
+    def _buffer(self, rows: int) -> np.ndarray:
+        if rows > self._capacity:
+            # Grow geometrically so a run of similar batches allocates once
+            capacity = max(rows, self._capacity * 2)
+            self._release_buffer()
+            self._capacity = capacity
+            self._shm = shared_memory.SharedMemory(create=True, size=self._capacity * self.dim * 4)
+        return np.ndarray((self._capacity, self.dim), dtype=np.float32, buffer=self._shm.buf)
+
+    def _release_buffer(self):
+        if self._shm is not None:
+            self._shm.unlink()
+            self._retired.append(self._shm)
+            self._shm = None
+            self._capacity = 0
+        still_used = []
+        for shm in self._retired:
+            try:
+                shm.close()
+            except BufferError:
+                still_used.append(shm)
+        self._retired = still_used
+
+    def encode(self, texts: List[str], batches: List[List[int]], progress=None, timeout: float = 3600.0) -> np.ndarray:
+        """Encodes `texts` batch by batch (lists of indices); returns a float32 view in input order."""
+        out = self._buffer(len(texts))
+        pending: Dict[int, int] = {}
+        for batch in batches:
+            task_id = self._next_task
+            self._next_task += 1
+            pending[task_id] = len(batch)
+            self._tasks.put((task_id, self._shm.name, self._capacity, batch, [texts[i] for i in batch]))
+
+        try:
+            while pending:
+                status, task_id, payload = self._get_result(timeout)
+                if status == "error":
+                    raise RuntimeError(f"Embedding worker failed:\n{payload}")
+                if status == "done" and task_id in pending:
+                    del pending[task_id]
+                    if progress is not None:
+                        progress.update(payload)
+        except Exception:
+            # Queued batches would keep writing into the buffer: the pool is unusable
+            self.close()
+            raise
+        return out[:len(texts)]
+
+    @property
+    def closed(self) -> bool:
+        return not self._processes
+
+    def close(self):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for p in self._processes:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        self._processes = []
+        self._release_buffer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
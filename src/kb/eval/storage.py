@@ -0,0 +1,64 @@
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+import faiss
+import numpy as np
+from src.kb.index.index_types import fill_index, make_index, storage_index
+from src.kb.index.vector_store import truncate
+
+
+@dataclass
+class StorageResult:
+    precision: str
+    dim: int
+    bytes_per_vector: int
+    index_bytes: int
+    recall: float
+    ms_per_query: float
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    """Mean fraction of each query's exact top-k that the approximate top-k also returns."""
+    k = truth.shape[1]
+    return float(np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)]))
+
+
+def evaluate_storage(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    settings: Iterable[Tuple[str, Optional[int]]],
+    k: int = 10,
+) -> List[StorageResult]:
+    """
+    Recall@k and memory of each (precision, dim) setting against exact search
+    over the full-dimension fp32 vectors.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(vectors))
+
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    results = []
+    for precision, dim in settings:
+        stored = truncate(vectors, dim)
+        index = make_index(stored.shape[1], precision)
+        fill_index(index, stored, np.arange(len(stored)))
+
+        query_vectors = truncate(queries, dim)
+        start = time.perf_counter()
+        _, found = index.search(query_vectors, k)
+        elapsed = time.perf_counter() - start
+
+        code_size = getattr(storage_index(index), "code_size", None) or stored.shape[1] * 4
+        results.append(StorageResult(
+            precision=precision,
+            dim=stored.shape[1],
+            bytes_per_vector=code_size,
+            index_bytes=code_size * index.ntotal,
+            recall=recall_at_k(truth, found),
+            ms_per_query=1000 * elapsed / len(queries),
+        ))
+    return results
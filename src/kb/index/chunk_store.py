@@ -0,0 +1,551 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import weakref
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from src.kb.index.lexical import LexicalIndex
+from src.kb.schema import Document
+
+# Ids fetched per query when iterating the whole store
+FETCH_SIZE = 1000
+# PRAGMA user_version of the current layout; 0 = chunks addressed by FAISS row
+SCHEMA_VERSION = 3
+
+class StaleIndexError(RuntimeError):
+    """A commit expected committed values that another process has changed since."""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vector_id INTEGER NOT NULL UNIQUE,
+    source TEXT,
+    source_key TEXT,
+    file_name TEXT,
+    page_number INTEGER,
+    chunk_id TEXT,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_source_key ON chunks (source_key);
+CREATE INDEX IF NOT EXISTS chunks_file_name ON chunks (file_name);
+CREATE INDEX IF NOT EXISTS chunks_page_number ON chunks (page_number);
+CREATE INDEX IF NOT EXISTS chunks_chunk_id ON chunks (chunk_id);
+CREATE TABLE IF NOT EXISTS duplicate_sources (
+    chunk INTEGER NOT NULL REFERENCES chunks (id) ON DELETE CASCADE,
+    source_key TEXT NOT NULL,
+    source TEXT,
+    file_name TEXT
+);
+CREATE INDEX IF NOT EXISTS duplicate_sources_key ON duplicate_sources (source_key);
+CREATE INDEX IF NOT EXISTS duplicate_sources_chunk ON duplicate_sources (chunk);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Row-addressed stores become id-addressed; ids keep the row order
+MIGRATE_ROWS = """
+BEGIN;
+CREATE TABLE chunks_by_id (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vector_id INTEGER NOT NULL UNIQUE,
+    source TEXT,
+    source_key TEXT,
+    file_name TEXT,
+    page_number INTEGER,
+    chunk_id TEXT,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+INSERT INTO chunks_by_id (id, vector_id, source, source_key, file_name, page_number, chunk_id, content, metadata)
+    SELECT id, legacy_vector_id(source_key, chunk_id, content), source, source_key, legacy_file_name(source),
+           page_number, chunk_id, content, metadata
+    FROM chunks ORDER BY row;
+DROP TABLE chunks;
+ALTER TABLE chunks_by_id RENAME TO chunks;
+COMMIT;
+"""
+
+
+def source_key(source: str) -> str:
+    """Canonical form of a `source` path, used to match chunks to files."""
+    return os.path.normcase(os.path.normpath(source))
+
+
+def _vector_id(key: str, chunk_id, content: str, salt: int = 0) -> int:
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{key}\0{'' if chunk_id is None else chunk_id}\0{content}".encode("utf-8"))
+    if salt:
+        digest.update(f"\0{salt}".encode())
+    # 63 bits: FAISS ids are signed, and -1 means "no result"
+    return int.from_bytes(digest.digest(), "little") & ((1 << 63) - 1)
+
+
+def chunk_vector_id(doc: Document) -> int:
+    """
+    Stable id of a chunk in the FAISS index and the chunk store, from its file,
+    chunk_id and text: re-ingesting an unchanged chunk gives the same id.
+    """
+    metadata = doc.metadata
+    return _vector_id(source_key(metadata.get("source", "unknown")), metadata.get("chunk_id"), doc.content)
+
+
+def unique_vector_ids(documents: Iterable[Document]) -> List[int]:
+    """chunk_vector_id of each document, salted where a list holds the same chunk twice (old, duplicated stores)."""
+    taken: Set[int] = set()
+    ids = []
+    for doc in documents:
+        metadata = doc.metadata
+        ids.append(_unique(taken, source_key(metadata.get("source", "unknown")), metadata.get("chunk_id"), doc.content))
+    return ids
+
+
+def _unique(taken: Set[int], key: str, chunk_id, content: str) -> int:
+    salt = 0
+    vector_id = _vector_id(key, chunk_id, content)
+    while vector_id in taken:
+        salt += 1
+        vector_id = _vector_id(key, chunk_id, content, salt)
+    taken.add(vector_id)
+    return vector_id
+
+
+def _json_default(value):
+    # numpy scalars and anything else exotic a loader might put in metadata
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class ChunkStore:
+    """
+    SQLite-backed chunk metadata and text, addressed by stable vector id (the
+    chunk's id in the FAISS index, see chunk_vector_id).
+
+    Behaves like the `List[Document]` VectorStore used to pickle: len(),
+    indexing and iteration work (in insertion order), but content is only read
+    for the chunks that are asked for, and source / file_name / page_number /
+    chunk_id are indexed columns. Changes (put, delete, update) are staged in
+    memory and written in one transaction by commit(). VectorStore.save()
+    passes the index manifest (its list of segment files) to the same commit,
+    so the chunks and the index they are searched through change together.
+    The commit also adds new chunks to the keyword index (see LexicalIndex).
+
+    Documents handed out are shared while referenced (an identity map), so
+    mutating a returned Document and passing it to update() behaves like
+    mutating an element of the old list.
+    """
+
+    DB_FILE = "chunks.sqlite"
+
+    def __init__(self, index_path: str, mmap_size: int = 0):
+        self.path = os.path.join(index_path, self.DB_FILE)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        if mmap_size:
+            # Reads go through a shared mapping of the file instead of private page-cache copies
+            self._db.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        # True when this open converted a row-addressed store (see VectorStore.load)
+        self.migrated = self._migrate_rows()
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+        self._migrate_duplicates()
+        self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._db.commit()
+
+        self._committed = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        # BM25 index over the chunk text, written by commit() with the chunks
+        self.lexical = LexicalIndex(self._db, self._lock)
+        if self._db.execute("SELECT COUNT(*) FROM lexical_lengths").fetchone()[0] != self._committed:
+            print(f"Indexing {self.lexical.missing()} chunks for keyword search...")
+            self.lexical.backfill()
+        self._loaded: "weakref.WeakValueDictionary[int, Document]" = weakref.WeakValueDictionary()
+        self._reset_pending()
+
+    def _migrate_rows(self) -> bool:
+        columns = {c[1] for c in self._db.execute("PRAGMA table_info(chunks)")}
+        if "row" not in columns:
+            return False
+        taken: Set[int] = set()
+        self._db.create_function("legacy_vector_id", 3, lambda key, chunk_id, content: _unique(taken, key, chunk_id, content))
+        self._db.create_function("legacy_file_name", 1, lambda source: os.path.basename(source or "unknown"))
+        # Foreign keys off, so dropping the old table keeps duplicate_sources
+        self._db.execute("PRAGMA foreign_keys=OFF")
+        self._db.executescript(MIGRATE_ROWS)
+        return True
+
+    def _migrate_duplicates(self):
+        """Adds the source / file name of duplicates to stores from before they were kept (see ids_for_files)."""
+        columns = {c[1] for c in self._db.execute("PRAGMA table_info(duplicate_sources)")}
+        if "file_name" not in columns:
+            self._db.execute("ALTER TABLE duplicate_sources ADD COLUMN source TEXT")
+            self._db.execute("ALTER TABLE duplicate_sources ADD COLUMN file_name TEXT")
+            chunks = self._db.execute("SELECT id, metadata FROM chunks WHERE id IN "
+                                      "(SELECT DISTINCT chunk FROM duplicate_sources)").fetchall()
+            self._db.execute("DELETE FROM duplicate_sources")
+            for chunk, metadata in chunks:
+                self._insert_duplicates(chunk, Document(content="", metadata=json.loads(metadata)))
+        self._db.execute("CREATE INDEX IF NOT EXISTS duplicate_sources_file_name ON duplicate_sources (file_name)")
+
+    def _reset_pending(self):
+        self._cleared = False
+        self._deleted: Set[int] = set()          # committed ids
+        self._updated: Dict[int, Document] = {}  # committed id -> document
+        self._added: Dict[int, Document] = {}    # new id -> document, in insertion order
+        self._order: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return self._n_committed_live() + len(self._added)
+
+    def _n_committed_live(self) -> int:
+        return (0 if self._cleared else self._committed) - len(self._deleted)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._cleared or self._deleted or self._updated or self._added)
+
+    # --- reads ---
+
+    def _select_ids(self, sql: str, values: Sequence, repeat: int = 1) -> Set[int]:
+        """
+        Committed ids returned by `sql`, whose IN lists ("{}") are each bound to
+        a batch of `values` (`repeat` lists per statement).
+        """
+        found: Set[int] = set()
+        if self._cleared or not self._committed:
+            return found
+        values = list(values)
+        with self._lock:
+            for start in range(0, len(values), 500):
+                batch = values[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(r for (r,) in self._db.execute(sql.replace("{}", placeholders), batch * repeat))
+        return found
+
+    def _committed_among(self, ids: Iterable[int]) -> Set[int]:
+        """Which of `ids` are live committed chunks."""
+        return self._select_ids("SELECT vector_id FROM chunks WHERE vector_id IN ({})", ids) - self._deleted
+
+    def contains(self, ids: Iterable[int]) -> Set[int]:
+        """Which of `ids` are stored (committed or staged)."""
+        ids = [int(i) for i in ids]
+        return self._committed_among(ids) | {i for i in ids if i in self._added}
+
+    def _fetch(self, ids: List[int]) -> Dict[int, Document]:
+        found: Dict[int, Document] = {}
+        missing = []
+        for vector_id in ids:
+            doc = self._added.get(vector_id) or self._updated.get(vector_id) or self._loaded.get(vector_id)
+            if doc is not None:
+                found[vector_id] = doc
+            elif vector_id not in self._deleted and not self._cleared:
+                missing.append(vector_id)
+        with self._lock:
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for vector_id, content, metadata in self._db.execute(
+                    f"SELECT vector_id, content, metadata FROM chunks WHERE vector_id IN ({placeholders})", batch
+                ):
+                    doc = Document(content=content, metadata=json.loads(metadata))
+                    self._loaded[vector_id] = doc
+                    found[vector_id] = doc
+        return found
+
+    def fetch(self, ids: Sequence[int]) -> Dict[int, Document]:
+        """Documents for `ids` by id; unknown ids are left out."""
+        return self._fetch([int(i) for i in ids])
+
+    def get_many(self, ids: Sequence[int]) -> List[Document]:
+        """Documents for `ids` (e.g. a search result), in that order; unknown ids are skipped."""
+        fetched = self.fetch(ids)
+        return [fetched[int(i)] for i in ids if int(i) in fetched]
+
+    def ids(self) -> List[int]:
+        """Ids of all stored chunks, in insertion order."""
+        if self._order is None:
+            order = []
+            if not self._cleared and self._committed:
+                with self._lock:
+                    order = [i for (i,) in self._db.execute("SELECT vector_id FROM chunks ORDER BY id") if i not in self._deleted]
+            order.extend(self._added)
+            self._order = order
+        return self._order
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self.get_many(self.ids()[item])
+        return self.get_many([self.ids()[item]])[0]
+
+    def __iter__(self) -> Iterator[Document]:
+        ids = list(self.ids())
+        for start in range(0, len(ids), FETCH_SIZE):
+            yield from self.get_many(ids[start:start + FETCH_SIZE])
+
+    def _ids_where(self, queries: List[str], values: List[str], matches) -> List[int]:
+        """
+        Ids found by `queries` (SELECTs of committed vector ids with an IN list
+        over `values`) plus staged documents for which `matches(doc)` holds.
+        """
+        committed = self._select_ids(" UNION ".join(queries), values, repeat=len(queries)) - self._deleted
+        # Staged updates may have changed a chunk's metadata since the last commit
+        committed -= set(self._updated)
+        committed.update(i for i, doc in self._updated.items() if matches(doc))
+        return sorted(committed) + [i for i, doc in self._added.items() if matches(doc)]
+
+    def lexical_search(self, query: str, k: int, ids: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (BM25 scores, ids) of the k chunks best matching the words of `query`
+        (among `ids` only, if given). Only committed chunks are indexed.
+        """
+        rows, scores = self.lexical.score(query)
+        if self._cleared or k <= 0 or not len(rows):
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype="int64")
+        with self._lock:
+            if ids is not None:
+                allowed = self._select_ids("SELECT id FROM chunks WHERE vector_id IN ({})", [int(i) for i in ids])
+                keep = np.isin(rows, np.fromiter(allowed, dtype=np.int64, count=len(allowed)))
+                rows, scores = rows[keep], scores[keep]
+            # Postings of deleted chunks are skipped here, reading the candidates' ids window by window
+            found_scores, found_ids = [], []
+            window = max(2 * k, 64)
+            for start in range(0, len(rows), window):
+                batch = rows[start:start + window].tolist()
+                vector_ids = dict(self._db.execute(
+                    f"SELECT id, vector_id FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch))
+                for row, score in zip(batch, scores[start:start + window].tolist()):
+                    vector_id = vector_ids.get(row)
+                    if vector_id is not None and vector_id not in self._deleted:
+                        found_scores.append(score)
+                        found_ids.append(vector_id)
+                if len(found_ids) >= k:
+                    break
+        return np.array(found_scores[:k], dtype=np.float32), np.array(found_ids[:k], dtype="int64")
+
+    def ids_for_sources(self, keys: Set[str]) -> List[int]:
+        """Ids of chunks whose source, or one of whose duplicates, is in `keys` (see source_key)."""
+        if not keys:
+            return []
+        return self._ids_where(
+            ["SELECT vector_id FROM chunks WHERE source_key IN ({})",
+             "SELECT c.vector_id FROM duplicate_sources d JOIN chunks c ON c.id = d.chunk WHERE d.source_key IN ({})"],
+            list(keys), lambda doc: _mentions(doc, keys))
+
+    def ids_for_files(self, names: Iterable[str]) -> List[int]:
+        """
+        Ids of the chunks of the files called `names` (base names, as listed by
+        file_counts), including chunks that stand for a duplicate in one of them.
+        """
+        names = set(names)
+        if not names:
+            return []
+        return self._ids_where(
+            ["SELECT vector_id FROM chunks WHERE file_name IN ({})",
+             "SELECT c.vector_id FROM duplicate_sources d JOIN chunks c ON c.id = d.chunk WHERE d.file_name IN ({})"],
+            list(names), lambda doc: any(os.path.basename(source) in names for source in _locations(doc)))
+
+    def file_counts(self) -> List[Tuple[str, int]]:
+        """
+        (source, chunk count) per file, from committed and staged chunks. A chunk
+        counts for every file it has a duplicate in (see NearDuplicateDetector).
+        """
+        counts: Dict[str, int] = {}
+        if not self._cleared and self._committed:
+            with self._lock:
+                for source, n in self._db.execute(
+                    "SELECT source, COUNT(*) FROM chunks GROUP BY source "
+                    "UNION ALL SELECT source, COUNT(*) FROM duplicate_sources GROUP BY source"
+                ):
+                    counts[source] = counts.get(source, 0) + n
+                # Staged deletes and updates change what the committed counts say
+                changed = sorted(self._deleted | set(self._updated))
+                for start in range(0, len(changed), 500):
+                    batch = changed[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    for (source,) in self._db.execute(
+                        f"SELECT source FROM chunks WHERE vector_id IN ({placeholders}) UNION ALL "
+                        f"SELECT d.source FROM duplicate_sources d JOIN chunks c ON c.id = d.chunk "
+                        f"WHERE c.vector_id IN ({placeholders})", batch * 2
+                    ):
+                        counts[source] -= 1
+        for doc in list(self._updated.values()) + list(self._added.values()):
+            for source in _locations(doc):
+                counts[source] = counts.get(source, 0) + 1
+        return [(source, n) for source, n in counts.items() if n > 0]
+
+    def get_meta(self, key: str, default=None):
+        """Value last committed under `key` (see commit)."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    # --- staged writes ---
+
+    def put(self, ids: Sequence[int], documents: Sequence[Document]):
+        """Stages `documents` under `ids`, replacing any chunk already stored under the same id."""
+        ids = [int(i) for i in ids]
+        committed = self._select_ids("SELECT vector_id FROM chunks WHERE vector_id IN ({})", ids)
+        for vector_id, doc in zip(ids, documents):
+            if vector_id in committed:
+                self._deleted.discard(vector_id)
+                self._updated[vector_id] = doc
+            else:
+                self._added[vector_id] = doc
+        self._order = None
+
+    def extend(self, documents: Iterable[Document]):
+        """Appends documents under their chunk_vector_id (salted if the same chunk comes twice)."""
+        documents = list(documents)
+        self.put(unique_vector_ids(documents), documents)
+
+    def update(self, vector_id: int, document: Document):
+        """Stages `document` as the new content/metadata of chunk `vector_id`."""
+        if vector_id in self._added:
+            self._added[vector_id] = document
+        else:
+            self._updated[vector_id] = document
+
+    def update_documents(self, documents: Iterable[Document]):
+        """Stages changed metadata of already-stored documents, found by (source, chunk_id)."""
+        staged = {id(doc) for doc in self._added.values()}
+        for doc in documents:
+            if id(doc) in staged:
+                continue  # written with its current metadata on commit
+            if self._cleared:
+                continue
+            with self._lock:
+                found = self._db.execute(
+                    "SELECT vector_id FROM chunks WHERE source_key = ? AND chunk_id = ?",
+                    (source_key(doc.metadata.get("source", "")), doc.metadata.get("chunk_id")),
+                ).fetchone()
+            if found and found[0] not in self._deleted:
+                self._updated[found[0]] = doc
+
+    def delete(self, ids: Iterable[int]):
+        """Removes the chunks `ids` (the same ids removed from the FAISS index)."""
+        ids = [int(i) for i in ids]
+        for vector_id in ids:
+            self._added.pop(vector_id, None)
+        for vector_id in self._committed_among(ids):
+            self._deleted.add(vector_id)
+            self._updated.pop(vector_id, None)
+        self._order = None
+
+    def clear(self):
+        self._reset_pending()
+        self._cleared = True
+
+    # --- persistence ---
+
+    def refresh(self):
+        """Drops staged changes and cached chunks, and re-reads what is committed (e.g. by another process)."""
+        with self._lock:
+            self._reset_pending()
+            self._loaded = weakref.WeakValueDictionary()
+            self._committed = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def commit(self, meta: Optional[Dict[str, object]] = None, expected: Optional[Dict[str, object]] = None):
+        """
+        Writes all staged changes, and the JSON values in `meta`, in one
+        transaction. With `expected`, nothing is written (StaleIndexError) unless
+        the committed meta values are still those (None: no value).
+        """
+        if not self.dirty and not meta:
+            return
+        with self._lock, self._db:
+            # The write lock is taken before the check, so no other commit can come between
+            self._db.execute("BEGIN IMMEDIATE")
+            for key, value in (expected or {}).items():
+                row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+                if (json.loads(row[0]) if row else None) != value:
+                    raise StaleIndexError(f"'{key}' in {self.path} was changed by another process")
+            for key, value in (meta or {}).items():
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+            if self._cleared:
+                self._db.execute("DELETE FROM chunks")
+                self._db.execute("DELETE FROM duplicate_sources")
+                self.lexical.clear()
+                self._loaded = weakref.WeakValueDictionary()
+
+            if self._deleted:
+                deleted = sorted(self._deleted)
+                for start in range(0, len(deleted), 500):
+                    batch = deleted[start:start + 500]
+                    self._db.execute(f"DELETE FROM chunks WHERE vector_id IN ({','.join('?' * len(batch))})", batch)
+                # Their lengths go by cascade; data_version does not see this connection's commits
+                self.lexical.invalidate_stats()
+
+            for vector_id, doc in self._updated.items():
+                self._db.execute(
+                    "UPDATE chunks SET source = ?, source_key = ?, file_name = ?, page_number = ?, chunk_id = ?, "
+                    "content = ?, metadata = ? WHERE vector_id = ?", _columns(doc) + (vector_id,))
+                chunk = self._db.execute("SELECT id FROM chunks WHERE vector_id = ?", (vector_id,)).fetchone()[0]
+                self._db.execute("DELETE FROM duplicate_sources WHERE chunk = ?", (chunk,))
+                self._insert_duplicates(chunk, doc)
+
+            added = []
+            for vector_id, doc in self._added.items():
+                cursor = self._db.execute(
+                    "INSERT INTO chunks (source, source_key, file_name, page_number, chunk_id, content, metadata, vector_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", _columns(doc) + (vector_id,))
+                self._insert_duplicates(cursor.lastrowid, doc)
+                self._loaded[vector_id] = doc
+                added.append((cursor.lastrowid, doc.content))
+            # Updated chunks keep their text (it is part of their id), so only new ones are indexed
+            self.lexical.add(added)
+
+        self._committed = self._n_committed_live() + len(self._added)
+        self._reset_pending()
+
+    def _insert_duplicates(self, chunk: int, doc: Document):
+        sources = _locations(doc)[1:]
+        if sources:
+            self._db.executemany("INSERT INTO duplicate_sources (chunk, source_key, source, file_name) VALUES (?, ?, ?, ?)",
+                                 [(chunk, source_key(s), s, os.path.basename(s)) for s in sources])
+
+    def rollback(self):
+        """Drops staged changes."""
+        self._reset_pending()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _mentions(doc: Document, keys: Set[str]) -> bool:
+    if source_key(doc.metadata.get("source", "")) in keys:
+        return True
+    return any(source_key(d.get("source", "")) in keys for d in doc.metadata.get("duplicates", ()))
+
+
+def _locations(doc: Document) -> List[str]:
+    """The source of `doc`, then those of its duplicates in other files (one per file)."""
+    sources = {source_key(doc.metadata.get("source", "unknown")): doc.metadata.get("source", "unknown")}
+    for duplicate in doc.metadata.get("duplicates", ()):
+        sources.setdefault(source_key(duplicate.get("source", "")), duplicate.get("source", ""))
+    return list(sources.values())
+
+
+def _file_name(doc: Document) -> str:
+    return os.path.basename(doc.metadata.get("source", "unknown"))
+
+
+def _columns(doc: Document) -> tuple:
+    """source, source_key, file_name, page_number, chunk_id, content, metadata JSON."""
+    metadata = doc.metadata
+    source = metadata.get("source", "unknown")
+    page = metadata.get("page_number")
+    return (
+        source,
+        source_key(source),
+        _file_name(doc),
+        page if isinstance(page, int) else None,
+        metadata.get("chunk_id"),
+        doc.content,
+        json.dumps(metadata, ensure_ascii=False, default=_json_default),
+    )
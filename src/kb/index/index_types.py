@@ -0,0 +1,274 @@
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import faiss
+import numpy as np
+
+# Storage precision of the vectors in the index:
+# fp32 = exact (4 bytes/dim), fp16 = 2 bytes/dim, int8 = scalar-quantized, 1 byte/dim
+PRECISIONS = ("fp32", "fp16", "int8")
+
+# flat: exact brute-force scan
+# hnsw: graph index, no training; tune with ef_search
+# ivf: inverted lists over k-means cells, trained on a sample; tune with nprobe
+# ivfpq: ivf with product-quantized codes (precision is ignored)
+# auto: picked from the number of vectors (see choose_index_type)
+INDEX_TYPES = ("auto", "flat", "hnsw", "ivf", "ivfpq")
+
+# auto policy: exact search is fast enough below HNSW_MIN vectors, HNSW up to
+# IVF_MIN, IVF (cheaper to build and smaller than a graph) beyond
+AUTO_HNSW_MIN = 50_000
+AUTO_IVF_MIN = 1_000_000
+
+# IVF (and each PQ sub-quantizer) needs this many training vectors per centroid to train well
+IVF_TRAIN_PER_LIST = 39
+IVF_MAX_TRAIN_PER_LIST = 256
+
+# Filtered searches over at most this many chunks scan them exactly instead of
+# searching the index with an ID selector (see filtered_search_batch)
+FILTER_EXACT_MAX = 20_000
+
+DEFAULT_PARAMS: Dict[str, int] = {
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 128,
+    "nprobe": 16,
+    "pq_bits": 8,
+}
+
+
+def choose_index_type(n_vectors: int) -> str:
+    if n_vectors < AUTO_HNSW_MIN:
+        return "flat"
+    if n_vectors < AUTO_IVF_MIN:
+        return "hnsw"
+    return "ivf"
+
+
+def default_nlist(n_vectors: int) -> int:
+    """~4 * sqrt(n) cells, rounded to a power of two."""
+    return int(2 ** max(4, round(np.log2(4 * np.sqrt(max(n_vectors, 1))))))
+
+
+def default_pq_m(dimension: int) -> int:
+    """Sub-quantizers for IVF-PQ: ~16 dims each, and a divisor of `dimension`."""
+    m = max(1, dimension // 16)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def min_train_size(index_type: str, params: Dict) -> int:
+    """Vectors needed before an index of this type can be trained (0 = no training needed)."""
+    if index_type == "ivf":
+        return IVF_TRAIN_PER_LIST * params["nlist"]
+    if index_type == "ivfpq":
+        pq_bits = params.get("pq_bits", DEFAULT_PARAMS["pq_bits"])
+        return IVF_TRAIN_PER_LIST * max(params["nlist"], 2 ** pq_bits)
+    return 0
+
+
+def _codes(precision: str) -> str:
+    return {"fp32": "Flat", "fp16": "SQfp16", "int8": "SQ8"}[precision]
+
+
+def make_index(dimension: int, precision: str = "fp32", index_type: str = "flat", params: Optional[Dict] = None) -> faiss.Index:
+    """
+    Empty inner-product (cosine, on normalized vectors) index of `index_type`
+    storing `precision` codes, addressed by caller-chosen 64-bit ids
+    (add_with_ids): flat and HNSW are wrapped in IndexIDMap, IVF keeps ids
+    natively. Neither keeps an id -> position hash, so loading stays O(1).
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    params = {**DEFAULT_PARAMS, **(params or {})}
+
+    if index_type == "flat":
+        if precision == "fp32":
+            base = faiss.IndexFlatIP(dimension)
+        elif precision == "fp16":
+            base = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        else:
+            # Per-dimension min/max of the training vectors: fill the index in one call
+            # (see SegmentedIndex.add), vectors added later are clipped to that range
+            base = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            base.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+        return faiss.IndexIDMap(base)
+
+    if index_type == "hnsw":
+        index = faiss.index_factory(dimension, f"IDMap,HNSW{params['hnsw_m']},{_codes(precision)}", faiss.METRIC_INNER_PRODUCT)
+        faiss.downcast_index(index.index).hnsw.efConstruction = params["ef_construction"]
+    elif index_type in ("ivf", "ivfpq"):
+        if index_type == "ivf":
+            codes = _codes(precision)
+        else:
+            codes = f"PQ{params.get('pq_m') or default_pq_m(dimension)}x{params['pq_bits']}"
+        index = faiss.index_factory(dimension, f"IVF{params['nlist']},{codes}", faiss.METRIC_INNER_PRODUCT)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+    apply_search_params(index, params)
+    return index
+
+
+def _id_mapped(index: faiss.Index) -> bool:
+    # IndexIDMap2 is what indexes were wrapped in before loads were mmapped
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2))
+
+
+def storage_index(index: faiss.Index) -> faiss.Index:
+    """The index holding the codes (inside an IndexIDMap, if wrapped)."""
+    index = faiss.downcast_index(index)
+    if _id_mapped(index):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    """
+    Reads an index; with `mmap`, the vector codes (IVF lists for IVF indexes)
+    stay in the file and are paged in on demand, shared with every other
+    process mapping it (flat codes only on FAISS versions that support it).
+    A mapped index must not be modified: read it again without `mmap` first.
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    if not hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        # Older FAISS cannot map flat codes; IVF lists still can be
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(path)
+        return faiss.read_index(path, flags) if faiss.try_extract_index_ivf(index) is not None else index
+    index = faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC)
+    if faiss.try_extract_index_ivf(index) is not None:
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    return index
+
+
+def apply_search_params(index: faiss.Index, params: Dict):
+    """Sets efSearch / nprobe on the index types that have them."""
+    space = faiss.ParameterSpace()
+    if hasattr(storage_index(index), "hnsw"):
+        space.set_index_parameter(index, "efSearch", int(params.get("ef_search", DEFAULT_PARAMS["ef_search"])))
+    if faiss.try_extract_index_ivf(index) is not None:
+        space.set_index_parameter(index, "nprobe", int(params.get("nprobe", DEFAULT_PARAMS["nprobe"])))
+
+
+def stored_ids(index: faiss.Index) -> np.ndarray:
+    """Ids of all vectors in the index (in storage order)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        lists = [faiss.rev_swig_ptr(ivf.invlists.get_ids(i), ivf.invlists.list_size(i)).copy()
+                 for i in range(ivf.nlist) if ivf.invlists.list_size(i)]
+        return np.concatenate(lists) if lists else np.empty(0, dtype="int64")
+    index = faiss.downcast_index(index)
+    if _id_mapped(index):
+        return faiss.vector_to_array(index.id_map)
+    # Unmapped (pre-id) index: ids are positions
+    return np.arange(index.ntotal, dtype="int64")
+
+
+def export_vectors(index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+    """(ids, vectors) of everything stored, decoded (approximate for quantized codes)."""
+    ids = stored_ids(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # Lookup by id needs a direct map; the index is about to be rebuilt anyway
+        if ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return ids, index.reconstruct_batch(ids)
+    return ids, storage_index(index).reconstruct_n(0, index.ntotal)
+
+
+def fill_index(index: faiss.Index, vectors: np.ndarray, ids: np.ndarray, seed: int = 0):
+    """Trains `index` (on a sample, for IVF) if it needs it, then adds `vectors` under `ids`."""
+    if len(vectors) == 0:
+        return
+    if not index.is_trained:
+        ivf = faiss.try_extract_index_ivf(index)
+        sample = vectors
+        # Enough for the coarse cells and for 8-bit PQ codebooks
+        max_train = IVF_MAX_TRAIN_PER_LIST * max(ivf.nlist, 256) if ivf is not None else 0
+        if ivf is not None and len(vectors) > max_train:
+            rows = np.random.RandomState(seed).choice(len(vectors), max_train, replace=False)
+            sample = vectors[np.sort(rows)]
+        index.train(sample)
+    index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype="int64"))
+
+
+def _search_parameters(index: faiss.Index, selector: faiss.IDSelector, params: Dict) -> faiss.SearchParameters:
+    # Per-call parameters replace the index's own efSearch / nprobe, so pass them again
+    if hasattr(storage_index(index), "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=int(params.get("ef_search", DEFAULT_PARAMS["ef_search"])))
+    if faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=int(params.get("nprobe", DEFAULT_PARAMS["nprobe"])))
+    return faiss.SearchParameters(sel=selector)
+
+
+def _rows(scores: np.ndarray, found: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Per-query (scores, ids) of a FAISS result, without the -1 padding."""
+    return [(s[f != -1], f[f != -1]) for s, f in zip(scores, found)]
+
+
+def _queries(queries: np.ndarray) -> np.ndarray:
+    queries = np.asarray(queries, dtype=np.float32)
+    return np.ascontiguousarray(queries.reshape(-1, queries.shape[-1]))
+
+
+def exact_search_batch(index: faiss.Index, queries: np.ndarray, ids: np.ndarray,
+                       k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Top-k (scores, ids) of each query over `ids` only, computed against every
+    selected code: the HNSW graph and unprobed IVF cells are bypassed, so no
+    selected vector is missed.
+    """
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype="int64"))
+    queries = _queries(queries)
+    base = storage_index(index)
+    if hasattr(base, "hnsw"):
+        # The graph's flat storage, whose rows are the id map's positions
+        storage = faiss.downcast_index(base.storage)
+        translated = faiss.IDSelectorTranslated(index.id_map, selector)
+        scores, rows = storage.search(queries, k, params=faiss.SearchParameters(sel=translated))
+        id_map = faiss.rev_swig_ptr(index.id_map.data(), index.id_map.size())
+        found = np.where(rows >= 0, id_map[np.maximum(rows, 0)], -1)
+    elif faiss.try_extract_index_ivf(index) is not None:
+        nlist = faiss.try_extract_index_ivf(index).nlist
+        scores, found = index.search(queries, k, params=faiss.SearchParametersIVF(sel=selector, nprobe=nlist))
+    else:
+        scores, found = index.search(queries, k, params=faiss.SearchParameters(sel=selector))
+    return _rows(scores, found)
+
+
+def search_batch(index: faiss.Index, queries: np.ndarray, k: int, params: Optional[Dict] = None,
+                 exclude: Optional[Set[int]] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Top-k (scores, ids) of each row of `queries`, in one FAISS call, skipping the `exclude` ids (tombstones)."""
+    queries = _queries(queries)
+    if not exclude:
+        scores, found = index.search(queries, k)
+    else:
+        selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(np.fromiter(exclude, dtype="int64", count=len(exclude))))
+        scores, found = index.search(queries, k, params=_search_parameters(index, selector, params or {}))
+    return _rows(scores, found)
+
+
+def filtered_search_batch(index: faiss.Index, queries: np.ndarray, ids: Sequence[int], k: int,
+                          params: Optional[Dict] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Top-k (scores, ids) of each query among `ids` only.
+
+    Small id sets are scanned exactly, which gets cheaper as the filter narrows
+    and is where graph / cell search would miss most of its neighbours. Larger
+    ones use the index with an ID selector, falling back to an exact scan for
+    the queries for which that finds fewer than k of them.
+    """
+    ids = np.unique(np.asarray(ids, dtype="int64"))
+    queries = _queries(queries)
+    if len(ids) == 0 or k <= 0:
+        return [(np.empty(0, dtype=np.float32), ids[:0]) for _ in range(len(queries))]
+    results: List[Optional[Tuple[np.ndarray, np.ndarray]]] = [None] * len(queries)
+    if len(ids) > FILTER_EXACT_MAX:
+        selector = faiss.IDSelectorBatch(ids)
+        scores, found = index.search(queries, k, params=_search_parameters(index, selector, params or {}))
+        results = [row if len(row[1]) >= k else None for row in _rows(scores, found)]
+    rest = [i for i, row in enumerate(results) if row is None]
+    if rest:
+        for i, row in zip(rest, exact_search_batch(index, queries[rest], ids, k)):
+            results[i] = row
+    return results
@@ -0,0 +1,285 @@
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# A term's posting blocks are merged into one (without deleted chunks) beyond this many
+MAX_BLOCKS = 8
+# Chunks tokenized per write when indexing a store that predates the lexical index
+BACKFILL_BATCH = 20000
+# Longer "words" (base64, hashes, minified code) are not indexed
+MAX_TERM_CHARS = 64
+
+LEXICAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lexical_postings (
+    term TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    rows BLOB NOT NULL,
+    tfs BLOB NOT NULL,
+    lengths BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lexical_postings_term ON lexical_postings (term);
+CREATE TABLE IF NOT EXISTS lexical_lengths (
+    chunk INTEGER PRIMARY KEY REFERENCES chunks (id) ON DELETE CASCADE,
+    length INTEGER NOT NULL
+);
+"""
+
+# Kana, CJK ideographs and Hangul: no spaces between words, so they are indexed as bigrams
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+# Other words stay whole, with their separators (part numbers, API names, error codes: "ab-1234",
+# "os.path.join"), and are also indexed as their parts
+_TOKEN = re.compile(rf"([{_CJK}]+)|([^\W{_CJK}]+(?:[.\-:/#+]+[^\W{_CJK}]+)*)")
+_SEPARATORS = re.compile(r"[.\-:/#+]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Index terms of `text`: lowercased words (compound identifiers also as their
+    parts) and overlapping bigrams of CJK runs, so Chinese text matches without
+    a word segmenter.
+    """
+    terms = []
+    for cjk, word in _TOKEN.findall(unicodedata.normalize("NFKC", text).lower()):
+        if cjk:
+            terms.extend([cjk] if len(cjk) == 1 else [cjk[i:i + 2] for i in range(len(cjk) - 1)])
+        elif len(word) <= MAX_TERM_CHARS:
+            terms.append(word)
+            if not word.isalnum():
+                parts = _SEPARATORS.split(word)
+                if len(parts) > 1:
+                    terms.extend(parts)
+    return terms
+
+
+def _varints(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """LEB128 varint bytes of non-negative integers (7 bits per byte), and the byte count of each."""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+    group = np.repeat(np.arange(len(values)), sizes)
+    shift = np.arange(len(group)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    out = ((values[group] >> (np.uint64(7) * shift.astype(np.uint64))) & np.uint64(0x7F)).astype(np.uint8)
+    # Continuation bit on every byte but the last of each value
+    out[:-1][shift[1:] != 0] |= 0x80
+    return out, sizes
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    return _varints(values)[0].tobytes()
+
+
+def decode_varints(data: bytes) -> np.ndarray:
+    """Inverse of encode_varints (values up to 2**53)."""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if len(raw) == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = np.flatnonzero(raw < 0x80)
+    sizes = np.diff(np.concatenate([[-1], ends]))
+    group = np.repeat(np.arange(len(ends)), sizes)
+    shift = np.arange(len(raw)) - np.repeat(ends - sizes + 1, sizes)
+    weights = (raw & 0x7F).astype(np.float64) * np.exp2(7 * shift)
+    return np.bincount(group, weights=weights, minlength=len(ends)).astype(np.int64)
+
+
+def encode_blocks(groups: np.ndarray, rows: np.ndarray, tfs: np.ndarray,
+                  lengths: np.ndarray) -> List[Tuple[int, int, bytes, bytes, bytes]]:
+    """
+    Posting blocks of postings sorted by (group, row): (group, count, row ids
+    delta-encoded from the block's first, term frequencies, chunk lengths),
+    each stream as varints. All blocks are encoded in one vectorised pass.
+    """
+    if len(groups) == 0:
+        return []
+    starts = np.flatnonzero(np.diff(groups, prepend=groups[0] - 1))
+    ends = np.append(starts[1:], len(groups))
+    deltas = np.diff(rows, prepend=0)
+    deltas[starts] = rows[starts]
+    streams = []
+    for values in (deltas, tfs, lengths):
+        data, sizes = _varints(values)
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        streams.append((data.tobytes(), offsets[starts].tolist(), offsets[ends].tolist()))
+    return [(int(groups[start]), int(end - start))
+            + tuple(data[first[b]:last[b]] for data, first, last in streams)
+            for b, (start, end) in enumerate(zip(starts.tolist(), ends.tolist()))]
+
+
+def decode_blocks(counts: Sequence[int], rows: Sequence[bytes], tfs: Sequence[bytes],
+                  lengths: Sequence[bytes]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(block of each posting, row ids, term frequencies, chunk lengths) of posting blocks, decoded together."""
+    counts = np.asarray(counts, dtype=np.int64)
+    block = np.repeat(np.arange(len(counts)), counts)
+    deltas = decode_varints(b"".join(rows))
+    # Each block's first row id is absolute: restart the running sum there
+    totals = np.cumsum(deltas)
+    restart = np.concatenate([[0], totals[np.cumsum(counts)[:-1] - 1]]) if len(counts) else np.empty(0, dtype=np.int64)
+    return block, totals - restart[block], decode_varints(b"".join(tfs)), decode_varints(b"".join(lengths))
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the chunk store's text, kept in the same SQLite
+    database (ChunkStore writes it in the transaction that stores the chunks).
+
+    Postings are keyed by the chunk's row id. Each commit appends one posting
+    block per term it touches; a term's blocks are merged once there are more
+    than MAX_BLOCKS. A deleted chunk's row disappears from `chunks` (and, by
+    cascade, from lexical_lengths) and its postings are skipped until a merge
+    drops them; re-adding the same chunk gives it a new row.
+    """
+
+    def __init__(self, db: sqlite3.Connection, lock: threading.RLock):
+        self._db = db
+        self._lock = lock
+        self._db.executescript(LEXICAL_SCHEMA)
+        # (chunk count, average length), recomputed when another connection commits
+        # (data_version) or this one changes the index (see invalidate_stats)
+        self._stats: Optional[Tuple[int, float]] = None
+        self._stats_version = None
+
+    def missing(self) -> int:
+        """Chunks stored but not indexed yet (a store from before the lexical index)."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM chunks WHERE id NOT IN (SELECT chunk FROM lexical_lengths)").fetchone()[0]
+
+    def backfill(self):
+        """Indexes every chunk missing from the index, in batches."""
+        with self._lock:
+            while True:
+                batch = self._db.execute(
+                    "SELECT id, content FROM chunks WHERE id NOT IN (SELECT chunk FROM lexical_lengths) "
+                    "ORDER BY id LIMIT ?", (BACKFILL_BATCH,)).fetchall()
+                if not batch:
+                    break
+                with self._db:
+                    self.add(batch)
+
+    def add(self, chunks: Sequence[Tuple[int, str]]):
+        """Indexes (row id, text) pairs, one new block per term; runs inside the caller's transaction."""
+        if not chunks:
+            return
+        all_terms, rows, tfs, lengths, chunk_lengths = [], [], [], [], []
+        for row, content in chunks:
+            counts = Counter(tokenize(content))
+            length = sum(counts.values())
+            chunk_lengths.append((row, length))
+            all_terms.extend(counts)
+            tfs.extend(counts.values())
+            rows.extend([row] * len(counts))
+            lengths.extend([length] * len(counts))
+        vocabulary: Dict[str, int] = {}
+        term_ids = [vocabulary.setdefault(term, len(vocabulary)) for term in all_terms]
+        self._db.executemany("INSERT OR REPLACE INTO lexical_lengths (chunk, length) VALUES (?, ?)", chunk_lengths)
+        term_ids, rows, tfs, lengths = (np.array(a, dtype=np.int64) for a in (term_ids, rows, tfs, lengths))
+        order = np.lexsort((rows, term_ids))
+        terms = list(vocabulary)
+        self._db.executemany(
+            "INSERT INTO lexical_postings (term, count, rows, tfs, lengths) VALUES (?, ?, ?, ?, ?)",
+            ((terms[b[0]],) + b[1:] for b in encode_blocks(term_ids[order], rows[order], tfs[order], lengths[order])))
+        self._merge_blocks(terms)
+        self._stats = None
+
+    def clear(self):
+        self._db.execute("DELETE FROM lexical_postings")
+        self._db.execute("DELETE FROM lexical_lengths")
+        self._stats = None
+
+    def invalidate_stats(self):
+        """Recompute the collection stats on the next search (after this connection deletes chunks)."""
+        self._stats = None
+
+    def _merge_blocks(self, terms: List[str]):
+        """Rewrites the blocks of crowded `terms` as one block each, without the postings of deleted chunks."""
+        crowded = []
+        for start in range(0, len(terms), 500):
+            batch = terms[start:start + 500]
+            crowded.extend(term for (term,) in self._db.execute(
+                f"SELECT term FROM lexical_postings WHERE term IN ({','.join('?' * len(batch))}) "
+                f"GROUP BY term HAVING COUNT(*) > ?", batch + [MAX_BLOCKS]))
+        if not crowded:
+            return
+        live = np.fromiter((r for (r,) in self._db.execute("SELECT chunk FROM lexical_lengths ORDER BY chunk")), dtype=np.int64)
+        for start in range(0, len(crowded), 500):
+            batch = crowded[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            stored = self._db.execute(f"SELECT term, count, rows, tfs, lengths FROM lexical_postings "
+                                      f"WHERE term IN ({placeholders})", batch).fetchall()
+            self._db.execute(f"DELETE FROM lexical_postings WHERE term IN ({placeholders})", batch)
+            group_of = {term: g for g, term in enumerate(batch)}
+            block, rows, tfs, lengths = decode_blocks(*zip(*(b[1:] for b in stored)))
+            groups = np.array([group_of[b[0]] for b in stored], dtype=np.int64)[block]
+            keep = np.isin(rows, live)
+            order = np.lexsort((rows[keep], groups[keep]))
+            self._db.executemany(
+                "INSERT INTO lexical_postings (term, count, rows, tfs, lengths) VALUES (?, ?, ?, ?, ?)",
+                ((batch[b[0]],) + b[1:] for b in encode_blocks(groups[keep][order], rows[keep][order],
+                                                               tfs[keep][order], lengths[keep][order])))
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        stored = self._db.execute("SELECT count, rows, tfs, lengths FROM lexical_postings WHERE term = ?", (term,)).fetchall()
+        if not stored:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        return decode_blocks(*zip(*stored))[1:]
+
+    def _collection_stats(self) -> Tuple[int, float]:
+        version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if self._stats is None or version != self._stats_version:
+            count, average = self._db.execute("SELECT COUNT(*), AVG(length) FROM lexical_lengths").fetchone()
+            self._stats, self._stats_version = (count, float(average or 0.0)), version
+        return self._stats
+
+    def score(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(row ids, BM25 scores) of every indexed chunk matching a term of `query`, best first."""
+        with self._lock:
+            n_chunks, average_length = self._collection_stats()
+            all_rows, all_scores = [], []
+            for term in set(tokenize(query)):
+                rows, tfs, lengths = self._postings(term)
+                if not len(rows):
+                    continue
+                # Postings of deleted chunks still count towards df until merged away
+                idf = math.log(1 + (n_chunks - len(rows) + 0.5) / (len(rows) + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(average_length, 1e-9))
+                all_rows.append(rows)
+                all_scores.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+        if not all_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order].astype(np.float32)
+
+
+def reciprocal_rank_scores(rankings: Iterable[Sequence], key=lambda item: item, k: int = 60) -> List[Tuple[object, float]]:
+    """
+    (item, score) for the items of several best-first rankings, ordered by the
+    score sum(1 / (k + rank)) over the rankings they appear in (Cormack et al.,
+    2009). Ties keep first-seen order.
+    """
+    scores: Dict[object, float] = {}
+    items: Dict[object, object] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            item_key = key(item)
+            items.setdefault(item_key, item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank)
+    return [(items[item_key], scores[item_key]) for item_key in sorted(scores, key=lambda i: -scores[i])]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence], key=lambda item: item, k: int = 60) -> List:
+    """Items of several best-first rankings in reciprocal rank fusion order (see reciprocal_rank_scores)."""
+    return [item for item, _ in reciprocal_rank_scores(rankings, key, k)]
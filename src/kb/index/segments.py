@@ -0,0 +1,251 @@
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import faiss
+import numpy as np
+from src.kb.index.index_types import (
+    apply_search_params, default_nlist, export_vectors, fill_index, filtered_search_batch, make_index, read_index,
+    search_batch, storage_index, stored_ids,
+)
+
+# Segment files live here, relative to the index directory
+SEGMENTS_DIR = "segments"
+
+# Tiered merge policy: once MERGE_FACTOR segments hold about as many vectors as
+# each other (the same power of MERGE_FACTOR), they are merged into one, so an
+# index of n vectors has O(log n) segments and each vector is rewritten O(log n) times
+MERGE_FACTOR = 10
+
+# A segment is rewritten without its deleted vectors once they are this fraction of it
+COMPACT_RATIO = 0.2
+
+
+def segment_file(number: int, tag: str = "") -> str:
+    return f"{SEGMENTS_DIR}/seg-{number:06d}{'-' + tag if tag else ''}.faiss"
+
+
+def write_index(index: faiss.Index, path: str):
+    """Writes `index` to `path` durably; a partly written file never has the final name."""
+    tmp_file = path + ".tmp"
+    faiss.write_index(index, tmp_file)
+    with open(tmp_file, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def buffer_precision(precision: str) -> str:
+    """Precision of the in-memory buffer of a store of `precision` (see SegmentedIndex.add)."""
+    return "fp32" if precision == "int8" else precision
+
+
+def build_index(vectors: np.ndarray, ids: np.ndarray, index_type: str, precision: str, params: Dict) -> faiss.Index:
+    """New index of `index_type` holding `vectors` under `ids` (IVF cells default to the vector count)."""
+    params = {"nlist": default_nlist(len(vectors)), **params}
+    index = make_index(vectors.shape[1], precision, index_type, params)
+    fill_index(index, vectors, ids)
+    return index
+
+
+class Segment:
+    """
+    One index of a SegmentedIndex. Written once and never modified: deleting
+    one of its vectors only records the id in `deleted`, and the vector is
+    dropped when the segment is merged. `name` (its file, relative to the
+    index directory) is None until it is saved.
+    """
+
+    def __init__(self, index: faiss.Index, index_type: str, name: Optional[str] = None,
+                 deleted: Iterable[int] = (), mapped: bool = False):
+        self.index = index
+        self.index_type = index_type
+        self.name = name
+        self.deleted: Set[int] = set(deleted)
+        self.mapped = mapped
+        # Sorted ids, read on the first lookup
+        self._ids: Optional[np.ndarray] = None
+
+    @property
+    def count(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def live(self) -> int:
+        return self.index.ntotal - len(self.deleted)
+
+    def holds(self, ids: np.ndarray) -> np.ndarray:
+        """Mask of the `ids` stored in this segment (deleted or not)."""
+        if self._ids is None:
+            self._ids = np.sort(stored_ids(self.index))
+        if len(self._ids) == 0:
+            return np.zeros(len(ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(self._ids, ids), len(self._ids) - 1)
+        return self._ids[positions] == ids
+
+
+def read_live(segment: Segment, directory: str, deleted: Optional[Set[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (ids, vectors) of a segment, without the `deleted` ids (default: its own).
+    Saved segments are decoded from a private copy of their file, so the open
+    (possibly mapped) index is left alone and this is safe on another thread.
+    """
+    index = segment.index if segment.name is None else read_index(os.path.join(directory, segment.name))
+    ids, vectors = export_vectors(index)
+    deleted = segment.deleted if deleted is None else deleted
+    if deleted:
+        live = ~np.isin(ids, np.fromiter(deleted, dtype="int64", count=len(deleted)))
+        ids, vectors = ids[live], vectors[live]
+    return ids, vectors
+
+
+def tiered_merges(segments: Sequence[Segment], merge_factor: int = MERGE_FACTOR,
+                  compact_ratio: float = COMPACT_RATIO) -> List[List[Segment]]:
+    """
+    Groups of `segments` due for merging: every tier with `merge_factor`
+    segments, and on their own, segments that are mostly deleted vectors.
+    """
+    tiers: Dict[int, List[Segment]] = defaultdict(list)
+    for segment in segments:
+        tiers[_tier(segment.live, merge_factor)].append(segment)
+    groups = [members for _, members in sorted(tiers.items()) if len(members) >= merge_factor]
+    grouped = {id(s) for group in groups for s in group}
+    groups.extend([s] for s in segments if id(s) not in grouped and len(s.deleted) > compact_ratio * s.count)
+    return groups
+
+
+def _tier(n_vectors: int, merge_factor: int) -> int:
+    """floor(log(n_vectors, merge_factor)), 0 for empty segments."""
+    tier = 0
+    while n_vectors >= merge_factor:
+        n_vectors //= merge_factor
+        tier += 1
+    return tier
+
+
+def _top_k(results: List[Tuple[np.ndarray, np.ndarray]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k of per-segment (scores, ids) results."""
+    if not results:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype="int64")
+    scores = np.concatenate([s for s, _ in results])
+    ids = np.concatenate([i for _, i in results])
+    order = np.argsort(-scores, kind="stable")[:k]
+    return scores[order], ids[order]
+
+
+class SegmentedIndex:
+    """
+    A vector index split into segments (see Segment), searched as one.
+
+    New vectors go to `buffer`, an in-memory flat segment and the only one
+    that is ever modified; VectorStore.save() writes it out as a new segment
+    file, so saving costs time in proportion to what changed. Searches run on
+    every segment and merge their top-k.
+    """
+
+    def __init__(self, dimension: int, precision: str, params: Dict):
+        self.d = dimension
+        self.precision = precision
+        # Shared with the owning VectorStore: search-time settings apply to every segment
+        self.params = params
+        self.segments: List[Segment] = []
+        self.buffer: Optional[Segment] = None
+        self._buffer_ids: Set[int] = set()
+
+    @property
+    def ntotal(self) -> int:
+        """Vectors stored, including deleted ones not merged away yet."""
+        return sum(s.count for s in self.segments)
+
+    @property
+    def live(self) -> int:
+        return sum(s.live for s in self.segments)
+
+    @property
+    def tombstones(self) -> Set[int]:
+        """Ids deleted but still stored in some segment."""
+        return set().union(*(s.deleted for s in self.segments))
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the vector codes held by all segments."""
+        return sum((getattr(storage_index(s.index), "code_size", None) or self.d * 4) * s.count for s in self.segments)
+
+    def add_segment(self, segment: Segment, position: Optional[int] = None):
+        apply_search_params(segment.index, self.params)
+        self.segments.insert(len(self.segments) if position is None else position, segment)
+
+    def replace(self, old: List[Segment], new: Optional[Segment]):
+        """Swaps merged segments `old` for `new` (None when nothing in them was live)."""
+        position = min(self.segments.index(s) for s in old)
+        self.segments = [s for s in self.segments if all(s is not o for o in old)]
+        if new is not None:
+            self.add_segment(new, position)
+
+    def seal_buffer(self) -> Optional[Segment]:
+        """Stops adding to the buffer (about to be saved) and returns it; an emptied buffer is dropped."""
+        buffer, self.buffer = self.buffer, None
+        self._buffer_ids = set()
+        if buffer is not None and buffer.count == 0:
+            self.segments.remove(buffer)
+            return None
+        return buffer
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        if len(ids) == 0:
+            return
+        if self.buffer is None:
+            # int8 ranges are trained once, on what the index first receives: the
+            # buffer keeps exact vectors and is encoded whole when it is saved
+            self.buffer = Segment(make_index(self.d, buffer_precision(self.precision), "flat"), "flat")
+            self.add_segment(self.buffer)
+        fill_index(self.buffer.index, vectors, ids)
+        self._buffer_ids.update(ids.tolist())
+
+    def remove(self, ids: Iterable[int]):
+        """Drops `ids` from the buffer and marks them deleted in the segments holding them."""
+        ids = np.unique(np.asarray(list(ids), dtype="int64"))
+        in_buffer = np.array([i in self._buffer_ids for i in ids.tolist()], dtype=bool)
+        if in_buffer.any():
+            self.buffer.index.remove_ids(ids[in_buffer])
+            self._buffer_ids.difference_update(ids[in_buffer].tolist())
+            ids = ids[~in_buffer]
+        for segment in reversed(self.segments):
+            if not len(ids):
+                break
+            if segment is self.buffer:
+                continue
+            held = segment.holds(ids)
+            segment.deleted.update(ids[held].tolist())
+            ids = ids[~held]
+
+    def tombstoned(self, ids: Iterable[int]) -> Set[int]:
+        """Which of `ids` are deleted vectors still in a segment."""
+        ids = set(ids)
+        return set().union(*(s.deleted & ids for s in self.segments))
+
+    def restore(self, ids: Iterable[int]):
+        """Un-deletes tombstoned `ids` (the same chunk added again keeps its vector)."""
+        ids = set(ids)
+        for segment in self.segments:
+            segment.deleted -= ids
+
+    def apply_search_params(self):
+        for segment in self.segments:
+            apply_search_params(segment.index, self.params)
+
+    def export(self, directory: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, vectors) of every live vector, decoded."""
+        parts = [read_live(s, directory) for s in self.segments if s.count]
+        if not parts:
+            return np.empty(0, dtype="int64"), np.empty((0, self.d), dtype=np.float32)
+        return np.concatenate([i for i, _ in parts]), np.concatenate([v for _, v in parts])
+
+    def search_batch(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Top-k (scores, ids) of each query over all segments (one search per segment), skipping deleted vectors."""
+        per_segment = [search_batch(s.index, queries, k, self.params, exclude=s.deleted) for s in self.segments if s.count]
+        return [_top_k(list(results), k) for results in zip(*per_segment)] if per_segment else [_top_k([], k)] * len(queries)
+
+    def filtered_search_batch(self, queries: np.ndarray, ids: Sequence[int], k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Top-k (scores, ids) of each query among `ids` only, over all segments."""
+        ids = np.unique(np.asarray(ids, dtype="int64"))
+        per_segment = [filtered_search_batch(s.index, queries, ids, k, self.params) for s in self.segments if s.count]
+        return [_top_k(list(results), k) for results in zip(*per_segment)] if per_segment else [_top_k([], k)] * len(queries)
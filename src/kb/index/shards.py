@@ -0,0 +1,324 @@
+import os
+import json
+from collections.abc import Sequence as SequenceABC
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+import numpy as np
+from src.kb.index.index_types import DEFAULT_PARAMS
+from src.kb.index.vector_store import VectorStore
+from src.kb.schema import Document
+
+# Collections live here, relative to the index directory, one VectorStore each
+COLLECTIONS_DIR = "collections"
+CONFIG_FILE = "collections.json"
+
+# Collection of files directly in the data directory (or outside it)
+DEFAULT_COLLECTION = "default"
+
+
+def is_sharded(index_path: str) -> bool:
+    return os.path.exists(os.path.join(index_path, CONFIG_FILE))
+
+
+def folder_collection(source: str, data_dir: str) -> str:
+    """Top-level folder of `source` under `data_dir`, DEFAULT_COLLECTION if it is not in one."""
+    try:
+        relative = os.path.relpath(os.path.abspath(source), os.path.abspath(data_dir))
+    except ValueError:
+        # Another drive (Windows)
+        return DEFAULT_COLLECTION
+    parts = os.path.normpath(relative).split(os.sep)
+    if len(parts) < 2 or parts[0] == os.pardir:
+        return DEFAULT_COLLECTION
+    return parts[0]
+
+
+class _Chunks(SequenceABC):
+    """The chunks of all collections as one read-only sequence, collection by collection."""
+
+    def __init__(self, stores: List[VectorStore]):
+        self.stores = stores
+
+    def __len__(self) -> int:
+        return sum(len(s.chunks) for s in self.stores)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        for store in self.stores:
+            if item < len(store.chunks):
+                return store.chunks[item]
+            item -= len(store.chunks)
+        raise IndexError("chunk index out of range")
+
+    def __iter__(self) -> Iterator[Document]:
+        for store in self.stores:
+            yield from store.chunks
+
+
+class ShardedVectorStore:
+    """
+    A vector store split into named collections, each a VectorStore with its
+    own index and chunk store (in collections/<name>). By default there is one
+    collection per top-level folder of the data directory.
+
+    Documents go to the collection named by their `category` metadata, which
+    is set from their folder when missing. A search runs on the selected
+    collections (default: all) in parallel, since FAISS releases the GIL,
+    and their top-k lists are merged by score. Saves, rebuilds and compaction
+    are per collection, so a change to one folder only rewrites its index.
+    """
+
+    def __init__(self, index_path: str = "./data/index", data_dir: str = "./data/raw", precision: str = "fp32",
+                 dim: Optional[int] = None, index_type: str = "auto", index_params: Optional[dict] = None,
+                 mmap: bool = False, max_workers: Optional[int] = None):
+        self.index_path = index_path
+        self.config_file = os.path.join(index_path, CONFIG_FILE)
+        self.mmap = mmap
+        # Settings of collections created from now on (an existing store keeps the saved ones);
+        # existing collections keep the ones they were built with
+        config = {"data_dir": data_dir, "precision": precision, "dim": dim, "index_type": index_type,
+                  "index_params": {**DEFAULT_PARAMS, **(index_params or {})}}
+        if os.path.exists(self.config_file):
+            with open(self.config_file, "r", encoding="utf-8") as f:
+                config.update(json.load(f))
+        self.data_dir = config["data_dir"]
+        self.precision = config["precision"]
+        self.dim = config["dim"]
+        self.index_type = config["index_type"]
+        self.index_params = config["index_params"]
+
+        self.shards: Dict[str, VectorStore] = {}
+        root = os.path.join(index_path, COLLECTIONS_DIR)
+        os.makedirs(root, exist_ok=True)
+        for name in sorted(os.listdir(root)):
+            if os.path.isdir(os.path.join(root, name)):
+                self.shards[name] = VectorStore(os.path.join(root, name), mmap=mmap)
+        # Threads are only started by the first multi-collection search
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or min(8, os.cpu_count() or 1),
+                                        thread_name_prefix="kb-shard")
+
+    @property
+    def stale(self) -> bool:
+        """True when another process has saved any collection (or added one) since this store loaded it."""
+        root = os.path.join(self.index_path, COLLECTIONS_DIR)
+        return any(s.stale for s in self.shards.values()) or any(
+            name not in self.shards and os.path.isdir(os.path.join(root, name)) for name in os.listdir(root))
+
+    def reload(self):
+        """Drops unsaved changes and re-opens every collection as last committed, including new ones."""
+        root = os.path.join(self.index_path, COLLECTIONS_DIR)
+        for name in sorted(os.listdir(root)):
+            if name in self.shards:
+                self.shards[name].reload()
+            elif os.path.isdir(os.path.join(root, name)):
+                self.shards[name] = VectorStore(os.path.join(root, name), mmap=self.mmap)
+
+    @property
+    def collections(self) -> List[str]:
+        return sorted(self.shards)
+
+    def collection(self, name: str) -> VectorStore:
+        """The collection `name`, created empty if it does not exist yet."""
+        if name not in self.shards:
+            if not name or name in (os.curdir, os.pardir) or os.sep in name or (os.altsep and os.altsep in name):
+                raise ValueError(f"Invalid collection name '{name}'")
+            self.shards[name] = VectorStore(os.path.join(self.index_path, COLLECTIONS_DIR, name),
+                                            self.precision, self.dim, self.index_type, dict(self.index_params),
+                                            mmap=self.mmap)
+        return self.shards[name]
+
+    def route(self, doc: Document) -> str:
+        """Collection of `doc`: its `category` metadata, else the folder of its source."""
+        category = doc.metadata.get("category")
+        if not category:
+            category = doc.metadata["category"] = folder_collection(doc.metadata.get("source", "unknown"), self.data_dir)
+        return category
+
+    def _group(self, documents: Sequence[Document]) -> Dict[str, List[int]]:
+        """Positions of `documents` by collection."""
+        groups: Dict[str, List[int]] = {}
+        for i, doc in enumerate(documents):
+            groups.setdefault(self.route(doc), []).append(i)
+        return groups
+
+    def _selected(self, collections: Optional[Iterable[str]] = None) -> List[VectorStore]:
+        """The named collections (unknown names are skipped), or all of them."""
+        if collections is None:
+            return [self.shards[name] for name in self.collections]
+        return [self.shards[name] for name in sorted(set(collections)) if name in self.shards]
+
+    @property
+    def metadata(self) -> _Chunks:
+        """The stored chunks of every collection (a lazily loaded sequence of Documents)."""
+        return _Chunks(self._selected())
+
+    @property
+    def built_type(self) -> Optional[str]:
+        """Index type of the largest collection."""
+        stores = [s for s in self._selected() if s.index is not None]
+        return max(stores, key=lambda s: s.index.ntotal).built_type if stores else None
+
+    @property
+    def tombstones(self) -> Set[int]:
+        return set().union(*(s.tombstones for s in self._selected()))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(s.nbytes for s in self._selected())
+
+    @property
+    def version(self) -> Optional[str]:
+        """Changes whenever a save changes any collection (see VectorStore.version)."""
+        versions = [f"{name}:{self.shards[name].version}" for name in self.collections if self.shards[name].version]
+        return ",".join(versions) or None
+
+    def clear(self):
+        """Drops every chunk and index of every collection (written by the next save)."""
+        for store in self._selected():
+            store.clear()
+
+    def add_documents(self, documents: List[Document], embeddings: np.ndarray):
+        """Adds documents and their embeddings to their collections (see route)."""
+        for name, rows in self._group(documents).items():
+            self.collection(name).add_documents([documents[i] for i in rows], embeddings[rows])
+
+    def upsert(self, documents: List[Document], embed: Callable[[List[Document]], np.ndarray]) -> Tuple[int, int, int]:
+        """VectorStore.upsert, per collection. Returns (added, unchanged, removed)."""
+        totals = [0, 0, 0]
+        for name, rows in self._group(documents).items():
+            group = [documents[i] for i in rows]
+            counts = self.collection(name).upsert(group, embed)
+            totals = [t + c for t, c in zip(totals, counts)]
+            # A file moved to another collection leaves nothing behind in the old one
+            sources = {doc.metadata.get("source", "unknown") for doc in group}
+            totals[2] += sum(store.delete_by_source(sources) for other, store in self.shards.items() if other != name)
+        return tuple(totals)
+
+    def update_documents(self, documents: Iterable[Document]):
+        documents = list(documents)
+        for name, rows in self._group(documents).items():
+            if name in self.shards:
+                self.shards[name].update_documents([documents[i] for i in rows])
+
+    def delete_by_source(self, sources: Union[str, Iterable[str]]) -> int:
+        """Removes the chunks of `sources` from every collection. Returns the count."""
+        sources = [sources] if isinstance(sources, str) else list(sources)
+        return sum(store.delete_by_source(sources) for store in self._selected())
+
+    def vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, vectors) of all stored chunks; collections must share a dimension."""
+        parts = [s.vectors() for s in self._selected() if s.index is not None]
+        if not parts:
+            return np.empty(0, dtype="int64"), np.empty((0, 0), dtype=np.float32)
+        return np.concatenate([i for i, _ in parts]), np.concatenate([v for _, v in parts])
+
+    def import_store(self, store: VectorStore) -> int:
+        """Moves the chunks of a single (unsharded) store into their collections, without re-embedding."""
+        ids, vectors = store.vectors()
+        position = {vector_id: row for row, vector_id in enumerate(ids.tolist())}
+        chunk_ids = [i for i in store.chunks.ids() if i in position]
+        for start in range(0, len(chunk_ids), 10000):
+            batch = chunk_ids[start:start + 10000]
+            self.add_documents(store.chunks.get_many(batch), vectors[[position[i] for i in batch]])
+        return len(chunk_ids)
+
+    def set_search_params(self, ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+        for key, value in (("ef_search", ef_search), ("nprobe", nprobe)):
+            if value is not None:
+                self.index_params[key] = value
+        for store in self._selected():
+            store.set_search_params(ef_search, nprobe)
+
+    def set_index_type(self, index_type: str, collections: Optional[Iterable[str]] = None, **params):
+        """VectorStore.set_index_type for the given collections; for all (and new ones) by default."""
+        if collections is None:
+            self.index_type = index_type
+            self.index_params.update(params)
+        for store in self._selected(collections):
+            store.set_index_type(index_type, **params)
+
+    def rebuild(self, precision: str, dim: Optional[int] = None, collections: Optional[Iterable[str]] = None):
+        """VectorStore.rebuild for the given collections; for all (and new ones) by default."""
+        for store in self._selected(collections):
+            store.rebuild(precision, dim)
+        if collections is None:
+            self.precision, self.dim = precision, dim
+
+    def compact(self, collections: Optional[Iterable[str]] = None):
+        for store in self._selected(collections):
+            store.compact()
+
+    def wait_for_merges(self):
+        for store in self._selected():
+            store.wait_for_merges()
+
+    def save(self, background_merge: bool = False):
+        """Saves every collection (each atomically), then the settings."""
+        for store in self._selected():
+            store.save(background_merge=background_merge)
+        config = {"data_dir": self.data_dir, "precision": self.precision, "dim": self.dim,
+                  "index_type": self.index_type, "index_params": self.index_params}
+        tmp_file = self.config_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_file, self.config_file)
+
+    def _fan_out(self, search: Callable[[VectorStore], List[Tuple[np.ndarray, np.ndarray]]],
+                 stores: List[VectorStore], top_k: int) -> List[List[Document]]:
+        """Runs `search` (per-query (scores, ids) lists) on `stores` in parallel and merges the results by score."""
+        per_store = [search(stores[0])] if len(stores) == 1 else list(self._pool.map(search, stores))
+
+        # Merge the per-collection top-k by score, then read only the winners
+        hits = [sorted(((score, n, vector_id) for n, (scores, found) in enumerate(results)
+                        for score, vector_id in zip(scores.tolist(), found.tolist())), key=lambda h: -h[0])[:top_k]
+                for results in zip(*per_store)]
+        found = [store.chunks.fetch(sorted({vector_id for query in hits for _, m, vector_id in query if m == n}))
+                 for n, store in enumerate(stores)]
+        return [[replace(found[n][vector_id], score=score) for score, n, vector_id in query if vector_id in found[n]]
+                for query in hits]
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5, ids: Optional[Sequence[int]] = None,
+                     collections: Optional[Iterable[str]] = None) -> List[List[Document]]:
+        """search() for each row of `query_embeddings`, with one index search per collection."""
+        query_embeddings = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        stores = [s for s in self._selected(collections) if len(s.chunks)]
+        if not stores:
+            return [[] for _ in range(len(query_embeddings))]
+        return self._fan_out(lambda store: store.search_ids_batch(query_embeddings, top_k, ids), stores, top_k)
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5, ids: Optional[Sequence[int]] = None,
+               collections: Optional[Iterable[str]] = None) -> List[Document]:
+        """
+        Searches the given collections (default: all) for the most similar
+        documents (among chunks `ids` only, if given).
+        """
+        return self.search_batch(np.array([query_embedding]), top_k, ids, collections)[0]
+
+    def lexical_search(self, query: str, top_k: int = 5, ids: Optional[Sequence[int]] = None,
+                       collections: Optional[Iterable[str]] = None) -> List[Document]:
+        """Keyword (BM25) search of the given collections; each scores against its own term statistics."""
+        stores = [s for s in self._selected(collections) if len(s.chunks)]
+        if not stores:
+            return []
+        return self._fan_out(lambda store: [store.lexical_search_ids(query, top_k, ids)], stores, top_k)[0]
+
+    def fetch(self, ids: Sequence[int]) -> Dict[int, Document]:
+        """Chunks for `ids` by id, from whichever collection holds them; unknown ids are left out."""
+        found: Dict[int, Document] = {}
+        for store in self._selected():
+            found.update(store.fetch([i for i in ids if i not in found]))
+        return found
+
+    def ids_for_files(self, file_names: Iterable[str]) -> List[int]:
+        """Ids of the chunks of the given files, in any collection."""
+        file_names = list(file_names)
+        return [i for store in self._selected() for i in store.ids_for_files(file_names)]
+
+    def get_indexed_files(self) -> List[dict]:
+        """Returns a summary of indexed files, with their collection."""
+        return [{**entry, "collection": name} for name in self.collections
+                for entry in self.shards[name].get_indexed_files()]
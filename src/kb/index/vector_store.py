@@ -1,96 +1,828 @@
 import os
+import json
+import hashlib
+import threading
+import time
 import faiss
 import numpy as np
 import pickle
-from typing import List, Optional
+from dataclasses import replace
+from concurrent.futures import Future, wait
+from tqdm import tqdm
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Union, Iterable
 from sentence_transformers import SentenceTransformer
+from src.kb.embedding.cache import EmbeddingCache, QueryCache
+from src.kb.embedding.backends import BACKENDS, cache_namespace, load_onnx_model
+from src.kb.embedding.pool import EmbeddingPool, available_memory, estimate_model_bytes, workers_within_limit
+from src.kb.serving.model_server import ModelClient, connect as connect_model_server
+from src.kb.index.chunk_store import ChunkStore, StaleIndexError, chunk_vector_id, source_key
+from src.kb.index.index_types import (
+    DEFAULT_PARAMS, INDEX_TYPES, PRECISIONS, choose_index_type, default_nlist, export_vectors,
+    min_train_size, read_index,
+)
+from src.kb.index.segments import (
+    SEGMENTS_DIR, Segment, SegmentedIndex, buffer_precision, build_index, read_live, segment_file,
+    tiered_merges, write_index,
+)
 from src.kb.schema import Document
 
 class Embedder:
     """Handles embedding generation."""
     
-    def __init__(self, model_name: str = "BAAI/bge-m3"):
-        self.model = SentenceTransformer(model_name)
-        
-    def embed_documents(self, documents: List[Document]) -> np.ndarray:
+    def __init__(self, model_name: str = "BAAI/bge-m3", cache_dir: Optional[str] = None, cache_max_bytes: int = 2 << 30,
+                 max_batch_tokens: int = 16384, max_batch_size: int = 128,
+                 backend: str = "torch", model_dir: Optional[str] = None,
+                 query_cache_size: int = 1024, query_cache_max_bytes: int = 64 << 20, use_server: bool = True):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        self.model_dir = model_dir
+        # A running model server (scripts/serve_models.py) hosting this model replaces the local copy
+        self.remote: Optional[ModelClient] = connect_model_server("embedder", model_name, backend) if use_server else None
+        self.model = None if self.remote else self._load_model()
+        # Batches are sized by padded token count (batch size x longest text), not by a fixed count
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        # The server owns the on-disk caches when it is in use
+        if self.remote:
+            cache_dir = None
+        # Persistent embedding cache: identical text is only ever embedded once per model (and backend)
+        self.cache = EmbeddingCache(cache_namespace(model_name, backend), cache_dir, max_bytes=cache_max_bytes) if cache_dir else None
+        # Query embeddings: in-memory LRU, persisted next to the document cache so CLI runs share it
+        query_store = EmbeddingCache(cache_namespace(model_name, backend) + "#queries", cache_dir, max_bytes=query_cache_max_bytes) if cache_dir else None
+        self.query_cache = QueryCache(cache_namespace(model_name, backend), query_cache_size, query_store) if query_cache_size else None
+        # Multi-process bulk mode (see start_pool)
+        self.pool: Optional[EmbeddingPool] = None
+
+    def _load_model(self):
+        if self.backend == "torch":
+            return SentenceTransformer(self.model_name)
+        # Exported artifact from scripts/export_onnx.py
+        return load_onnx_model(self.model_name, self.backend, self.model_dir)
+
+    def _remote_call(self, method: str, *args):
+        """Calls the model server; if it has gone away, loads the model and returns None."""
+        try:
+            return getattr(self.remote, method)(*args)
+        except (EOFError, OSError):
+            print("Model server unavailable, loading the embedding model in-process...")
+            self.remote = None
+            self.model = self._load_model()
+            return None
+
+    def start_pool(self, workers: int, memory_limit: Optional[int] = None, **pool_kwargs) -> int:
+        """
+        Starts `workers` embedding processes for bulk ingest, fewer if they would
+        not fit in `memory_limit` bytes (default: memory currently available).
+        Returns the number started; 0 means embedding stays in this process.
+        """
+        self.stop_pool()
+        if self.remote:
+            return 0
+        if memory_limit is None:
+            memory_limit = available_memory()
+        dim = self.model.get_sentence_embedding_dimension() or 1024
+        workers = workers_within_limit(workers, estimate_model_bytes(self.model), dim, self.max_batch_tokens, memory_limit)
+        if workers < 2:
+            return 0
+        self.pool = EmbeddingPool(self.model_name, workers, backend=self.backend, model_dir=self.model_dir, **pool_kwargs)
+        return workers
+
+    def stop_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def embed_documents(self, documents: List[Document], show_progress_bar: bool = True) -> np.ndarray:
         texts = [doc.content for doc in documents]
-        embeddings = self.model.encode(texts, normalize_embeddings=True, show_progress_bar=True)
-        return np.array(embeddings)
+        if self.cache is None:
+            return self._encode(texts, show_progress_bar)
+
+        cached, keys = self.cache.get_many(texts)
+        missing = [i for i, vec in enumerate(cached) if vec is None]
+        if not missing:
+            return np.stack(cached).astype(np.float32)
+
+        fresh = self._encode([texts[i] for i in missing], show_progress_bar)
+        self.cache.put_many([keys[i] for i in missing], fresh)
+
+        embeddings = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+        embeddings[missing] = fresh
+        for i, vec in enumerate(cached):
+            if vec is not None:
+                embeddings[i] = vec
+        return embeddings
+
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            # Rough estimate when the model exposes no tokenizer
+            return [len(t) // 3 + 2 for t in texts]
+        max_len = getattr(self.model, "max_seq_length", None) or 8192
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_len)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _length_batches(self, lengths: List[int]) -> List[List[int]]:
+        """Groups indices (longest first) so each batch's padded size fits max_batch_tokens."""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches, current = [], []
+        for i in order:
+            # Sorted descending: the first item of a batch is its longest
+            longest = lengths[current[0]] if current else lengths[i]
+            if current and ((len(current) + 1) * longest > self.max_batch_tokens or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _encode(self, texts: List[str], show_progress_bar: bool = True) -> np.ndarray:
+        if self.remote:
+            embeddings = self._remote_call("embed_documents", texts)
+            if embeddings is not None:
+                return embeddings
+        if len(texts) <= 1:
+            embeddings = self.model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
+            return np.asarray(embeddings, dtype=np.float32)
+
+        batches = self._length_batches(self._token_lengths(texts))
+        embeddings = None
+        with tqdm(total=len(texts), desc="Embedding", disable=not show_progress_bar) as progress:
+            if self.pool is not None:
+                # View into the pool's shared buffer, valid until the next call
+                return self.pool.encode(texts, batches, progress)
+            for batch in batches:
+                vectors = self.model.encode(
+                    [texts[i] for i in batch], batch_size=len(batch),
+                    normalize_embeddings=True, show_progress_bar=False,
+                )
+                vectors = np.asarray(vectors, dtype=np.float32)
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+                # Scatter back to the caller's order
+                embeddings[batch] = vectors
+                progress.update(len(batch))
+        return embeddings
         
     def embed_query(self, query: str) -> np.ndarray:
-        return self.model.encode([query], normalize_embeddings=True)[0]
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Query embeddings, served from the query cache where possible."""
+        vectors = [self.query_cache.get(q) if self.query_cache is not None else None for q in queries]
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        if missing:
+            fresh = self._remote_call("embed_queries", [queries[i] for i in missing]) if self.remote else None
+            if fresh is None:
+                fresh = self.model.encode([queries[i] for i in missing], normalize_embeddings=True)
+            for i, vec in zip(missing, fresh):
+                vectors[i] = vec
+                if self.query_cache is not None:
+                    self.query_cache.put(queries[i], vec)
+        return np.asarray(vectors, dtype=np.float32)
+
+def _promote_duplicate(doc: Document):
+    """Makes the first entry of doc.metadata["duplicates"] the chunk's primary location."""
+    promoted = doc.metadata["duplicates"].pop(0)
+    doc.metadata.update(promoted)
+    for key in ("page_number", "chunk_index", "total_pages", "title"):
+        if key not in promoted:
+            doc.metadata.pop(key, None)
+    if not doc.metadata["duplicates"]:
+        del doc.metadata["duplicates"]
+
+def truncate(embeddings: np.ndarray, dim: Optional[int]) -> np.ndarray:
+    """Keeps the first `dim` components and re-normalizes (no-op when dim is None or not smaller)."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if not dim or dim >= embeddings.shape[-1]:
+        return embeddings
+    truncated = np.ascontiguousarray(embeddings[..., :dim])
+    norms = np.linalg.norm(truncated, axis=-1, keepdims=True)
+    return truncated / np.maximum(norms, 1e-12)
+
+# Upper bound on how much of chunks.sqlite is memory-mapped in mmap mode (SQLite may cap it lower)
+CHUNKS_MMAP_BYTES = 1 << 40
+
+# Key of the index manifest in the chunk store's meta table
+MANIFEST_KEY = "index"
+
+# Segment files no manifest lists are deleted once this old (seconds): left by a crashed or refused save
+ORPHAN_AGE = 3600
+
+class _Merge:
+    """A segment merge running on a background thread (see VectorStore.save)."""
+
+    def __init__(self, group: List[Segment], name: str):
+        self.group = group
+        self.name = name
+        # Deleted ids of each input when the merge started: the merged segment leaves them out
+        self.deleted = [set(s.deleted) for s in group]
+        self.future: Future = Future()
 
 class VectorStore:
-    """FAISS-based vector store."""
-    
-    def __init__(self, index_path: str = "./data/index"):
+    """
+    FAISS-based vector store.
+
+    Every chunk has a stable 63-bit id (chunk_vector_id) shared by the FAISS
+    index and the chunk store, so chunks can be deleted, replaced (upsert) and
+    re-added without touching the rest of the index.
+
+    The index is a set of immutable segment files (see SegmentedIndex): a save
+    writes the vectors added since the last one as a new segment, then commits
+    the manifest (the segment list and deleted ids) together with the chunk
+    changes in one SQLite transaction. A crash at any point leaves the store as
+    it was after the previous or the new save; files of an interrupted save are
+    removed by the next one. Small segments are merged into larger ones as
+    they accumulate (MERGE_FACTOR), by save() or in the background.
+    """
+
+    def __init__(self, index_path: str = "./data/index", precision: str = "fp32", dim: Optional[int] = None,
+                 index_type: str = "auto", index_params: Optional[dict] = None, mmap: bool = False):
         self.index_path = index_path
+        # Single-file index and its settings, from before segments; migrated on first save
         self.index_file = os.path.join(index_path, "index.faiss")
+        self.config_file = os.path.join(index_path, "index.json")
+        # Pre-ChunkStore indexes kept all chunks in one pickle; migrated on first open
         self.metadata_file = os.path.join(index_path, "metadata.pkl")
-        
+
         if not os.path.exists(index_path):
             os.makedirs(index_path)
-            
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+        self.index: Optional[SegmentedIndex] = None
+        # With mmap, segment files and the chunk database are mapped instead of read:
+        # opening is near-instant and processes on one host share the pages
+        self.mmap = mmap
+        # Chunk text and metadata by vector id, read from disk on demand
+        self.chunks = ChunkStore(index_path, mmap_size=CHUNKS_MMAP_BYTES if mmap else 0)
+        # Settings of a new index; an existing index keeps the ones it was built with
+        self.precision = precision
+        self.dim = dim
+        # Requested index type ("auto" follows the vector count); see built_type for what was built
+        self.index_type = index_type
+        self.index_params = {**DEFAULT_PARAMS, **(index_params or {})}
+        # Set when the type or build parameters change: the next save rebuilds the index as one segment
+        self._rebuild = False
+        self._next_segment = 1
+        # Changes with every save that changes the index or chunks (keys caches of search results);
+        # None until the store is first saved
+        self.version: Optional[str] = None
+        # The manifest as committed when this store last loaded or saved (None: none yet), and its files.
+        # A save only commits if it is still the committed one, so a save from another process is never lost
+        self._committed_manifest: Optional[dict] = None
+        self._committed_files: Set[str] = set()
+        # Segment files written by this store that no committed manifest lists yet
+        self._written: Set[str] = set()
+        # Background merges not installed yet
+        self._merges: List[_Merge] = []
+
+        if os.path.exists(self.metadata_file) and len(self.chunks) == 0:
+            self._migrate_pickle()
+        self.load()
+
+    @property
+    def metadata(self) -> ChunkStore:
+        """The stored chunks, in insertion order (a lazily loaded sequence of Documents)."""
+        return self.chunks
+
+    @metadata.setter
+    def metadata(self, documents: List[Document]):
+        self.chunks.clear()
+        self.chunks.extend(documents)
+
+    @property
+    def built_type(self) -> Optional[str]:
+        """Index type of the largest segment."""
+        if self.index is None or not self.index.segments:
+            return None
+        return max(self.index.segments, key=lambda s: s.count).index_type
+
+    @property
+    def tombstones(self) -> Set[int]:
+        """Ids of deleted chunks whose vectors are still in a segment (skipped by search until merged away)."""
+        return self.index.tombstones if self.index is not None else set()
+
+    @property
+    def mapped(self) -> bool:
+        """True when segments are read-only views of their mapped files."""
+        return self.index is not None and any(s.mapped for s in self.index.segments)
+
+    def _migrate_pickle(self):
+        with open(self.metadata_file, "rb") as f:
+            documents = pickle.load(f)
+        self.chunks.extend(documents)
+        self.chunks.commit()
+        os.replace(self.metadata_file, self.metadata_file + ".migrated")
+        print(f"Migrated {len(documents)} chunks from metadata.pkl to {ChunkStore.DB_FILE}.")
+
+    def clear(self):
+        """Drops every chunk and the index (written by the next save)."""
         self.index = None
-        self.metadata: List[Document] = []
-        
-        # Load existing index if available
-        if os.path.exists(self.index_file) and os.path.exists(self.metadata_file):
-            self.load()
-            
+        self._merges = []
+        self.chunks.clear()
+
     def add_documents(self, documents: List[Document], embeddings: np.ndarray):
-        """Adds documents and their embeddings to the index."""
-        dimension = embeddings.shape[1]
-        
+        """
+        Adds documents and their embeddings to the index. A chunk that is already
+        stored (same id) is updated in place and keeps its vector.
+        """
+        if not documents:
+            return
+        embeddings = truncate(embeddings, self.dim)
+        ids = np.array([chunk_vector_id(doc) for doc in documents], dtype="int64")
+        # The same chunk twice in one batch: the last one wins
+        _, last = np.unique(ids[::-1], return_index=True)
+        keep = np.sort(len(ids) - 1 - last)
+        if len(keep) < len(ids):
+            ids, embeddings, documents = ids[keep], embeddings[keep], [documents[i] for i in keep]
+
         if self.index is None:
-            self.index = faiss.IndexFlatIP(dimension) # Inner Product (Cosine Similarity since normalized)
-            
-        self.index.add(embeddings)
-        self.metadata.extend(documents)
-        
-    def save(self):
-        """Persists the index and metadata to disk."""
-        if self.index:
-            faiss.write_index(self.index, self.index_file)
-        with open(self.metadata_file, "wb") as f:
-            pickle.dump(self.metadata, f)
-            
+            self.index = SegmentedIndex(embeddings.shape[1], self.precision, self.index_params)
+
+        # Deleted ids still have their vector in a segment: same id, same text, same vector
+        known = self.chunks.contains(ids) | self.index.tombstoned(ids.tolist())
+        self.index.restore(known)
+        new = np.array([i not in known for i in ids.tolist()], dtype=bool)
+        self.index.add(embeddings[new], ids[new])
+        self.chunks.put(ids, documents)
+
+    def upsert(self, documents: List[Document], embed: Callable[[List[Document]], np.ndarray]) -> Tuple[int, int, int]:
+        """
+        Replaces the stored chunks of the documents' files with `documents`.
+
+        Chunks stored unchanged keep their vectors; only new or changed ones are
+        passed to `embed`, and chunks no longer present are deleted. Returns
+        (added, unchanged, removed).
+        """
+        ids = [chunk_vector_id(doc) for doc in documents]
+        present = self.chunks.contains(ids) | (self.index.tombstoned(ids) if self.index is not None else set())
+        sources = {doc.metadata.get("source", "unknown") for doc in documents}
+        removed = self._delete_sources(sources, keep=present)
+
+        new_docs = [doc for doc, i in zip(documents, ids) if i not in present]
+        if new_docs:
+            self.add_documents(new_docs, embed(new_docs))
+        # Unchanged chunks only get their (re-parsed) metadata written back
+        unchanged = [(i, doc) for doc, i in zip(documents, ids) if i in present]
+        if unchanged:
+            self.index.restore(present)
+            self.chunks.put([i for i, _ in unchanged], [doc for _, doc in unchanged])
+        return len(new_docs), len(unchanged), removed
+
+    def _segment_type(self, n_vectors: int, n_total: int) -> str:
+        """Index type of a segment of `n_vectors`, in a store of `n_total` vectors, under the requested type."""
+        target = choose_index_type(n_total) if self.index_type == "auto" else self.index_type
+        if target in ("ivf", "ivfpq"):
+            params = {"nlist": default_nlist(n_vectors), **self.index_params}
+            if n_vectors < min_train_size(target, params):
+                return "flat"
+        return target
+
+    def vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(ids, vectors) of all stored chunks, decoded from the index."""
+        if self.index is None:
+            return np.empty(0, dtype="int64"), np.empty((0, 0), dtype=np.float32)
+        return self.index.export(self.index_path)
+
+    def _build(self, precision: str, dim: Optional[int] = None, index_type: Optional[str] = None):
+        """Moves the live vectors into one new segment (no re-embedding); drops deleted ones."""
+        ids, vectors = self.index.export(self.index_path)
+        vectors = truncate(vectors, dim)
+        index = SegmentedIndex(vectors.shape[1], precision, self.index_params)
+        if len(ids):
+            index_type = index_type or self._segment_type(len(ids), len(ids))
+            index.add_segment(Segment(build_index(vectors, ids, index_type, precision, self.index_params), index_type))
+        self.index = index
+        self._merges = []
+
+    def compact(self):
+        """Rebuilds the index as a single segment without deleted vectors."""
+        if self.index is not None and (self.index.tombstones or len(self.index.segments) > 1):
+            self._build(self.precision, self.dim)
+
+    def set_search_params(self, ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+        """Overrides the search-time parameters (not saved unless save() is called)."""
+        if ef_search is not None:
+            self.index_params["ef_search"] = ef_search
+        if nprobe is not None:
+            self.index_params["nprobe"] = nprobe
+        if self.index is not None:
+            self.index.apply_search_params()
+
+    def set_index_type(self, index_type: str, **params):
+        """Changes the requested index type and/or its parameters; rebuilds on the next save if needed."""
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+        build_params = ("hnsw_m", "ef_construction", "nlist", "pq_m")
+        if index_type != self.index_type or any(k in build_params and params[k] != self.index_params.get(k) for k in params):
+            self._rebuild = True
+        self.index_type = index_type
+        self.index_params.update(params)
+        if self.index is not None:
+            self.index.apply_search_params()
+
+    def update_documents(self, documents: Iterable[Document]):
+        """Writes back changed metadata of stored documents (matched by source and chunk_id) on the next save."""
+        self.chunks.update_documents(documents)
+
+    def rebuild(self, precision: str, dim: Optional[int] = None):
+        """
+        Re-encodes the stored vectors with another precision / truncated dimension,
+        without re-embedding. Vectors are read back from the current index, so going
+        to a coarser setting and back does not recover the lost precision.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+        if self.index is not None and self.index.ntotal:
+            if self.dim and (dim is None or dim > self.index.d):
+                raise ValueError(f"Index holds truncated {self.index.d}-dim vectors; re-ingest with --reset to store {dim or 'full'} dims")
+            if not self.dim and dim and dim >= self.index.d:
+                dim = None
+        self.precision, self.dim = precision, dim
+        if self.index is None or self.index.ntotal == 0:
+            self.index = None
+            return
+        self._build(precision, dim, self.built_type)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the vector codes held by the index."""
+        return self.index.nbytes if self.index is not None else 0
+
+    def delete_by_source(self, sources: Union[str, Iterable[str]]) -> int:
+        """
+        Removes every chunk whose `source` matches one of `sources`. Returns the count.
+
+        A chunk that also stands for near-duplicates in other files (see
+        NearDuplicateDetector) keeps its vector: the first surviving duplicate is
+        promoted to be its primary location.
+        """
+        if isinstance(sources, str):
+            sources = [sources]
+        return self._delete_sources(sources)
+
+    def _delete_sources(self, sources: Iterable[str], keep: Set[int] = frozenset()) -> int:
+        targets = {source_key(s) for s in sources}
+        if not targets or not len(self.chunks):
+            return 0
+
+        # Only the chunks of these files (or citing them as duplicates) are read
+        candidates = [i for i in self.chunks.ids_for_sources(targets) if i not in keep]
+        ids = []
+        for i, doc in zip(candidates, self.chunks.get_many(candidates)):
+            duplicates = doc.metadata.get("duplicates")
+            if duplicates:
+                duplicates = [d for d in duplicates if source_key(d.get("source", "")) not in targets]
+                if duplicates:
+                    doc.metadata["duplicates"] = duplicates
+                else:
+                    del doc.metadata["duplicates"]
+            if source_key(doc.metadata.get("source", "")) in targets and not duplicates:
+                ids.append(i)
+                continue
+            if source_key(doc.metadata.get("source", "")) in targets:
+                _promote_duplicate(doc)
+            self.chunks.update(i, doc)
+        if not ids:
+            return 0
+
+        if self.index is not None:
+            # Unsaved vectors are dropped; saved ones are marked deleted in their segment
+            self.index.remove(ids)
+        self.chunks.delete(ids)
+        return len(ids)
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self.index_path, name)
+
+    def _new_segment_name(self) -> str:
+        # Unique, so a process saving the same index at the same time never writes over it
+        name = segment_file(self._next_segment, os.urandom(4).hex())
+        self._next_segment += 1
+        self._written.add(name)
+        return name
+
+    def _write_segments(self):
+        """Writes the buffer of added vectors (and any rebuilt segment) out as new segment files."""
+        buffer = self.index.seal_buffer()
+        total = self.index.live
+        for segment in [s for s in self.index.segments if s.name is None]:
+            if segment is buffer:
+                # Stays flat unless the store calls for another type (e.g. HNSW past AUTO_HNSW_MIN),
+                # and is encoded now if it was kept at a finer precision (int8)
+                index_type = self._segment_type(segment.live, total)
+                if index_type != segment.index_type or buffer_precision(self.precision) != self.precision:
+                    ids, vectors = read_live(segment, self.index_path)
+                    segment = Segment(build_index(vectors, ids, index_type, self.precision, self.index_params), index_type)
+                    self.index.replace([buffer], segment)
+            os.makedirs(os.path.join(self.index_path, SEGMENTS_DIR), exist_ok=True)
+            segment.name = self._new_segment_name()
+            write_index(segment.index, self._segment_path(segment.name))
+
+    def _plan_merges(self, busy: Set[int] = frozenset()) -> List[List[Segment]]:
+        """
+        Segment groups to merge: segments of a type the store no longer calls
+        for (e.g. flat ones once HNSW is due), then the tiered merge policy.
+        Segments whose id() is in `busy` are left out.
+        """
+        segments = [s for s in self.index.segments if id(s) not in busy]
+        total = self.index.live
+        converted = [s for s in segments if s.index_type != self._segment_type(s.live, total)]
+        rest = [s for s in segments if s not in converted]
+        return ([converted] if converted else []) + tiered_merges(rest)
+
+    def _merge_segments(self, group: List[Segment], deleted: List[Set[int]], name: str, index_type: str,
+                        precision: str, params: dict) -> Optional[Segment]:
+        """Writes the vectors of `group` not in `deleted` as segment `name` (None if there are none). Thread-safe."""
+        parts = [read_live(s, self.index_path, d) for s, d in zip(group, deleted)]
+        ids = np.concatenate([i for i, _ in parts])
+        if not len(ids):
+            return None
+        vectors = np.concatenate([v for _, v in parts])
+        index = build_index(vectors, ids, index_type, precision, params)
+        path = self._segment_path(name)
+        write_index(index, path)
+        if self.mmap:
+            return Segment(read_index(path, mmap=True), index_type, name, mapped=True)
+        return Segment(index, index_type, name)
+
+    def _merge(self):
+        """Runs the merge policy to completion on this thread."""
+        while True:
+            groups = self._plan_merges()
+            if not groups:
+                return
+            total = self.index.live
+            for group in groups:
+                live = sum(s.live for s in group)
+                index_type = self._segment_type(live, total)
+                if any(s.index_type != index_type for s in group):
+                    print(f"Building {index_type} index over {live} vectors...")
+                merged = self._merge_segments(group, [s.deleted for s in group], self._new_segment_name(),
+                                              index_type, self.precision, self.index_params)
+                self.index.replace(group, merged)
+
+    def _start_merges(self):
+        """Starts the merges the policy asks for on background threads (installed by a later save)."""
+        busy = {id(s) for merge in self._merges for s in merge.group}
+        total = self.index.live
+        for group in self._plan_merges(busy):
+            merge = _Merge(group, self._new_segment_name())
+            args = (merge.group, merge.deleted, merge.name, self._segment_type(sum(s.live for s in group), total),
+                    self.precision, dict(self.index_params))
+
+            def run(merge=merge, args=args):
+                try:
+                    merge.future.set_result(self._merge_segments(*args))
+                except Exception as e:
+                    merge.future.set_exception(e)
+
+            threading.Thread(target=run, daemon=True).start()
+            self._merges.append(merge)
+
+    def wait_for_merges(self):
+        """Blocks until background merges are done (the next save installs them)."""
+        for merge in self._merges:
+            wait([merge.future])
+
+    def _install_merges(self):
+        """Swaps finished background merges in for their input segments."""
+        running = []
+        for merge in self._merges:
+            if not merge.future.done():
+                running.append(merge)
+                continue
+            try:
+                merged = merge.future.result()
+            except Exception as e:
+                print(f"Warning: background segment merge failed ({e}); it is retried on a later save.")
+                continue
+            if self.index is None or any(all(s is not t for t in self.index.segments) for s in merge.group):
+                continue  # inputs replaced since (rebuild, clear)
+            if any(d - s.deleted for s, d in zip(merge.group, merge.deleted)):
+                continue  # a chunk the merge dropped was added back since
+            if merged is not None:
+                # Deleted while the merge ran: still in the merged segment
+                merged.deleted = set().union(*(s.deleted - d for s, d in zip(merge.group, merge.deleted)))
+            self.index.replace(merge.group, merged)
+        self._merges = running
+
+    def _manifest(self) -> dict:
+        segments = self.index.segments if self.index is not None else []
+        return {
+            "precision": self.precision, "dim": self.dim, "index_type": self.index_type, "params": dict(self.index_params),
+            "next_segment": self._next_segment,
+            "segments": [{"file": s.name, "type": s.index_type, "count": s.count, "deleted": sorted(s.deleted)}
+                         for s in segments],
+        }
+
+    def _remove_files(self, names: Iterable[str]):
+        for name in names:
+            if os.path.exists(self._segment_path(name)):
+                try:
+                    os.remove(self._segment_path(name))
+                except OSError:
+                    pass  # still open elsewhere (Windows); removed by a later save
+
+    def _remove_unused_files(self, committed: Set[str]):
+        """
+        Deletes the segment files the manifest just committed (listing `committed`)
+        replaced, those this store wrote and no longer needs, and orphans older
+        than ORPHAN_AGE. Files of another process's save in progress are left alone.
+        """
+        running = {merge.name for merge in self._merges}
+        self._remove_files((self._committed_files | self._written) - committed - running)
+        self._committed_files = committed
+        self._written &= running
+        segments_dir = os.path.join(self.index_path, SEGMENTS_DIR)
+        names = [f"{SEGMENTS_DIR}/{f}" for f in os.listdir(segments_dir)] if os.path.isdir(segments_dir) else []
+        cutoff = time.time() - ORPHAN_AGE
+        self._remove_files([name for name in names if name.removesuffix(".tmp") not in committed | running
+                            and os.path.getmtime(self._segment_path(name)) < cutoff])
+
+    def save(self, background_merge: bool = False):
+        """
+        Commits the changes since the last save. Work is proportional to the
+        change: added vectors are written as a new segment, deletions are
+        recorded in the manifest. Segments are then merged as the merge policy
+        asks, here or, with `background_merge`, on a background thread (the
+        result is installed by a later save).
+
+        Raises StaleIndexError, committing nothing, if another process saved
+        the index since this store loaded it; reload() and redo the changes.
+        """
+        self._install_merges()
+        if self._rebuild and self.index is not None:
+            self._build(self.precision, self.dim)
+        self._rebuild = False
+        if self.index is not None:
+            self._write_segments()
+            if not background_merge:
+                self._merge()
+        manifest = self._manifest()
+        previous = {key: value for key, value in (self._committed_manifest or {}).items() if key != "version"}
+        version = os.urandom(8).hex() if self.chunks.dirty or manifest != previous else self.version
+        manifest["version"] = version
+        try:
+            self.chunks.commit(meta={MANIFEST_KEY: manifest}, expected={MANIFEST_KEY: self._committed_manifest})
+        except StaleIndexError:
+            self._remove_files(self._written - {merge.name for merge in self._merges})
+            raise StaleIndexError(f"The index in {self.index_path} was saved by another process since it was "
+                                  "opened; nothing was saved. Reload it and redo the changes.")
+        self.version = version
+        self._committed_manifest = json.loads(json.dumps(manifest))
+        self._remove_unused_files({entry["file"] for entry in manifest["segments"]})
+        if background_merge and self.index is not None:
+            self._start_merges()
+
+    @property
+    def stale(self) -> bool:
+        """True when another process has saved the index since this store loaded it (see reload)."""
+        return self.chunks.get_meta(MANIFEST_KEY) != self._committed_manifest
+
+    def reload(self):
+        """Drops unsaved changes and re-opens the index as last committed (e.g. by another process)."""
+        self.index = None
+        self._merges = []
+        self._rebuild = False
+        self.version = None
+        self._committed_files = set()
+        self.chunks.refresh()
+        self.load()
+
     def load(self):
-        """Loads the index and metadata from disk."""
-        self.index = faiss.read_index(self.index_file)
-        with open(self.metadata_file, "rb") as f:
-            self.metadata = pickle.load(f)
-            
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Document]:
-        """Searches for the most similar documents."""
+        """Opens the index listed by the committed manifest (mapping the segments, in mmap mode)."""
+        self._committed_manifest = self.chunks.get_meta(MANIFEST_KEY)
+        manifest = self._committed_manifest or self._legacy_manifest()
+        if manifest is None:
+            return
+        self.precision, self.dim = manifest["precision"], manifest["dim"]
+        self.index_type = manifest["index_type"]
+        self.index_params = {**DEFAULT_PARAMS, **manifest["params"]}
+        self._next_segment = manifest.get("next_segment", 1)
+        self._committed_files = {entry["file"] for entry in manifest["segments"]}
+        if self._committed_manifest is None:
+            # Replaced by the first save
+            self._committed_files.update({"index.faiss", "index.json"})
+        # Saved before versions: one derived from the manifest, until the next change
+        self.version = manifest.get("version") or hashlib.blake2b(
+            json.dumps(manifest, sort_keys=True).encode("utf-8"), digest_size=8).hexdigest()
+        self.index = None
+        for entry in manifest["segments"]:
+            index = read_index(self._segment_path(entry["file"]), mmap=self.mmap)
+            if self.index is None:
+                self.index = SegmentedIndex(index.d, self.precision, self.index_params)
+            self.index.add_segment(Segment(index, entry["type"], entry["file"], entry["deleted"], mapped=self.mmap))
+        if manifest.get("positional"):
+            self._assign_ids(read_index(self.index_file))
+        if self.index is not None and self.index.live != len(self.chunks):
+            print(f"Warning: the index has {self.index.live} vectors but the chunk store has "
+                  f"{len(self.chunks)} chunks. Re-ingest with --reset to repair.")
+
+    def _legacy_manifest(self) -> Optional[dict]:
+        """Manifest of a single-file index saved before segments (index.faiss + index.json), if any."""
+        if not os.path.exists(self.index_file):
+            return None
+        # Indexes saved before index.json existed are full-dimension fp32 flat
+        config = {"precision": "fp32", "dim": None, "index_type": "flat", "built_type": "flat", "params": {},
+                  "ids": False, "tombstones": []}
+        if os.path.exists(self.config_file):
+            with open(self.config_file, encoding="utf-8") as f:
+                config.update(json.load(f))
+        manifest = {key: config[key] for key in ("precision", "dim", "index_type", "params")}
+        if config["ids"]:
+            # The old file becomes the first segment as it is
+            manifest["segments"] = [{"file": "index.faiss", "type": config["built_type"] or "flat", "deleted": config["tombstones"]}]
+        else:
+            manifest["segments"], manifest["positional"] = [], True
+        return manifest
+
+    def _assign_ids(self, index: faiss.Index):
+        """Re-keys an index saved before stable ids (vectors by row) with the chunk store's ids."""
+        ids = np.array(self.chunks.ids(), dtype="int64")
+        _, vectors = export_vectors(index)
+        if len(ids) != len(vectors):
+            print(f"Warning: {self.index_file} has {len(vectors)} vectors but the chunk store has "
+                  f"{len(ids)} chunks; keeping the first {min(len(ids), len(vectors))}. Re-ingest with --reset to repair.")
+            n = min(len(ids), len(vectors))
+            ids, vectors = ids[:n], vectors[:n]
+        self.index = SegmentedIndex(vectors.shape[1], self.precision, self.index_params)
+        self.index.add_segment(Segment(build_index(vectors, ids, "flat", self.precision, self.index_params), "flat"))
+        print(f"Assigned stable ids to {len(ids)} vectors (written on the next save).")
+
+    def search_ids_batch(self, query_embeddings: np.ndarray, top_k: int = 5,
+                         ids: Optional[Sequence[int]] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (scores, chunk ids) of the most similar chunks to each query, best first
+        (among chunks `ids` only, if given), from one index search over all queries.
+        """
+        query_vectors = truncate(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)), self.dim)
         if not self.index or len(self.metadata) == 0:
+            return [(np.empty(0, dtype=np.float32), np.empty(0, dtype="int64")) for _ in range(len(query_vectors))]
+        if ids is not None:
+            return self.index.filtered_search_batch(query_vectors, ids, top_k)
+        return self.index.search_batch(query_vectors, top_k)
+
+    def search_ids(self, query_embedding: np.ndarray, top_k: int = 5,
+                   ids: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, chunk ids) of the most similar chunks, best first (among chunks `ids` only, if given)."""
+        return self.search_ids_batch(np.array([query_embedding]), top_k, ids)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5,
+                     ids: Optional[Sequence[int]] = None) -> List[List[Document]]:
+        """search() for each row of `query_embeddings`, with one index search and one chunk store read."""
+        results = self.search_ids_batch(query_embeddings, top_k, ids)
+        if not results:
             return []
-            
-        # FAISS expects 2D array
-        query_vector = np.array([query_embedding]) 
-        distances, indices = self.index.search(query_vector, top_k)
-        
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1 and idx < len(self.metadata):
-                doc = self.metadata[idx]
-                # Inject score into metadata just for reference (optional)
-                # doc.metadata["score"] = float(distances[0][i]) 
-                results.append(doc)
-                
-        return results
+        fetched = self.chunks.fetch(np.unique(np.concatenate([found for _, found in results])))
+        return [self._scored(fetched, scores, found) for scores, found in results]
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5, ids: Optional[Sequence[int]] = None) -> List[Document]:
+        """Searches for the most similar documents (among chunks `ids` only, if given); Document.score is the similarity."""
+        scores, found = self.search_ids(query_embedding, top_k, ids)
+        # Only the returned chunks are read from the chunk store
+        return self._scored(self.chunks.fetch(found), scores, found)
+
+    @staticmethod
+    def _scored(fetched: dict, scores: np.ndarray, found: np.ndarray) -> List[Document]:
+        """The `found` documents in order, as copies carrying their scores (the fetched ones are shared)."""
+        return [replace(fetched[i], score=score) for score, i in zip(scores.tolist(), found.tolist()) if i in fetched]
+
+    def lexical_search_ids(self, query: str, top_k: int = 5,
+                           ids: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(BM25 scores, chunk ids) of the chunks best matching the words of `query` (among `ids` only, if given)."""
+        return self.chunks.lexical_search(query, top_k, ids)
+
+    def lexical_search(self, query: str, top_k: int = 5, ids: Optional[Sequence[int]] = None) -> List[Document]:
+        """Keyword (BM25) search over the saved chunks; finds exact identifiers the embedding can miss."""
+        scores, found = self.lexical_search_ids(query, top_k, ids)
+        return self._scored(self.chunks.fetch(found), scores, found)
+
+    def fetch(self, ids: Sequence[int]) -> Dict[int, Document]:
+        """Chunks for `ids` (as returned by search_ids) by id; unknown ids are left out."""
+        return self.chunks.fetch(ids)
+
+    def ids_for_files(self, file_names: Iterable[str]) -> List[int]:
+        """Ids of the chunks of the given files (base names, as in get_indexed_files), duplicates included."""
+        return self.chunks.ids_for_files(file_names)
 
     def get_indexed_files(self) -> List[dict]:
         """Returns a summary of indexed files."""
         files = {}
-        for doc in self.metadata:
-            source = os.path.basename(doc.metadata.get("source", "Unknown"))
-            if source not in files:
-                files[source] = {"chunks": 0}
-            files[source]["chunks"] += 1
+        for source, count in self.chunks.file_counts():
+            name = os.path.basename(source or "Unknown")
+            files[name] = files.get(name, 0) + count
         return [{"filename": k, "chunks": v} for k, v in files.items()]
 
-def get_retriever(model_name="BAAI/bge-m3", index_path="./data/index"):
-    embedder = Embedder(model_name)
-    store = VectorStore(index_path)
+def get_retriever(model_name="BAAI/bge-m3", index_path="./data/index", cache_dir="./data/cache/embeddings", backend="torch",
+                  mmap=True):
+    from src.kb.index.shards import ShardedVectorStore, is_sharded
+    embedder = Embedder(model_name, cache_dir=cache_dir, backend=backend)
+    # An index split into collections (ingest --collections) is opened as one
+    store = ShardedVectorStore(index_path, mmap=mmap) if is_sharded(index_path) else VectorStore(index_path, mmap=mmap)
     return embedder, store
@@ -0,0 +1,65 @@
+import os
+import gzip
+import json
+from typing import List, Optional
+from src.kb.schema import Document
+
+# Keys that describe where the file lives now rather than what it contains;
+# they are not cached and are filled in again on replay.
+LOCATION_KEYS = ("source", "file_name")
+
+
+class ParsedTextCache:
+    """
+    Cache of loader output under data/processed.
+
+    Entries are gzip-compressed JSON, one file per (content hash, loader, loader
+    version), so a renamed or copied file hits the same entry and bumping a
+    loader's VERSION invalidates everything it produced.
+    """
+
+    def __init__(self, cache_dir: str = "./data/processed"):
+        self.cache_dir = cache_dir
+
+    def _path(self, sha256: str, loader: str, version: int) -> str:
+        return os.path.join(self.cache_dir, loader, sha256[:2], f"{sha256}.v{version}.json.gz")
+
+    def get(self, file_path: str, sha256: str, loader: str, version: int) -> Optional[List[Document]]:
+        """Returns the cached pages for this content, re-pointed at `file_path`, or None."""
+        path = self._path(sha256, loader, version)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # Truncated or corrupt entry: treat as a miss, it will be rewritten
+            return None
+
+        documents = []
+        for page in data["pages"]:
+            metadata = dict(page["metadata"])
+            metadata["source"] = file_path
+            metadata["file_name"] = os.path.basename(file_path)
+            documents.append(Document(content=page["content"], metadata=metadata))
+        return documents
+
+    def put(self, sha256: str, loader: str, version: int, documents: List[Document]):
+        path = self._path(sha256, loader, version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            "loader": loader,
+            "version": version,
+            "pages": [
+                {
+                    "content": doc.content,
+                    "metadata": {k: v for k, v in doc.metadata.items() if k not in LOCATION_KEYS},
+                }
+                for doc in documents
+            ],
+        }
+        # Write-then-rename so concurrent workers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
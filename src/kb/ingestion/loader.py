@@ -0,0 +1,248 @@
+import os
+import signal
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from src.kb.ingestion.pdf_loader import PDFLoader, load_pdf
+from src.kb.ingestion.html_loader import HTMLLoader, load_html
+from src.kb.ingestion.cache import ParsedTextCache
+from src.kb.ingestion.manifest import file_sha256, normalize_path
+from src.kb.schema import Document
+
+# Supported extensions
+LOADERS: Dict[str, Callable[[str], List[Document]]] = {
+    ".pdf": load_pdf,
+    ".html": load_html,
+    ".htm": load_html
+}
+
+# Parsed-text cache namespace and version per extension
+LOADER_VERSIONS: Dict[str, Tuple[str, int]] = {
+    ".pdf": ("pdf", PDFLoader.VERSION),
+    ".html": ("html", HTMLLoader.VERSION),
+    ".htm": ("html", HTMLLoader.VERSION),
+}
+
+# Extra time the parent waits on top of the per-file timeout before killing a worker
+# (covers hangs inside C code that the in-worker alarm cannot interrupt)
+WATCHDOG_GRACE = 5.0
+
+
+@dataclass
+class LoadResult:
+    """Outcome of loading one file."""
+    file_path: str
+    documents: List[Document] = field(default_factory=list)
+    error: Optional[str] = None
+    # Content hash, when it was computed for the cache (reused by the manifest)
+    sha256: Optional[str] = None
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class LoadTimeout(Exception):
+    pass
+
+
+def load_document(file_path: str) -> List[Document]:
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in LOADERS:
+        return LOADERS[ext](file_path)
+    return []
+
+
+def load_file(file_path: str, cache_dir: Optional[str] = None, sha256: Optional[str] = None) -> LoadResult:
+    """
+    Loads one file, replaying it from the parsed-text cache in `cache_dir` when
+    possible. Loader errors are raised, and a failed parse is never cached.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if cache_dir is None or ext not in LOADERS:
+        return LoadResult(file_path, load_document(file_path))
+
+    sha256 = sha256 or file_sha256(file_path)
+    name, version = LOADER_VERSIONS.get(ext, (ext.lstrip("."), 0))
+    cache = ParsedTextCache(cache_dir)
+    documents = cache.get(file_path, sha256, name, version)
+    if documents is not None:
+        return LoadResult(file_path, documents, sha256=sha256, cached=True)
+
+    documents = load_document(file_path)
+    cache.put(sha256, name, version, documents)
+    return LoadResult(file_path, documents, sha256=sha256)
+
+
+def _raise_timeout(signum, frame):
+    raise LoadTimeout()
+
+
+def _load_in_worker(file_path: str, timeout: Optional[float], cache_dir: Optional[str], sha256: Optional[str]) -> LoadResult:
+    """Runs in a pool process. Never raises: errors are reported in the result."""
+    use_alarm = timeout is not None and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return load_file(file_path, cache_dir, sha256)
+    except LoadTimeout:
+        return LoadResult(file_path, error=f"timed out after {timeout:g}s")
+    except Exception as e:
+        return LoadResult(file_path, error=f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=3)}")
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _load_serial(file_paths: Iterable[str], cache_dir: Optional[str] = None, hashes: Optional[Dict[str, str]] = None) -> Iterator[LoadResult]:
+    hashes = hashes or {}
+    for file_path in file_paths:
+        try:
+            yield load_file(file_path, cache_dir, hashes.get(normalize_path(file_path)))
+        except Exception as e:
+            yield LoadResult(file_path, error=f"{type(e).__name__}: {e}")
+
+
+def _kill_pool(executor: ProcessPoolExecutor):
+    """Hard-stops a pool whose worker is stuck (ProcessPoolExecutor has no public kill)."""
+    for process in list((getattr(executor, "_processes", None) or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ParallelLoader:
+    """
+    Loads files on a process pool and yields results in input order.
+
+    Results are streamed as soon as the next file in order is ready, with at most
+    `prefetch` files in flight. A file that raises, exceeds `timeout` seconds, or
+    crashes its worker process is reported as a LoadResult with `error` set; the
+    rest of the batch is unaffected.
+    """
+
+    def __init__(self, workers: int = 1, timeout: Optional[float] = 300.0, prefetch: Optional[int] = None,
+                 cache_dir: Optional[str] = None, mp_context=None):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.cache_dir = cache_dir
+        self.prefetch = prefetch or self.workers * 4
+        self.mp_context = mp_context
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._hashes: Dict[str, str] = {}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self.mp_context)
+        return self._executor
+
+    def _reset_pool(self, kill: bool = False):
+        if self._executor is not None:
+            if kill:
+                _kill_pool(self._executor)
+            else:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _submit(self, file_path: str):
+        sha256 = self._hashes.get(normalize_path(file_path))
+        return self._pool().submit(_load_in_worker, file_path, self.timeout, self.cache_dir, sha256)
+
+    def _run_isolated(self, file_path: str) -> LoadResult:
+        """Re-runs a crash suspect alone, so a second crash can be attributed to it."""
+        try:
+            future = self._submit(file_path)
+            return future.result(timeout=self._wait_limit())
+        except BrokenProcessPool:
+            self._reset_pool()
+            return LoadResult(file_path, error="worker process crashed")
+        except FutureTimeoutError:
+            self._reset_pool(kill=True)
+            return LoadResult(file_path, error=f"timed out after {self.timeout:g}s (worker killed)")
+
+    def _wait_limit(self) -> Optional[float]:
+        return None if self.timeout is None else self.timeout + WATCHDOG_GRACE
+
+    def load(self, file_paths: Iterable[str], hashes: Optional[Dict[str, str]] = None) -> Iterator[LoadResult]:
+        """`hashes` (normalized path -> sha256) spares re-hashing files for the cache lookup."""
+        self._hashes = hashes or {}
+        pending = iter(file_paths)
+        in_flight = deque()  # (file_path, future) in input order
+        suspects = deque()   # files to re-run one by one after a pool crash
+
+        def refill():
+            while len(in_flight) < self.prefetch:
+                file_path = next(pending, None)
+                if file_path is None:
+                    return
+                in_flight.append((file_path, self._submit(file_path)))
+
+        try:
+            refill()
+            while in_flight or suspects:
+                if suspects:
+                    yield self._run_isolated(suspects.popleft())
+                    if not suspects:
+                        refill()
+                    continue
+
+                file_path, future = in_flight[0]
+                try:
+                    result = future.result(timeout=self._wait_limit())
+                except BrokenProcessPool:
+                    # Some in-flight file killed its worker; we can't tell which one
+                    suspects.extend(path for path, _ in in_flight)
+                    in_flight.clear()
+                    self._reset_pool()
+                    continue
+                except FutureTimeoutError:
+                    # Stuck where the in-worker alarm couldn't fire: kill the pool, resubmit the others
+                    in_flight.popleft()
+                    retry = [path for path, _ in in_flight]
+                    in_flight.clear()
+                    self._reset_pool(kill=True)
+                    yield LoadResult(file_path, error=f"timed out after {self.timeout:g}s (worker killed)")
+                    for path in retry:
+                        in_flight.append((path, self._submit(path)))
+                    refill()
+                    continue
+
+                in_flight.popleft()
+                refill()
+                yield result
+        finally:
+            self.close()
+
+
+def iter_load_documents(
+    file_paths: Iterable[str],
+    workers: int = 0,
+    timeout: Optional[float] = 300.0,
+    cache_dir: Optional[str] = None,
+    hashes: Optional[Dict[str, str]] = None,
+) -> Iterator[LoadResult]:
+    """
+    Loads files and yields one LoadResult per file, in input order.
+
+    workers=0 loads in the current process (no isolation, no timeout);
+    workers>=1 uses a process pool of that size. With `cache_dir`, parsed text
+    is read from / written to the ParsedTextCache there.
+    """
+    if workers <= 0:
+        return _load_serial(file_paths, cache_dir, hashes)
+    return ParallelLoader(workers=workers, timeout=timeout, cache_dir=cache_dir).load(file_paths, hashes)
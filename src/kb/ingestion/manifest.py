@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Iterable
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(file_path: str, block_size: int = 1 << 20) -> str:
+    """Returns the hex SHA-256 of a file's content, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize_path(file_path: str) -> str:
+    """Canonical form used as manifest key (and to compare `source` metadata)."""
+    return os.path.normcase(os.path.normpath(file_path))
+
+
+@dataclass
+class FileRecord:
+    """What we know about one ingested file."""
+    source: str
+    sha256: str
+    mtime: float
+    size: int
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class IngestPlan:
+    """Result of comparing the files on disk against the manifest."""
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    # Hashes computed while planning, reused when recording
+    hashes: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def to_ingest(self) -> List[str]:
+        return self.new + self.changed
+
+
+class IngestManifest:
+    """
+    Persistent record of ingested files (content hash, mtime, size, chunk ids).
+
+    Files whose (mtime, size) match the manifest are treated as unchanged without
+    being opened. If the stat differs, the content hash decides: a file that was
+    only touched is refreshed in the manifest and still skipped.
+    """
+
+    def __init__(self, manifest_path: str = "./data/index/manifest.json"):
+        self.manifest_path = manifest_path
+        self.files: Dict[str, FileRecord] = {}
+        if os.path.exists(manifest_path):
+            self.load()
+
+    def load(self):
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.files = {
+            normalize_path(rec["source"]): FileRecord(**rec)
+            for rec in data.get("files", [])
+        }
+
+    def save(self):
+        """Writes the manifest atomically (tmp file + rename)."""
+        directory = os.path.dirname(self.manifest_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        data = {
+            "version": MANIFEST_VERSION,
+            "files": [asdict(rec) for rec in self.files.values()],
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def get(self, file_path: str) -> Optional[FileRecord]:
+        return self.files.get(normalize_path(file_path))
+
+    def plan(self, file_paths: Iterable[str], scope: Optional[str] = None) -> IngestPlan:
+        """
+        Classifies `file_paths` as new / changed / unchanged.
+
+        Records under `scope` (a directory) that are no longer in `file_paths` are
+        reported as deleted. Pass scope=None to skip deletion detection, e.g. when
+        only a subset of the directory was scanned.
+        """
+        plan = IngestPlan()
+        seen = set()
+
+        for file_path in file_paths:
+            key = normalize_path(file_path)
+            seen.add(key)
+            record = self.files.get(key)
+            if record is None:
+                plan.new.append(file_path)
+                continue
+
+            stat = os.stat(file_path)
+            if stat.st_mtime == record.mtime and stat.st_size == record.size:
+                plan.unchanged.append(file_path)
+                continue
+
+            digest = file_sha256(file_path)
+            plan.hashes[key] = digest
+            if digest == record.sha256:
+                # Touched but not modified: refresh stat, keep chunks
+                record.mtime = stat.st_mtime
+                record.size = stat.st_size
+                plan.unchanged.append(file_path)
+            else:
+                plan.changed.append(file_path)
+
+        if scope is not None:
+            scope_prefix = normalize_path(scope).rstrip(os.sep) + os.sep
+            for key, record in self.files.items():
+                if key not in seen and key.startswith(scope_prefix):
+                    plan.deleted.append(record.source)
+
+        return plan
+
+    def record(self, file_path: str, chunk_ids: List[str], sha256: Optional[str] = None):
+        """Stores (or replaces) the record for a successfully ingested file."""
+        stat = os.stat(file_path)
+        self.files[normalize_path(file_path)] = FileRecord(
+            source=file_path,
+            sha256=sha256 or file_sha256(file_path),
+            mtime=stat.st_mtime,
+            size=stat.st_size,
+            chunk_ids=list(chunk_ids),
+        )
+
+    def remove(self, file_path: str) -> Optional[FileRecord]:
+        return self.files.pop(normalize_path(file_path), None)
+
+    def clear(self):
+        self.files = {}
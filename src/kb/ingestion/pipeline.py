@@ -0,0 +1,178 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from tqdm import tqdm
+from src.kb.chunking.chunker import Chunker
+from src.kb.chunking.dedup import NearDuplicateDetector
+from src.kb.index.vector_store import Embedder, VectorStore
+from src.kb.ingestion.loader import LoadResult, iter_load_documents
+from src.kb.ingestion.manifest import IngestManifest, normalize_path
+from src.kb.schema import Document
+
+
+@dataclass
+class IngestStats:
+    files: int = 0
+    pages: int = 0
+    chunks: int = 0
+    batches: int = 0
+    checkpoints: int = 0
+    cached: int = 0
+    failed: List[LoadResult] = field(default_factory=list)
+    limit_reached: bool = False
+
+
+@dataclass
+class _PendingFile:
+    file_path: str
+    chunk_ids: List[str]
+    unflushed: int
+    sha256: Optional[str] = None
+
+
+class IngestPipeline:
+    """
+    Streaming ingest: load -> chunk -> embed -> index in fixed-size batches.
+
+    Only one batch of chunks (plus the file currently being chunked) is held in
+    memory. Every `checkpoint_every` batches the store and the manifest are saved
+    together; a file is recorded in the manifest only once all of its chunks are
+    in the store, so an interrupted run resumes by re-ingesting just the files
+    that had not completed.
+    """
+
+    def __init__(
+        self,
+        chunker: Chunker,
+        embedder: Embedder,
+        store: VectorStore,
+        manifest: Optional[IngestManifest] = None,
+        batch_size: int = 256,
+        checkpoint_every: int = 20,
+        chunk_threads: int = 1,
+        dedup: Optional[NearDuplicateDetector] = None,
+    ):
+        self.chunker = chunker
+        self.embedder = embedder
+        self.store = store
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.chunk_threads = chunk_threads
+        self.dedup = dedup
+
+        self._batch: List[Document] = []
+        self._files: List[_PendingFile] = []
+        self._hashes: Dict[str, str] = {}
+        self.stats = IngestStats()
+
+    def run(
+        self,
+        file_paths: List[str],
+        workers: int = 0,
+        timeout: Optional[float] = 300.0,
+        limit: Optional[int] = None,
+        hashes: Optional[Dict[str, str]] = None,
+        cache_dir: Optional[str] = None,
+    ) -> IngestStats:
+        """
+        Ingests `file_paths`. Chunks already indexed for these files are replaced.
+
+        `limit` caps the number of pages; `hashes` (normalized path -> sha256) lets
+        the cache and the manifest reuse known hashes; `cache_dir` enables the
+        parsed-text cache.
+        """
+        self.stats = IngestStats()
+        self._hashes = hashes or {}
+
+        # Replace whatever is already indexed for these files (one pass over the store).
+        # Their manifest records go too, so a checkpoint never claims a file we haven't re-added.
+        self.store.delete_by_source(file_paths)
+        if self.manifest is not None:
+            for file_path in file_paths:
+                self.manifest.remove(file_path)
+
+        results = iter_load_documents(file_paths, workers=workers, timeout=timeout, cache_dir=cache_dir, hashes=self._hashes)
+        try:
+            for result in tqdm(results, total=len(file_paths), desc="Ingesting Files"):
+                if not result.ok:
+                    # Not recorded in the manifest, so it is retried on the next run
+                    self.stats.failed.append(result)
+                    continue
+                if result.cached:
+                    self.stats.cached += 1
+
+                documents = result.documents
+                if limit is not None and self.stats.pages + len(documents) > limit:
+                    documents = documents[:limit - self.stats.pages]
+                    self.stats.limit_reached = True
+
+                self._add_file(result.file_path, documents, complete=not self.stats.limit_reached, sha256=result.sha256)
+                if self.stats.limit_reached:
+                    break
+        finally:
+            results.close()
+
+        self._flush()
+        self.checkpoint()
+        return self.stats
+
+    def _add_file(self, file_path: str, documents: List[Document], complete: bool = True, sha256: Optional[str] = None):
+        chunks = self.chunker.split_documents(documents, num_threads=self.chunk_threads) if documents else []
+
+        chunk_ids = [c.metadata["chunk_id"] for c in chunks]
+        if self.dedup is not None:
+            # Near-duplicates are folded into an earlier chunk and never embedded
+            chunks = self.dedup.filter(chunks)
+
+        self.stats.pages += len(documents)
+        self.stats.chunks += len(chunks)
+        if complete:
+            self.stats.files += 1
+            self._files.append(_PendingFile(file_path, chunk_ids, len(chunks), sha256))
+
+        for chunk in chunks:
+            self._batch.append(chunk)
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+
+        # Files without any chunks are complete right away
+        self._record_completed()
+
+    def _flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        embeddings = self.embedder.embed_documents(batch, show_progress_bar=False)
+        self.store.add_documents(batch, embeddings)
+        self.stats.batches += 1
+
+        # Files are queued in order, so their chunks leave the batch in order too
+        flushed = len(batch)
+        for pending in self._files:
+            take = min(pending.unflushed, flushed)
+            pending.unflushed -= take
+            flushed -= take
+            if flushed == 0:
+                break
+        self._record_completed()
+
+        if self.checkpoint_every and self.stats.batches % self.checkpoint_every == 0:
+            self.checkpoint()
+
+    def _record_completed(self):
+        while self._files and self._files[0].unflushed == 0:
+            pending = self._files.pop(0)
+            if self.manifest is not None:
+                sha256 = pending.sha256 or self._hashes.get(normalize_path(pending.file_path))
+                self.manifest.record(pending.file_path, pending.chunk_ids, sha256=sha256)
+
+    def checkpoint(self):
+        """Saves the store, then the manifest (a crash in between only causes re-ingestion)."""
+        if self.dedup is not None:
+            # Chunks already written may have picked up duplicates since
+            self.store.update_documents(self.dedup.pop_updated())
+        self.store.save()
+        if self.manifest is not None:
+            self.manifest.save()
+        self.stats.checkpoints += 1
+
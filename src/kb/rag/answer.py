@@ -1,36 +1,79 @@
-from typing import List, Tuple, Dict, Any
+from typing import List, Optional, Tuple, Dict, Any
 from src.kb.retrieve.retriever import Retriever, Reranker
+from src.kb.retrieve.cache import SemanticCache
+from src.kb.index.chunk_store import chunk_vector_id
 from src.kb.index.vector_store import get_retriever
-from src.kb.rag.llm import LocalLLM
-from src.kb.rag.prompt import SYSTEM_PROMPT, build_rag_prompt
+from src.kb.rag.llm import GENERATION_ERROR, LocalLLM
+from src.kb.rag.prompt import NO_EVIDENCE_ANSWER, SYSTEM_PROMPT, build_rag_prompt
 from src.kb.schema import Document
 
+# Reranker relevance (0-1) the best chunk needs for the LLM to be asked at all;
+# chunks unrelated to the question score far below it
+MIN_EVIDENCE_SCORE = 0.05
+
 class AnswerEngine:
-    def __init__(self, index_path: str = "./data/index", llm_model: str = "qwen3:8b"):
+    def __init__(self, index_path: str = "./data/index", llm_model: str = "qwen3:8b", embedding_backend: str = "torch",
+                 min_score: float = MIN_EVIDENCE_SCORE, cache_size: int = 1000, cache_answers: bool = False):
         # Instantiate Retriever dependencies manually or via helper
-        embedder, vector_store = get_retriever(index_path=index_path)
+        embedder, vector_store = get_retriever(index_path=index_path, backend=embedding_backend)
         reranker = Reranker() # Default model
+        # Results of earlier, similar questions, kept with the index they came from
+        cache = SemanticCache(index_path, max_entries=cache_size) if cache_size else None
         
-        self.retriever = Retriever(embedder=embedder, vector_store=vector_store, reranker=reranker)
+        self.retriever = Retriever(embedder=embedder, vector_store=vector_store, reranker=reranker, cache=cache)
         self.llm = LocalLLM(model=llm_model)
+        self.min_score = min_score
+        self.cache_answers = cache_answers
 
-    def answer(self, query: str, top_k: int = 10, top_n: int = 3, file_filters: List[str] = None) -> Tuple[str, List[Document]]:
+    def answer(self, query: str, top_k: int = 10, top_n: int = 3, file_filters: List[str] = None,
+               collections: List[str] = None, min_score: Optional[float] = None,
+               cache_answer: Optional[bool] = None) -> Tuple[str, List[Document]]:
         """
         End-to-end RAG pipeline:
         1. Retrieve documents (Recall + Rerank)
         2. Build Prompt
         3. Generate Answer
         
+        When the best document scores below `min_score` (default: self.min_score)
+        the refusal is returned without calling the LLM. With `cache_answer`
+        (default: self.cache_answers), the answer to a similar earlier question
+        is reused, as long as the index has not changed since.
+        
         Returns:
             (answer_text, source_documents)
         """
+        min_score = self.min_score if min_score is None else min_score
+        key = None
+        if self.cache_answers if cache_answer is None else cache_answer:
+            query_emb = self.retriever.embedder.embed_query(query)
+            key = self.retriever.cache_key(query, top_k=top_k, top_n=top_n, use_rerank=True, file_filters=file_filters,
+                                           collections=collections, llm=self.llm.model, min_score=min_score)
+            cached = self.retriever.cached(query_emb, key)
+            if cached is not None and cached[1] is not None:
+                return cached[1], cached[0]
+
+        answer, relevant_docs = self._answer(query, top_k, top_n, file_filters, collections, min_score)
+        if key is not None and not answer.startswith(GENERATION_ERROR):
+            self.retriever.cache.put(query, query_emb, *key, [(chunk_vector_id(doc), doc.score) for doc in relevant_docs],
+                                     answer)
+        return answer, relevant_docs
+
+    def _answer(self, query: str, top_k: int, top_n: int, file_filters: Optional[List[str]],
+                collections: Optional[List[str]], min_score: float) -> Tuple[str, List[Document]]:
         # 1. Retrieve
         print(f"Retrieving for query: {query}...")
-        relevant_docs = self.retriever.retrieve(query, top_k=top_k, top_n=top_n, file_filters=file_filters)
+        relevant_docs = self.retriever.retrieve(query, top_k=top_k, top_n=top_n, file_filters=file_filters,
+                                                collections=collections)
         
         if not relevant_docs:
             return "No relevant documents found in the knowledge base.", []
 
+        # Weak evidence: refuse up front rather than wait for the LLM to
+        best = relevant_docs[0].score
+        if best is not None and best < min_score:
+            print(f"Best evidence score {best:.4f} is below {min_score}; not generating.")
+            return NO_EVIDENCE_ANSWER, relevant_docs
+
         # 2. Build Prompt
         user_prompt = build_rag_prompt(query, relevant_docs)
         
@@ -1,6 +1,9 @@
 import ollama
 from typing import List, Dict, Optional
 
+# Start of the text generate() returns when the model could not be reached
+GENERATION_ERROR = "Error generating response"
+
 class LocalLLM:
     def __init__(self, model: str = "qwen3:8b"):
         self.model = model
@@ -16,7 +19,7 @@ class LocalLLM:
             response = ollama.chat(model=self.model, messages=messages)
             return response['message']['content']
         except Exception as e:
-            return f"Error generating response: {str(e)}"
+            return f"{GENERATION_ERROR}: {str(e)}"
 
 if __name__ == "__main__":
     llm = LocalLLM()
@@ -1,12 +1,15 @@
 from typing import List
 from src.kb.schema import Document
 
-SYSTEM_PROMPT = """You are a precise knowledge base assistant. 
+# The refusal when the documents don't answer the question (Issue #10)
+NO_EVIDENCE_ANSWER = "I cannot find the answer in the provided documents."
+
+SYSTEM_PROMPT = f"""You are a precise knowledge base assistant. 
 Your task is to answer the user's question strictly based on the provided context documents.
 
 Rules:
 1. Use ONLY the information from the context. Do not use outside knowledge.
-2. If the answer is not present in the context, state clearly: "I cannot find the answer in the provided documents."
+2. If the answer is not present in the context, state clearly: "{NO_EVIDENCE_ANSWER}"
 3. Cite your sources DETAILEDLY. Append the reference at the end of the sentence.
    - Format: [Source: filename, Page: X] (if Page is available)
    - Or: [Source: filename] (if Page is N/A)
@@ -30,6 +33,11 @@ def format_context(documents: List[Document]) -> str:
             location_info += f", Page: {page}"
         if chunk_idx != "N/A":
             location_info += f", Chunk: {chunk_idx}"
+        # Near-duplicate copies of this chunk elsewhere in the corpus
+        for dup in doc.metadata.get("duplicates", []):
+            location_info += f"; Also in: {dup.get('source', 'Unknown')}"
+            if dup.get("page_number") is not None:
+                location_info += f", Page: {dup['page_number']}"
             
         # Format: 
         # [Document 1] (Source: test.pdf, Page: 1, Chunk: 5)
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from src.kb.index.lexical import tokenize
+
+# Cosine similarity to an earlier query above which its results are reused
+MIN_SIMILARITY = 0.95
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    version TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    query TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    results TEXT NOT NULL,
+    answer TEXT,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_scope ON entries (version, scope);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+"""
+
+
+@dataclass
+class CachedResult:
+    query: str
+    # (chunk id, score) of the ranked results
+    results: List[Tuple[int, float]]
+    answer: Optional[str] = None
+
+
+def scope_key(query: str, **settings) -> str:
+    """
+    Key of the settings a cached result depends on (filters, top_k, ...), plus
+    the identifiers and numbers in `query`: "error E1042" and "error E1043"
+    embed almost identically but must not share results.
+    """
+    identifiers = sorted({term for term in tokenize(query) if not term.isalpha()})
+    return json.dumps({**settings, "identifiers": identifiers}, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class SemanticCache:
+    """
+    Persistent cache of ranked search results (and, optionally, answers) that
+    a query shares with earlier ones worded differently: a lookup returns the
+    entry of the most similar earlier query (by embedding, at least
+    `min_similarity`) with the same scope (see scope_key) and index version.
+
+    Entries of other index versions are dropped as soon as a result for the
+    current one is stored, so a save to the index invalidates the cache. At
+    most `max_entries` are kept, least recently used first out. Thread-safe;
+    entries written by other processes are picked up on the next lookup.
+    """
+
+    DB_FILE = "query_cache.sqlite"
+
+    def __init__(self, path: str, max_entries: int = 1000, min_similarity: float = MIN_SIMILARITY):
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, self.DB_FILE), check_same_thread=False)
+        self._db.executescript(CACHE_SCHEMA)
+        self._lock = threading.Lock()
+        # (entry ids, unit query vectors) by (version, scope), while the database is unchanged
+        self._vectors: Dict[Tuple[str, str], Tuple[List[int], np.ndarray]] = {}
+        self._data_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _candidates(self, version: str, scope: str) -> Tuple[List[int], np.ndarray]:
+        # data_version changes when another connection commits
+        data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._vectors, self._data_version = {}, data_version
+        if (version, scope) not in self._vectors:
+            rows = self._db.execute("SELECT id, vector FROM entries WHERE version = ? AND scope = ?",
+                                    (version, scope)).fetchall()
+            vectors = np.array([np.frombuffer(vector, dtype=np.float32) for _, vector in rows], dtype=np.float32)
+            self._vectors[(version, scope)] = ([entry for entry, _ in rows], vectors)
+        return self._vectors[(version, scope)]
+
+    def get(self, query_embedding: np.ndarray, version: str, scope: str) -> Optional[CachedResult]:
+        """The entry of the most similar earlier query with this scope and index version, if similar enough."""
+        vector = _unit(query_embedding)
+        with self._lock:
+            entries, vectors = self._candidates(version, scope)
+            if entries and vectors.shape[1] == len(vector):
+                similarities = vectors @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.min_similarity:
+                    row = self._db.execute("SELECT query, results, answer FROM entries WHERE id = ?",
+                                           (entries[best],)).fetchone()
+                    if row is not None:
+                        with self._db:
+                            self._db.execute("UPDATE entries SET last_used = ? WHERE id = ?", (time.time(), entries[best]))
+                        self.hits += 1
+                        query, results, answer = row
+                        return CachedResult(query, [(int(i), score) for i, score in json.loads(results)], answer)
+            self.misses += 1
+            return None
+
+    def put(self, query: str, query_embedding: np.ndarray, version: str, scope: str,
+            results: List[Tuple[int, float]], answer: Optional[str] = None):
+        """Stores the results (and answer) of `query`, dropping entries of other index versions."""
+        vector = _unit(query_embedding)
+        results = [(int(i), None if score is None else float(score)) for i, score in results]
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries WHERE version != ?", (version,))
+            self._db.execute(
+                "INSERT INTO entries (version, scope, query, vector, results, answer, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (version, scope, query, vector.tobytes(), json.dumps(results), answer, time.time()))
+            self._db.execute("DELETE FROM entries WHERE id NOT IN "
+                             "(SELECT id FROM entries ORDER BY last_used DESC LIMIT ?)", (self.max_entries,))
+            self._vectors = {}
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries")
+            self._vectors = {}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
@@ -1,64 +1,147 @@
-from typing import List, Tuple
+from dataclasses import replace
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
 from sentence_transformers import CrossEncoder
 from src.kb.index.vector_store import VectorStore, Embedder
+from src.kb.index.chunk_store import chunk_vector_id
+from src.kb.index.lexical import reciprocal_rank_scores
+from src.kb.retrieve.cache import SemanticCache, scope_key
+from src.kb.serving.model_server import connect as connect_model_server
 from src.kb.schema import Document
 
 class Reranker:
     """Uses a Cross-Encoder to rerank documents."""
-    def __init__(self, model_name: str = "BAAI/bge-reranker-large"):
-        self.model = CrossEncoder(model_name)
+    def __init__(self, model_name: str = "BAAI/bge-reranker-large", use_server: bool = True):
+        self.model_name = model_name
+        # Scores come from a running model server hosting this reranker, if there is one
+        self.remote = connect_model_server("reranker", model_name) if use_server else None
+        self.model = None if self.remote else CrossEncoder(model_name)
+
+    def _server_gone(self):
+        print("Model server unavailable, loading the reranker in-process...")
+        self.remote = None
+        self.model = CrossEncoder(self.model_name)
+
+    def _scores(self, query: str, documents: List[Document]):
+        if self.remote:
+            try:
+                return self.remote.rerank_scores(query, [doc.content for doc in documents])
+            except (EOFError, OSError):
+                self._server_gone()
+        return self.model.predict([[query, doc.content] for doc in documents])
         
+    def _scores_batch(self, queries: List[str], documents: List[List[Document]]) -> List[Sequence[float]]:
+        """Scores of each query's documents, from one predict call (or server request) over all (query, chunk) pairs."""
+        pairs = [[query, doc.content] for query, docs in zip(queries, documents) for doc in docs]
+        scores = []
+        if pairs and self.remote:
+            try:
+                scores = self.remote.rerank_pairs(pairs)
+            except (EOFError, OSError):
+                self._server_gone()
+        if pairs and not self.remote:
+            scores = self.model.predict(pairs)
+        bounds = np.cumsum([0] + [len(docs) for docs in documents])
+        return [scores[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
     def rerank(self, query: str, documents: List[Document], top_n: int = 3) -> List[Document]:
         if not documents:
             return []
             
-        # Prepare pairs for Cross-Encoder
-        pairs = [[query, doc.content] for doc in documents]
-        
-        # Predict scores
-        scores = self.model.predict(pairs)
-        
+        # Predict scores for (query, chunk) pairs with the Cross-Encoder
+        scores = self._scores(query, documents)
+        return self._top(documents, scores, top_n)
+
+    def rerank_batch(self, queries: List[str], documents: List[List[Document]], top_n: int = 3) -> List[List[Document]]:
+        """rerank() for several queries and their candidates, scored in one Cross-Encoder pass."""
+        scores = self._scores_batch(queries, documents)
+        return [self._top(docs, doc_scores, top_n) if docs else [] for docs, doc_scores in zip(documents, scores)]
+
+    def _top(self, documents: List[Document], scores: Sequence[float], top_n: int) -> List[Document]:
         # Combine docs with scores
         doc_scores = list(zip(documents, scores))
         
         # Sort by score descending
         doc_scores.sort(key=lambda x: x[1], reverse=True)
         
-        # Store score in metadata for debugging/reference
+        # Each result is a copy holding this query's score (a chunk may be shared
+        # between queries); the metadata copy keeps it for debugging/reference
         results = []
         for doc, score in doc_scores[:top_n]:
-            doc.metadata["rerank_score"] = float(score)
-            results.append(doc)
+            score = float(score)
+            results.append(Document(content=doc.content, metadata={**doc.metadata, "rerank_score": score}, score=score))
             
         return results
 
 class Retriever:
-    """Orchestrates retrieval and reranking."""
-    def __init__(self, embedder: Embedder, vector_store: VectorStore, reranker: Reranker = None):
+    """
+    Orchestrates retrieval and reranking. With `hybrid`, the dense candidates
+    are fused (reciprocal rank fusion) with keyword (BM25) matches, which catch
+    exact identifiers the embedding misses without widening top_k. Results
+    carry the score of the last stage that ranked them (Document.score).
+
+    With a `cache` (SemanticCache), a query close enough to an earlier one
+    with the same settings reuses its ranked results while the index is
+    unchanged, skipping the search and the reranker.
+    """
+    def __init__(self, embedder: Embedder, vector_store: VectorStore, reranker: Reranker = None, hybrid: bool = True,
+                 cache: Optional[SemanticCache] = None):
         self.embedder = embedder
         self.vector_store = vector_store
         self.reranker = reranker
+        self.hybrid = hybrid
+        self.cache = cache
         
-    def retrieve(self, query: str, top_k: int = 10, top_n: int = 3, use_rerank: bool = True, file_filters: List[str] = None) -> List[Document]:
-        # 1. Vector Search (Recall)
-        # If filters are present, fetch more candidates to allow for post-filtering
-        search_k = top_k * 5 if file_filters is not None else top_k
-        
+    def retrieve(self, query: str, top_k: int = 10, top_n: int = 3, use_rerank: bool = True, file_filters: List[str] = None,
+                 collections: List[str] = None) -> List[Document]:
         query_emb = self.embedder.embed_query(query)
-        initial_results = self.vector_store.search(query_emb, top_k=search_k)
-        
-        # Apply Logic Filter
+        key = self.cache_key(query, top_k=top_k, top_n=top_n, use_rerank=use_rerank, file_filters=file_filters,
+                             collections=collections)
+        cached = self.cached(query_emb, key)
+        if cached is not None:
+            return cached[0]
+        results = self._retrieve(query, query_emb, top_k, top_n, use_rerank, file_filters, collections)
+        if key is not None:
+            self.cache.put(query, query_emb, *key, [(chunk_vector_id(doc), doc.score) for doc in results])
+        return results
+
+    def cache_key(self, query: str, top_k: int, top_n: int, use_rerank: bool, file_filters: List[str] = None,
+                  collections: List[str] = None, **settings) -> Optional[Tuple[str, str]]:
+        """(index version, scope) of cache entries for these retrieve() arguments; None without a cache."""
+        version = self.vector_store.version if self.cache is not None else None
+        if version is None:
+            return None
+        reranker = self.reranker.model_name if use_rerank and self.reranker else None
+        return version, scope_key(query, top_k=top_k, top_n=top_n, reranker=reranker, hybrid=self.hybrid,
+                                  file_filters=sorted(file_filters) if file_filters is not None else None,
+                                  collections=sorted(collections) if collections is not None else None, **settings)
+
+    def cached(self, query_emb: np.ndarray, key: Optional[Tuple[str, str]]) -> Optional[Tuple[List[Document], Optional[str]]]:
+        """(documents, answer) of the cache entry matching `query_emb` under `key` (see cache_key), if any."""
+        entry = self.cache.get(query_emb, *key) if key is not None else None
+        if entry is None:
+            return None
+        fetched = self.vector_store.fetch([i for i, _ in entry.results])
+        if len(fetched) < len(entry.results):
+            return None
+        print(f"Reusing the results of an earlier query: {entry.query}")
+        return [replace(fetched[i], score=score) for i, score in entry.results], entry.answer
+
+    def _retrieve(self, query: str, query_emb: np.ndarray, top_k: int, top_n: int, use_rerank: bool,
+                  file_filters: Optional[List[str]], collections: Optional[List[str]]) -> List[Document]:
+        # 1. Vector Search (Recall)
+        # Collections (ShardedVectorStore) route the query to those shards only
+        scope = {"collections": collections} if collections is not None else {}
+        # Filters restrict the search to the selected files' chunks up front, so it
+        # still returns top_k hits however few chunks they hold
+        ids = None
         if file_filters is not None:
-            import os
-            filtered_results = []
-            for doc in initial_results:
-                # Compare basenames
-                doc_name = os.path.basename(doc.metadata.get("source", ""))
-                if doc_name in file_filters:
-                    filtered_results.append(doc)
-            
-            # Trim back to requested top_k
-            initial_results = filtered_results[:top_k]
+            ids = self.vector_store.ids_for_files(file_filters)
+            initial_results = self.vector_store.search(query_emb, top_k=top_k, ids=ids, **scope)
+        else:
+            initial_results = self.vector_store.search(query_emb, top_k=top_k, **scope)
+        if self.hybrid:
+            initial_results = self._fuse(query, initial_results, top_k, ids, scope)
         
         if not use_rerank or not self.reranker or not initial_results:
             return initial_results[:top_n]
@@ -67,3 +150,25 @@ class Retriever:
         reranked_results = self.reranker.rerank(query, initial_results, top_n=top_n)
         
         return reranked_results
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 10, top_n: int = 3, use_rerank: bool = True,
+                       file_filters: List[str] = None, collections: List[str] = None) -> List[List[Document]]:
+        """retrieve() for each of `queries`, with one embedding call, one index search and one reranker pass."""
+        if not queries:
+            return []
+        query_embs = self.embedder.embed_queries(queries)
+        scope = {"collections": collections} if collections is not None else {}
+        ids = self.vector_store.ids_for_files(file_filters) if file_filters is not None else None
+        initial_results = self.vector_store.search_batch(query_embs, top_k=top_k, ids=ids, **scope)
+        if self.hybrid:
+            initial_results = [self._fuse(query, results, top_k, ids, scope) for query, results in zip(queries, initial_results)]
+
+        if not use_rerank or not self.reranker:
+            return [results[:top_n] for results in initial_results]
+        return self.reranker.rerank_batch(queries, initial_results, top_n=top_n)
+
+    def _fuse(self, query: str, dense: List[Document], top_k: int, ids, scope: dict) -> List[Document]:
+        """Top-k of the dense and keyword candidates of `query`, by reciprocal rank fusion (their new score)."""
+        lexical = self.vector_store.lexical_search(query, top_k=top_k, ids=ids, **scope)
+        fused = reciprocal_rank_scores([dense, lexical], key=chunk_vector_id)[:top_k]
+        return [replace(doc, score=score) for doc, score in fused]
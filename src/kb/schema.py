@@ -6,6 +6,9 @@ class Document:
     """Standard representation of a document chunk."""
     content: str
     metadata: Dict[str, Any] = field(default_factory=dict)
+    # Relevance to the query, from the stage that ranked this result (search
+    # similarity, BM25, fusion or reranker score); None outside search results
+    score: Optional[float] = field(default=None, compare=False)
 
     def __post_init__(self):
         # Ensure essential metadata keys exist if not provided
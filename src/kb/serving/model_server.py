@@ -0,0 +1,237 @@
+import os
+import threading
+import traceback
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Connection, Listener
+from queue import Empty, Queue
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+# "host:port", "unix:/path/to/socket", or "off" to never use a server
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+# Shared secret written by the server (readable by the owner only); clients
+# that can read it are allowed to connect
+DEFAULT_KEY_FILE = "./data/cache/model_server.key"
+
+Address = Union[str, Tuple[str, int]]
+
+
+def server_address() -> Optional[Address]:
+    """Address from KB_MODEL_SERVER, in the form multiprocessing.connection expects."""
+    value = os.environ.get("KB_MODEL_SERVER", DEFAULT_ADDRESS).strip()
+    if value.lower() in ("", "0", "off", "none"):
+        return None
+    if value.startswith("unix:"):
+        return value[len("unix:"):]
+    host, _, port = value.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+def key_file() -> str:
+    return os.environ.get("KB_MODEL_SERVER_KEY", DEFAULT_KEY_FILE)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into one model call.
+
+    Each request is a list of items; the worker thread takes the first pending
+    request, keeps collecting for up to `max_wait` seconds or `max_items` items,
+    runs `fn` once on the concatenation and hands every caller its slice.
+    """
+
+    def __init__(self, fn: Callable[[List], Sequence], max_items: int = 256, max_wait: float = 0.005):
+        self.fn = fn
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self._queue: "Queue[Tuple[List, Future]]" = Queue()
+        self.calls = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, items: List) -> Future:
+        future: Future = Future()
+        self._queue.put((items, future))
+        return future
+
+    def _run(self):
+        while True:
+            requests = [self._queue.get()]
+            n_items = len(requests[0][0])
+            while n_items < self.max_items:
+                try:
+                    request = self._queue.get(timeout=self.max_wait)
+                except Empty:
+                    break
+                requests.append(request)
+                n_items += len(request[0])
+
+            items = [item for batch, _ in requests for item in batch]
+            try:
+                results = self.fn(items) if items else []
+                self.calls += 1
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for batch, future in requests:
+                future.set_result(results[start:start + len(batch)])
+                start += len(batch)
+
+
+class ModelServer:
+    """
+    Long-lived process hosting one Embedder and (optionally) one Reranker.
+
+    Clients connect with multiprocessing.connection (authenticated with the key
+    file). Each connection is served by its own thread; their requests meet in
+    per-operation MicroBatchers, so concurrent CLI calls and UI sessions share
+    one forward pass.
+    """
+
+    def __init__(self, embedder, reranker=None, max_items: int = 256, max_wait: float = 0.005):
+        self.embedder = embedder
+        self.reranker = reranker
+        self._batchers = {
+            "embed_queries": MicroBatcher(self.embedder.embed_queries, max_items, max_wait),
+            "embed_documents": MicroBatcher(self._embed_texts, max_items, max_wait),
+        }
+        if reranker is not None:
+            self._batchers["rerank"] = MicroBatcher(self._score_pairs, max_items, max_wait)
+        self._listener: Optional[Listener] = None
+
+    def info(self) -> dict:
+        info = {"embedder": {"model": self.embedder.model_name, "backend": self.embedder.backend}}
+        if self.reranker is not None:
+            info["reranker"] = {"model": self.reranker.model_name}
+        return info
+
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        from src.kb.schema import Document
+        return self.embedder.embed_documents([Document(content=t) for t in texts], show_progress_bar=False)
+
+    def _score_pairs(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        return np.asarray(self.reranker.model.predict([list(p) for p in pairs], show_progress_bar=False))
+
+    def handle(self, request: tuple):
+        op, *args = request
+        if op == "info":
+            return self.info()
+        if op == "embed_queries":
+            return self._batchers["embed_queries"].submit(list(args[0])).result()
+        if op == "embed_documents":
+            return self._batchers["embed_documents"].submit(list(args[0])).result()
+        if op == "rerank" and "rerank" in self._batchers:
+            query, texts = args
+            return self._batchers["rerank"].submit([(query, t) for t in texts]).result()
+        if op == "rerank_pairs" and "rerank" in self._batchers:
+            return self._batchers["rerank"].submit([tuple(p) for p in args[0]]).result()
+        raise ValueError(f"Unsupported request: {op}")
+
+    def _serve_connection(self, conn: Connection):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("ok", self.handle(request)))
+                except Exception:
+                    conn.send(("error", traceback.format_exc()))
+
+    def serve_forever(self, address: Address, authkey: bytes, ready: Optional[threading.Event] = None):
+        self._listener = Listener(address, authkey=authkey)
+        if ready is not None:
+            ready.set()
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                # Listener closed (shutdown) or a client failed authentication
+                if self._listener is None:
+                    return
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def shutdown(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+
+
+class ModelClient:
+    """
+    Connection to a running ModelServer; safe to share between threads. Each
+    thread gets its own connection, so concurrent calls reach the server
+    together and share a batch instead of queueing behind one socket.
+    """
+
+    def __init__(self, address: Address, authkey: bytes):
+        self._address = address
+        self._authkey = authkey
+        self._local = threading.local()
+        self._conns: List[Connection] = []
+        self._lock = threading.Lock()
+
+    def _conn(self) -> Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self._address, authkey=self._authkey)
+            with self._lock:
+                self._conns.append(conn)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, *request):
+        conn = self._conn()
+        conn.send(request)
+        status, payload = conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Model server error:\n{payload}")
+        return payload
+
+    def info(self) -> dict:
+        return self._call("info")
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        return np.asarray(self._call("embed_queries", queries), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self._call("embed_documents", texts), dtype=np.float32)
+
+    def rerank_scores(self, query: str, texts: List[str]) -> np.ndarray:
+        return self._call("rerank", query, texts)
+
+    def rerank_pairs(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """Scores of (query, text) pairs of any number of queries, in one request."""
+        return self._call("rerank_pairs", pairs)
+
+    def close(self):
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+
+
+def connect(role: str, model_name: str, backend: Optional[str] = None) -> Optional[ModelClient]:
+    """
+    Client for a running server hosting `model_name` as `role` ("embedder" or
+    "reranker"), or None when there is no server or it hosts something else.
+    """
+    address = server_address()
+    if address is None or not os.path.exists(key_file()):
+        return None
+    try:
+        with open(key_file(), "rb") as f:
+            authkey = f.read()
+        client = ModelClient(address, authkey)
+        hosted = client.info().get(role)
+    except Exception:
+        # Stale key file, server not running or not answering: load the model in-process
+        return None
+    if not hosted or hosted.get("model") != model_name or (backend is not None and hosted.get("backend") != backend):
+        client.close()
+        return None
+    return client
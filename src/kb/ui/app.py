@@ -8,11 +8,13 @@ import streamlit as st
 import time
 import pandas as pd
 from typing import List
-from src.kb.rag.answer import AnswerEngine
+from src.kb.rag.answer import MIN_EVIDENCE_SCORE, AnswerEngine
+from src.kb.embedding.backends import BACKENDS
 from src.kb.schema import Document
 from src.kb.chunking.chunker import Chunker
-from src.kb.ingestion.pdf_loader import load_pdf
-from src.kb.ingestion.html_loader import load_html
+from src.kb.ingestion.loader import LOADERS, ParallelLoader
+from src.kb.index.shards import DEFAULT_COLLECTION
+from src.kb.index.chunk_store import StaleIndexError
 
 # Page Config
 st.set_page_config(
@@ -39,14 +41,13 @@ st.markdown("""
 
 # --- Helpers ---
 
-LOADERS = {
-    ".pdf": load_pdf,
-    ".html": load_html,
-    ".htm": load_html
-}
+# Uploaded files are parsed in a separate process so a malformed PDF can't hang or crash the app
+LOAD_TIMEOUT = 120.0
+PROCESSED_DIR = "./data/processed"
 
-def save_uploaded_file(uploaded_file):
-    save_dir = "./data/raw"
+def save_uploaded_file(uploaded_file, collection=None):
+    # A sharded index routes files by their top-level folder (see ShardedVectorStore)
+    save_dir = "./data/raw" if collection in (None, DEFAULT_COLLECTION) else os.path.join("./data/raw", collection)
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
     file_path = os.path.join(save_dir, uploaded_file.name)
@@ -68,10 +69,15 @@ def ingest_file(file_path, engine):
     progress = st.progress(0)
     
     status.write(f"📄 正在加载文档：{os.path.basename(file_path)}...")
-    loader = LOADERS[ext]
-    documents = loader(file_path)
+    with ParallelLoader(workers=1, timeout=LOAD_TIMEOUT, cache_dir=PROCESSED_DIR) as loader:
+        result = next(loader.load([file_path]))
     progress.progress(30)
     
+    if not result.ok:
+        st.error(f"文档解析失败：{result.error.splitlines()[0]}")
+        return
+    documents = result.documents
+    
     if not documents:
         st.warning("未检测到文本内容。")
         return
@@ -90,12 +96,24 @@ def ingest_file(file_path, engine):
     embedder = engine.retriever.embedder
     vector_store = engine.retriever.vector_store
     
-    embeddings = embedder.embed_documents(chunked_docs)
-    progress.progress(90)
-    
-    status.write("💾 保存索引中...")
-    vector_store.add_documents(chunked_docs, embeddings)
-    vector_store.save()
+    # Pick up saves from other processes (e.g. scripts/ingest.py) first; a save on top of an
+    # outdated index is refused, and is then redone on the reloaded one
+    if vector_store.stale:
+        vector_store.reload()
+    for attempt in range(2):
+        # Re-uploading a file replaces its chunks; unchanged chunks are not re-embedded
+        added, unchanged, removed = vector_store.upsert(chunked_docs, embedder.embed_documents)
+        progress.progress(90)
+        
+        status.write(f"💾 保存索引中 (新增 {added}，未变 {unchanged}，删除 {removed})...")
+        try:
+            # Writes only this file's vectors; merging segments happens in the background
+            vector_store.save(background_merge=True)
+            break
+        except StaleIndexError:
+            if attempt:
+                raise
+            vector_store.reload()
     progress.progress(100)
     
     status.success(f"成功处理文档：{os.path.basename(file_path)}！")
@@ -104,8 +122,8 @@ def ingest_file(file_path, engine):
     progress.empty()
 
 @st.cache_resource(show_spinner="正在加载 RAG 引擎...")
-def get_engine(model_name: str):
-    return AnswerEngine(index_path="./data/index", llm_model=model_name)
+def get_engine(model_name: str, embedding_backend: str = "torch"):
+    return AnswerEngine(index_path="./data/index", llm_model=model_name, embedding_backend=embedding_backend)
 
 # --- Sidebar ---
 with st.sidebar:
@@ -113,10 +131,16 @@ with st.sidebar:
     
     st.markdown("### 模型配置")
     llm_model = st.selectbox("LLM 模型", ["qwen3:8b", "llama3:8b"], index=0)
+    # onnx / onnx-int8 need the artifacts from scripts/export_onnx.py
+    embedding_backend = st.selectbox("向量推理后端", list(BACKENDS), index=0)
     
     st.markdown("### 检索参数")
     top_k = st.slider("初筛数量 (Recall Top-K)", 5, 50, 20)
     top_n = st.slider("精排数量 (Rerank Top-N)", 1, 10, 3)
+    # Below this reranker score the question is refused without calling the LLM
+    min_score = st.slider("证据阈值 (Min Score)", 0.0, 1.0, MIN_EVIDENCE_SCORE, 0.01)
+    # Answers are reused for similar questions until the knowledge base changes
+    cache_answer = st.checkbox("复用相似问题的答案", value=False)
     
     st.markdown("---")
     if st.button("清空对话记录", type="primary"):
@@ -128,7 +152,7 @@ with st.sidebar:
 
 # --- Initial Load ---
 try:
-    engine = get_engine(llm_model)
+    engine = get_engine(llm_model, embedding_backend)
 except Exception as e:
     st.error(f"引擎加载失败: {e}")
     st.stop()
@@ -142,6 +166,12 @@ with st.sidebar:
     st.markdown("### 📚 知识库范围")
     
     selected_files = None # Default to None = All
+    selected_collections = None # Only for an index split into collections
+    
+    if hasattr(engine.retriever.vector_store, 'collections'):
+        all_collections = engine.retriever.vector_store.collections
+        if all_collections:
+            selected_collections = st.multiselect("分类", all_collections, default=all_collections)
     
     if hasattr(engine.retriever.vector_store, 'get_indexed_files'):
         files_data = engine.retriever.vector_store.get_indexed_files()
@@ -195,6 +225,9 @@ with st.sidebar:
                     selected_files.append(fname)
             
             st.caption(f"已选 {len(selected_files)} / {len(all_filenames)} 个文档")
+            # All selected = no filter: skips the id lookup and keeps the query-cache key short
+            if len(selected_files) == len(all_filenames):
+                selected_files = None
 
 # -----------------------------------------------------------------------------
 
@@ -215,7 +248,7 @@ with tab1:
                     for i, doc in enumerate(msg["sources"], 1):
                         source = os.path.basename(doc.metadata.get("source", "未知来源"))
                         page = doc.metadata.get("page_number", "-")
-                        score = doc.metadata.get("rerank_score", 0.0)
+                        score = doc.score or 0.0
                         st.markdown(f"**{i}. {source}** (页码: {page}, 相关度: {score:.4f})")
                         st.caption(doc.content[:300] + "...")
 
@@ -227,7 +260,9 @@ with tab1:
 
         with st.chat_message("assistant"):
             with st.spinner("正在思考与检索..."):
-                answer, sources = engine.answer(prompt, top_k=top_k, top_n=top_n, file_filters=selected_files)
+                answer, sources = engine.answer(prompt, top_k=top_k, top_n=top_n, file_filters=selected_files,
+                                                collections=selected_collections, min_score=min_score,
+                                                cache_answer=cache_answer)
             
             st.markdown(answer)
             
@@ -236,7 +271,7 @@ with tab1:
                     for i, doc in enumerate(sources, 1):
                         source = os.path.basename(doc.metadata.get("source", "未知来源"))
                         page = doc.metadata.get("page_number", "-")
-                        score = doc.metadata.get("rerank_score", 0.0)
+                        score = doc.score or 0.0
                         st.markdown(f"**{i}. {source}** (页码: {page}, 相关度: {score:.4f})")
                         st.caption(doc.content)
             
@@ -265,12 +300,16 @@ with tab2:
     with col2:
         st.subheader("⬆️ 上传新文档")
         uploaded_file = st.file_uploader("选择 PDF 或 HTML 文件", type=["pdf", "html"])
+        target_collection = None
+        if hasattr(engine.retriever.vector_store, 'collections'):
+            target_collection = st.selectbox(
+                "导入到分类", sorted(set(engine.retriever.vector_store.collections) | {DEFAULT_COLLECTION}))
         
         if uploaded_file:
             if st.button("开始导入", type="primary"):
                 try:
                     # Save
-                    file_path = save_uploaded_file(uploaded_file)
+                    file_path = save_uploaded_file(uploaded_file, target_collection)
                     # Ingest
                     ingest_file(file_path, engine)
                     st.rerun() # Refresh list
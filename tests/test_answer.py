@@ -0,0 +1,29 @@
+import pytest
+from unittest.mock import MagicMock
+
+pytest.importorskip("ollama")
+from src.kb.rag.answer import AnswerEngine
+from src.kb.rag.prompt import NO_EVIDENCE_ANSWER
+from src.kb.schema import Document
+
+
+def _engine(scores, min_score=0.5):
+    engine = AnswerEngine.__new__(AnswerEngine)
+    engine.retriever = MagicMock()
+    engine.retriever.retrieve.return_value = [Document(content=f"chunk {s}", score=s) for s in scores]
+    engine.llm = MagicMock()
+    engine.llm.generate.return_value = "An answer [Source: a.pdf]"
+    engine.min_score = min_score
+    engine.cache_answers = False
+    return engine
+
+
+def test_answer_refuses_weak_evidence_without_the_llm():
+    engine = _engine([0.2, 0.1])
+    answer, sources = engine.answer("q")
+    assert answer == NO_EVIDENCE_ANSWER and [d.score for d in sources] == [0.2, 0.1]
+    engine.llm.generate.assert_not_called()
+
+    # The threshold can be lowered per question
+    assert engine.answer("q", min_score=0.1)[0] == "An answer [Source: a.pdf]"
+    assert _engine([0.9, 0.1]).answer("q")[0] == "An answer [Source: a.pdf]"
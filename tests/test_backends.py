@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+from src.kb.embedding.backends import cache_namespace, cosine_parity, onnx_file
+from src.kb.index.vector_store import Embedder
+
+def test_onnx_file_resolves_exported_graphs(tmp_path):
+    (tmp_path / "onnx").mkdir()
+    with pytest.raises(FileNotFoundError, match="export_onnx"):
+        onnx_file(str(tmp_path), "onnx-int8")
+    
+    (tmp_path / "onnx" / "model.onnx").write_bytes(b"")
+    (tmp_path / "onnx" / "model_qint8_avx2.onnx").write_bytes(b"")
+    assert onnx_file(str(tmp_path), "onnx") == "onnx/model.onnx"
+    assert onnx_file(str(tmp_path), "onnx-int8") == "onnx/model_qint8_avx2.onnx"
+
+def test_embedder_backend_selection(tmp_path):
+    with patch("src.kb.index.vector_store.SentenceTransformer") as mock_st, \
+         patch("src.kb.index.vector_store.load_onnx_model") as mock_onnx:
+        torch_embedder = Embedder("m", cache_dir=str(tmp_path))
+        mock_st.assert_called_once_with("m")
+        assert torch_embedder.cache.model_name == "m"
+        
+        int8 = Embedder("m", cache_dir=str(tmp_path), backend="onnx-int8", model_dir="/models/m")
+        mock_onnx.assert_called_once_with("m", "onnx-int8", "/models/m")
+        assert int8.model is mock_onnx.return_value
+        # Quantized vectors never mix with fp32 ones in the embedding cache
+        assert int8.cache.model_name == cache_namespace("m", "onnx-int8") != "m"
+        
+        with pytest.raises(ValueError):
+            Embedder("m", backend="tensorrt")
+
+def test_cosine_parity():
+    a = np.array([[1.0, 0.0], [0.0, 2.0]])
+    b = np.array([[2.0, 0.0], [1.0, 1.0]])
+    np.testing.assert_allclose(cosine_parity(a, b), [1.0, np.sqrt(0.5)])
@@ -0,0 +1,172 @@
+import pickle
+import numpy as np
+from src.kb.chunking.dedup import NearDuplicateDetector
+from src.kb.index.chunk_store import ChunkStore, chunk_vector_id
+from src.kb.index.vector_store import VectorStore
+from src.kb.schema import Document
+
+def _docs(source, n, start=0):
+    return [Document(content=f"{source} chunk {i}", metadata={"source": source, "file_name": source, "page_number": 1, "chunk_id": f"{source}_1_{i}"})
+            for i in range(start, start + n)]
+
+def _vecs(n, dim=4, seed=0):
+    v = np.random.RandomState(seed).randn(n, dim).astype("float32")
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+def test_changes_are_staged_until_save(tmp_path):
+    path = str(tmp_path / "idx")
+    store = VectorStore(index_path=path)
+    store.add_documents(_docs("a.pdf", 3), _vecs(3))
+    assert len(store.metadata) == 3
+    assert len(ChunkStore(path)) == 0
+    
+    store.save()
+    reopened = VectorStore(index_path=path)
+    assert len(reopened.metadata) == 3
+    assert reopened.metadata[2].content == "a.pdf chunk 2"
+    assert reopened.metadata[-1] is reopened.metadata[2]  # identity map while referenced
+
+def test_delete_keeps_index_and_store_in_step(tmp_path):
+    path = str(tmp_path / "idx")
+    vectors = _vecs(9)
+    store = VectorStore(index_path=path)
+    store.add_documents(_docs("a.pdf", 3) + _docs("b.pdf", 3), vectors[:6])
+    store.save()
+    
+    # Committed and staged rows deleted and added in one go
+    store.add_documents(_docs("c.pdf", 3), vectors[6:])
+    assert store.delete_by_source(["a.pdf", "c.pdf"]) == 6
+    assert [d.content for d in store.metadata] == ["b.pdf chunk 0", "b.pdf chunk 1", "b.pdf chunk 2"]
+    store.save()
+    
+    reopened = VectorStore(index_path=path)
+    assert reopened.index.ntotal == len(reopened.metadata) == 3
+    for i in range(3, 6):
+        assert reopened.search(vectors[i], top_k=1)[0].content == f"b.pdf chunk {i - 3}"
+    assert reopened.get_indexed_files() == [{"filename": "b.pdf", "chunks": 3}]
+
+def test_legacy_pickle_is_migrated(tmp_path):
+    legacy = VectorStore(index_path=str(tmp_path / "idx"))
+    legacy.add_documents(_docs("a.pdf", 2), _vecs(2))
+    legacy.save()
+    (tmp_path / "idx" / "chunks.sqlite").unlink()
+    for suffix in ("-wal", "-shm"):
+        (tmp_path / "idx" / f"chunks.sqlite{suffix}").unlink(missing_ok=True)
+    with open(tmp_path / "idx" / "metadata.pkl", "wb") as f:
+        pickle.dump(_docs("a.pdf", 2), f)
+    
+    store = VectorStore(index_path=str(tmp_path / "idx"))
+    assert [d.content for d in store.metadata] == ["a.pdf chunk 0", "a.pdf chunk 1"]
+    assert not (tmp_path / "idx" / "metadata.pkl").exists()
+
+def test_duplicates_found_after_flush_are_written_back(tmp_path):
+    path = str(tmp_path / "idx")
+    detector = NearDuplicateDetector()
+    store = VectorStore(index_path=path)
+    first = detector.filter(_docs("a.pdf", 1))
+    store.add_documents(first, _vecs(1))
+    store.save()
+    
+    # A later file repeats the chunk after it was already saved
+    copy = Document(content="a.pdf chunk 0", metadata={"source": "b.pdf", "chunk_id": "b.pdf_1_0"})
+    assert detector.filter([copy]) == []
+    store.update_documents(detector.pop_updated())
+    store.save()
+    
+    reopened = VectorStore(index_path=path)
+    assert [d["source"] for d in reopened.metadata[0].metadata["duplicates"]] == ["b.pdf"]
+    # Deleting the primary promotes the duplicate found through the indexed table
+    assert reopened.delete_by_source("a.pdf") == 0
+    assert reopened.metadata[0].metadata["source"] == "b.pdf"
+
+def test_ids_for_files_sees_staged_changes(tmp_path):
+    path = str(tmp_path / "idx")
+    store = VectorStore(index_path=path)
+    a_docs, b_docs, other_a = _docs("dir/a.pdf", 2), _docs("dir/b.pdf", 2), _docs("other/a.pdf", 1)
+    store.add_documents(a_docs + b_docs, _vecs(4))
+    store.save()
+    store.add_documents(other_a, _vecs(1, seed=1))
+    ids = lambda docs: {chunk_vector_id(d) for d in docs}
+    assert set(store.ids_for_files(["a.pdf"])) == ids(a_docs + other_a)
+    
+    store.delete_by_source("dir/a.pdf")
+    assert set(store.ids_for_files(["a.pdf"])) == ids(other_a)
+    assert set(store.ids_for_files(["b.pdf"])) == ids(b_docs)
+    store.save()
+    assert set(VectorStore(index_path=path).ids_for_files(["a.pdf", "missing.pdf"])) == ids(other_a)
+
+def test_files_held_only_as_duplicates_can_be_selected(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "idx")
+    detector = NearDuplicateDetector()
+    texts = ["The pump P-2041 overheats when the seal wears out", "Replace the valve every six months of service"]
+    docs = [Document(content=t, metadata={"source": "a.pdf", "chunk_id": f"a.pdf_1_{i}"}) for i, t in enumerate(texts)]
+    copy = Document(content=texts[0], metadata={"source": "dir/b.pdf", "chunk_id": "b.pdf_1_0"})
+    kept = detector.filter(docs + [copy])
+    store = VectorStore(index_path=path)
+    store.add_documents(kept, _vecs(2))
+    # Staged, then committed: b.pdf's only chunk is the one stored for a.pdf
+    assert store.ids_for_files(["b.pdf"]) == [chunk_vector_id(kept[0])]
+    store.save()
+    reopened = VectorStore(index_path=path)
+    assert reopened.ids_for_files(["b.pdf"]) == [chunk_vector_id(kept[0])]
+    assert sorted(map(tuple, (f.values() for f in reopened.get_indexed_files()))) == [("a.pdf", 2), ("b.pdf", 1)]
+    reopened.chunks.close()
+
+    # Stores from before duplicate file names were kept are filled in when opened
+    db = sqlite3.connect(tmp_path / "idx" / "chunks.sqlite")
+    db.executescript("DROP INDEX duplicate_sources_file_name; ALTER TABLE duplicate_sources DROP COLUMN file_name; "
+                     "ALTER TABLE duplicate_sources DROP COLUMN source;")
+    db.close()
+    assert VectorStore(index_path=path).ids_for_files(["b.pdf"]) == [chunk_vector_id(kept[0])]
+
+def test_row_addressed_store_is_migrated_to_ids(tmp_path):
+    import faiss, json, sqlite3
+    path = tmp_path / "idx"
+    path.mkdir()
+    docs = _docs("a.pdf", 2) + _docs("a.pdf", 1)  # the same chunk stored twice (old re-upload)
+    vectors = _vecs(3)
+    db = sqlite3.connect(path / "chunks.sqlite")
+    db.execute("CREATE TABLE chunks (id INTEGER PRIMARY KEY AUTOINCREMENT, row INTEGER NOT NULL UNIQUE, source TEXT, "
+               "source_key TEXT, file_name TEXT, page_number INTEGER, chunk_id TEXT, content TEXT NOT NULL, metadata TEXT NOT NULL)")
+    for row, doc in enumerate(docs):
+        db.execute("INSERT INTO chunks (row, source, source_key, file_name, page_number, chunk_id, content, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                   (row, "a.pdf", "a.pdf", None, 1, doc.metadata["chunk_id"], doc.content, json.dumps(doc.metadata)))
+    db.commit()
+    db.close()
+    index = faiss.IndexFlatIP(4)
+    index.add(vectors)
+    faiss.write_index(index, str(path / "index.faiss"))
+    
+    store = VectorStore(index_path=str(path))
+    assert len(store.metadata) == store.index.ntotal == 3
+    assert store.search(vectors[1], top_k=1)[0].content == "a.pdf chunk 1"
+    assert store.ids_for_files(["a.pdf"]) and store.delete_by_source("a.pdf") == 3
+    store.save()
+    assert not (path / "index.faiss").exists()
+
+def test_single_file_index_becomes_a_segment(tmp_path):
+    import faiss, json
+    path = tmp_path / "idx"
+    path.mkdir()
+    docs, vectors = _docs("a.pdf", 3), _vecs(3)
+    ids = [chunk_vector_id(d) for d in docs]
+    chunks = ChunkStore(str(path))
+    chunks.put(ids, docs)
+    chunks.commit()
+    chunks.close()
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(4))
+    index.add_with_ids(vectors, np.array(ids, dtype="int64"))
+    faiss.write_index(index, str(path / "index.faiss"))
+    (path / "index.json").write_text(json.dumps({"precision": "fp32", "dim": None, "index_type": "flat", "built_type": "flat",
+                                                  "params": {"ef_search": 64}, "ids": True, "tombstones": []}))
+    
+    store = VectorStore(index_path=str(path))
+    assert store.index_params["ef_search"] == 64
+    store.add_documents(_docs("b.pdf", 1), _vecs(1, seed=1))
+    store.save()
+    # The old file is used as it is; its settings move to the manifest in chunks.sqlite
+    assert (path / "index.faiss").exists() and not (path / "index.json").exists()
+    reopened = VectorStore(index_path=str(path))
+    assert len(reopened.index.segments) == 2 and reopened.index_params["ef_search"] == 64
+    assert reopened.search(vectors[1], top_k=1)[0].content == "a.pdf chunk 1"
@@ -70,3 +70,35 @@ def test_chunker_paragraphs():
     
     # Just ensure it runs without error and splits reasonable
     assert len(chunks_small) > 1
+
+def test_chunker_matches_golden_boundaries():
+    """Chunk boundaries must match the recorded output of the original recursive splitter."""
+    import json
+    import os
+    
+    with open(os.path.join(os.path.dirname(__file__), "data", "chunker_golden.json"), encoding="utf-8") as f:
+        golden = json.load(f)
+    
+    for size, overlap in golden["configs"]:
+        chunker = Chunker(chunk_size=size, chunk_overlap=overlap)
+        for name, text in golden["cases"].items():
+            chunks = chunker.split_documents([Document(content=text, metadata={})])
+            assert [c.content for c in chunks] == golden["expected"][f"{name}|{size}|{overlap}"], (name, size, overlap)
+
+def test_chunker_threads_keep_order_and_ids():
+    """Threaded, batched tokenization gives exactly the serial output."""
+    pages = [
+        Document(
+            content="\n".join(f"Page {p} line {i}: " + "token " * (i % 17) for i in range(60)),
+            metadata={"file_name": "doc.pdf", "page_number": p},
+        )
+        for p in range(1, 12)
+    ]
+    chunker = Chunker(chunk_size=40, chunk_overlap=10)
+    
+    serial = chunker.split_documents(pages)
+    threaded = chunker.split_documents(pages, num_threads=4, batch_size=3)
+    
+    assert [c.content for c in threaded] == [c.content for c in serial]
+    assert [c.metadata["chunk_id"] for c in threaded] == [c.metadata["chunk_id"] for c in serial]
+    assert threaded[0].metadata["chunk_id"] == "doc.pdf_1_0"
@@ -0,0 +1,76 @@
+import random
+import numpy as np
+from src.kb.chunking.dedup import NearDuplicateDetector
+from src.kb.index.vector_store import VectorStore
+from src.kb.schema import Document
+
+def _chunk(text, source, page=1, idx=0):
+    name = source.split("/")[-1]
+    return Document(content=text, metadata={"source": source, "file_name": name, "page_number": page, "chunk_id": f"{name}_{page}_{idx}"})
+
+def _text(seed, n_words=120):
+    rng = random.Random(seed)
+    words = "power supply ripple voltage current datasheet errata register timing clock 电源 纹波 电压".split()
+    return " ".join(rng.choice(words) + str(rng.randint(0, 99)) for _ in range(n_words))
+
+def test_exact_and_near_duplicates_are_collapsed():
+    detector = NearDuplicateDetector(threshold=0.8)
+    base = _text(1)
+    near = base.replace("clock", "CLK", 1) + " rev B"
+    
+    chunks = [
+        _chunk(base, "raw/a.pdf", 1),
+        _chunk(_text(2), "raw/a.pdf", 2),
+        _chunk("  " + base.upper() + "\n", "raw/b.pdf", 3),  # same after normalisation
+        _chunk(near, "raw/c.pdf", 7),
+    ]
+    unique = detector.filter(chunks)
+    
+    assert [c.metadata["source"] for c in unique] == ["raw/a.pdf", "raw/a.pdf"]
+    dups = unique[0].metadata["duplicates"]
+    assert [d["source"] for d in dups] == ["raw/b.pdf", "raw/c.pdf"]
+    assert dups[1]["page_number"] == 7
+    assert "duplicates" not in unique[1].metadata
+    
+    assert detector.stats.chunks == 4
+    assert detector.stats.duplicates == 2
+    assert detector.stats.exact == 1
+    assert detector.stats.saved_ratio == 0.5
+
+def test_distinct_chunks_survive_across_calls():
+    detector = NearDuplicateDetector()
+    first = detector.filter([_chunk(_text(i), f"raw/{i}.pdf") for i in range(20)])
+    assert len(first) == 20
+    # State persists between batches of the same run
+    second = detector.filter([_chunk(_text(3), "raw/again.pdf"), _chunk("短文本", "raw/short.pdf")])
+    assert [c.metadata["source"] for c in second] == ["raw/short.pdf"]
+
+def test_signature_similarity_tracks_jaccard():
+    detector = NearDuplicateDetector()
+    a = detector.signature(_text(5))
+    b = detector.signature(_text(5)[:-40])
+    c = detector.signature(_text(6))
+    assert np.mean(a == b) > 0.8
+    assert np.mean(a == c) < 0.3
+
+def test_delete_promotes_surviving_duplicate(tmp_path):
+    detector = NearDuplicateDetector()
+    text = _text(9)
+    unique = detector.filter([_chunk(text, "raw/a.pdf", 1), _chunk(text, "raw/b.pdf", 4), _chunk(text, "raw/c.pdf", 2)])
+    
+    store = VectorStore(index_path=str(tmp_path / "idx"))
+    store.add_documents(unique, np.array([[1.0, 0.0]], dtype="float32"))
+    
+    # Deleting the primary keeps the vector, now pointing at b.pdf
+    assert store.delete_by_source("raw/a.pdf") == 0
+    doc = store.metadata[0]
+    assert doc.metadata["source"] == "raw/b.pdf"
+    assert doc.metadata["page_number"] == 4
+    assert [d["source"] for d in doc.metadata["duplicates"]] == ["raw/c.pdf"]
+    
+    # Deleting a duplicate only drops the reference
+    store.delete_by_source("raw/c.pdf")
+    assert "duplicates" not in doc.metadata
+    
+    assert store.delete_by_source("raw/b.pdf") == 1
+    assert store.index.ntotal == 0
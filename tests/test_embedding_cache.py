@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+from src.kb.embedding.cache import EmbeddingCache
+from src.kb.index.vector_store import Embedder
+from src.kb.schema import Document
+
+def _vecs(n, dim=4, offset=0):
+    return np.arange(offset, offset + n * dim, dtype=np.float32).reshape(n, dim)
+
+def test_cache_roundtrip_and_normalisation(tmp_path):
+    cache = EmbeddingCache("BAAI/bge-m3", str(tmp_path))
+    vectors, keys = cache.get_many(["alpha beta", "gamma"])
+    assert vectors == [None, None]
+    
+    cache.put_many(keys, _vecs(2))
+    
+    reopened = EmbeddingCache("BAAI/bge-m3", str(tmp_path))
+    # Whitespace differences hit the same entry
+    vectors, _ = reopened.get_many(["  alpha\n beta ", "gamma", "delta"])
+    np.testing.assert_array_equal(vectors[0], _vecs(2)[0])
+    np.testing.assert_array_equal(vectors[1], _vecs(2)[1])
+    assert vectors[2] is None
+    assert reopened.hits == 2 and reopened.misses == 1
+    
+    # Different model -> separate cache
+    other = EmbeddingCache("other-model", str(tmp_path))
+    assert other.get_many(["gamma"])[0] == [None]
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    dim = 4
+    # Room for 10 rows (16-byte key + vector each); eviction keeps 8
+    record = EmbeddingCache.KEY_BYTES + dim * 4
+    cache = EmbeddingCache("m", str(tmp_path), max_bytes=10 * record)
+    texts = [f"text {i}" for i in range(10)]
+    _, keys = cache.get_many(texts)
+    cache.put_many(keys, _vecs(10))
+    
+    # Touch the oldest entries so they survive
+    cache.get_many(texts[:3])
+    _, new_keys = cache.get_many(["new 1", "new 2"])
+    cache.put_many(new_keys, _vecs(2, offset=1000))
+    
+    assert len(cache) == 8
+    assert cache.nbytes == 8 * record
+    vectors, _ = cache.get_many(texts[:3] + ["new 2"])
+    np.testing.assert_array_equal(vectors[0], _vecs(10)[0])
+    np.testing.assert_array_equal(vectors[3], _vecs(2, offset=1000)[1])
+    # Some of the untouched originals were dropped
+    dropped, _ = cache.get_many(texts[3:])
+    assert any(v is None for v in dropped)
+
+def test_cache_shared_by_writers(tmp_path):
+    # Two handles on one cache, as two processes would have
+    first = EmbeddingCache("m", str(tmp_path))
+    second = EmbeddingCache("m", str(tmp_path))
+    _, keys = first.get_many(["a", "b"])
+    first.put_many(keys, _vecs(2))
+    _, other_keys = second.get_many(["c"])
+    second.put_many(other_keys, _vecs(1, offset=100))
+    vectors, _ = first.get_many(["a", "b", "c"])
+    np.testing.assert_array_equal(np.array(vectors), np.concatenate([_vecs(2), _vecs(1, offset=100)]))
+
+    # A compaction elsewhere renumbers rows: stale row numbers miss rather than return another text's vector
+    second.get_many(["c"])
+    second.evict(EmbeddingCache.KEY_BYTES + 4 * 4)
+    assert len(second) == 1
+    vectors, _ = first.get_many(["a", "c"])
+    assert vectors[0] is None
+    np.testing.assert_array_equal(vectors[1], _vecs(1, offset=100)[0])
+    # Even a row number read just before the compaction
+    with first._db:
+        first._db.execute("INSERT INTO entries (key, row, last_used) VALUES (?, 0, 0)", (keys[0],))
+    assert first.get_many(["a"])[0] == [None]
+
+def test_embedder_only_encodes_new_text(tmp_path):
+    with patch("src.kb.index.vector_store.SentenceTransformer") as mock_st:
+        encoded = []
+        def fake_encode(texts, **kwargs):
+            encoded.extend(texts)
+            return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+        mock_st.return_value.encode.side_effect = fake_encode
+        mock_st.return_value.tokenizer = None
+        
+        embedder = Embedder("fake_model", cache_dir=str(tmp_path))
+        docs = [Document(content=t) for t in ["one", "two", "three"]]
+        first = embedder.embed_documents(docs)
+        assert sorted(encoded) == ["one", "three", "two"]
+        
+        encoded.clear()
+        second = embedder.embed_documents([Document(content="four")] + docs)
+        assert encoded == ["four"]
+        np.testing.assert_array_equal(second[1:], first)
+        assert second.dtype == np.float32
+
+def test_query_cache_lru_and_persistence(tmp_path):
+    with patch("src.kb.index.vector_store.SentenceTransformer") as mock_st:
+        calls = []
+        def fake_encode(texts, **kwargs):
+            calls.extend(texts)
+            return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+        mock_st.return_value.encode.side_effect = fake_encode
+        
+        embedder = Embedder("fake_model", cache_dir=str(tmp_path), query_cache_size=2)
+        first = embedder.embed_query("What is RAG?")
+        # Normalised text hits the same entry
+        np.testing.assert_array_equal(embedder.embed_query("  What is   RAG? "), first)
+        assert calls == ["What is RAG?"]
+        assert (embedder.query_cache.hits, embedder.query_cache.misses) == (1, 1)
+        
+        embedder.embed_query("q2")
+        embedder.embed_query("q3")
+        assert len(embedder.query_cache) == 2
+        
+        # A new process (fresh Embedder) is served from the persisted entries
+        calls.clear()
+        other = Embedder("fake_model", cache_dir=str(tmp_path))
+        np.testing.assert_array_equal(other.embed_query("What is RAG?"), first)
+        assert calls == []
+        assert other.query_cache.hits == 1
@@ -0,0 +1,70 @@
+import os
+import multiprocessing
+import numpy as np
+import pytest
+from unittest.mock import patch
+from src.kb.embedding.pool import EmbeddingPool, parse_size, workers_within_limit
+from src.kb.index.vector_store import Embedder
+from src.kb.schema import Document
+
+pytestmark = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(), reason="needs fork start method"
+)
+
+class FakeModel:
+    tokenizer = None
+    
+    def get_sentence_embedding_dimension(self):
+        return 3
+    
+    def encode(self, texts, **kwargs):
+        if any("crash" in t for t in texts):
+            os._exit(1)
+        return np.array([[len(t), os.getpid() % 7, 1.0] for t in texts], dtype=np.float32)
+
+def fake_loader(model_name, backend, model_dir):
+    return FakeModel()
+
+def _pool(workers=2):
+    return EmbeddingPool("fake", workers, loader=fake_loader, mp_context=multiprocessing.get_context("fork"))
+
+def test_pool_returns_vectors_in_input_order():
+    texts = [f"t{'x' * i}" for i in range(20)]
+    batches = [list(range(i, 20, 5)) for i in range(5)]
+    with _pool() as pool:
+        out = pool.encode(texts, batches)
+        assert out.dtype == np.float32 and out.shape == (20, 3)
+        np.testing.assert_array_equal(out[:, 0], [len(t) for t in texts])
+        # Buffer is reused (and grown) across calls
+        out = pool.encode(texts * 3, [list(range(60))])
+        np.testing.assert_array_equal(out[:, 0], [len(t) for t in texts * 3])
+
+def test_pool_surfaces_worker_crash():
+    pool = _pool()
+    with pytest.raises(RuntimeError):
+        pool.encode(["ok", "crash"], [[0], [1]])
+    assert pool.closed
+
+def test_memory_ceiling_limits_workers():
+    assert parse_size("2G") == 2 << 30 and parse_size("512m") == 512 << 20 and parse_size("100") == 100
+    per_worker = 1000 + 10 * 3 * 64
+    assert workers_within_limit(8, 1000, 3, 10, None) == 8
+    assert workers_within_limit(8, 1000, 3, 10, 3 * per_worker) == 3
+    assert workers_within_limit(8, 1000, 3, 10, per_worker - 1) == 0
+
+def test_embedder_bulk_mode_matches_in_process():
+    with patch("src.kb.index.vector_store.SentenceTransformer", return_value=FakeModel()):
+        embedder = Embedder("fake", max_batch_tokens=64)
+        docs = [Document(content="word " * (i % 7 + 1), metadata={}) for i in range(30)]
+        expected = embedder.embed_documents(docs, show_progress_bar=False)
+        
+        # Too little memory: stays in-process
+        assert embedder.start_pool(4, memory_limit=1) == 0 and embedder.pool is None
+        
+        assert embedder.start_pool(2, memory_limit=1 << 40, loader=fake_loader,
+                                   mp_context=multiprocessing.get_context("fork")) == 2
+        try:
+            pooled = embedder.embed_documents(docs, show_progress_bar=False)
+            np.testing.assert_array_equal(pooled[:, 0], expected[:, 0])
+        finally:
+            embedder.stop_pool()
@@ -0,0 +1,93 @@
+import numpy as np
+from unittest.mock import MagicMock
+import src.kb.index.lexical as lexical
+from src.kb.index.lexical import decode_varints, encode_varints, reciprocal_rank_fusion, tokenize
+from src.kb.index.chunk_store import ChunkStore
+from src.kb.index.vector_store import VectorStore
+from src.kb.retrieve.retriever import Retriever
+from src.kb.schema import Document
+
+
+def test_tokenize_identifiers_and_cjk():
+    assert tokenize("Error ERR_CONN_RESET at os.path.join") == [
+        "error", "err_conn_reset", "at", "os.path.join", "os", "path", "join"]
+    # CJK runs become bigrams; full-width characters are normalised
+    assert tokenize("数据库连接失败：ＡＢ－１２") == ["数据", "据库", "库连", "连接", "接失", "失败", "ab-12", "ab", "12"]
+    assert tokenize("中 x") == ["中", "x"]
+
+
+def test_varints_round_trip():
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2 ** 40, 7], dtype=np.int64)
+    data = encode_varints(values)
+    assert len(data) == 1 + 1 + 1 + 2 + 2 + 2 + 3 + 6 + 1
+    assert decode_varints(data).tolist() == values.tolist()
+    assert decode_varints(encode_varints(np.empty(0, dtype=np.int64))).tolist() == []
+
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]]) == ["c", "a", "b", "d"]
+
+
+def _chunks(source, texts):
+    return [Document(content=t, metadata={"source": source, "chunk_id": str(i)}) for i, t in enumerate(texts)]
+
+
+def test_lexical_search_follows_commits(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical, "MAX_BLOCKS", 2)
+    store = ChunkStore(str(tmp_path))
+    store.extend(_chunks("a.pdf", ["The pump P-2041 overheats", "Replace the seal kit", "泵体温度过高时停机"]))
+    store.extend(_chunks("b.pdf", ["Pump maintenance schedule", "Error E1042 on startup"]))
+    # Only committed chunks are indexed
+    assert len(store.lexical_search("p-2041", 5)[1]) == 0
+    store.commit()
+
+    def found(query, k=5, ids=None):
+        return [d.content for d in store.get_many(store.lexical_search(query, k, ids)[1])]
+    assert found("P-2041") == ["The pump P-2041 overheats"]
+    assert found("error e1042")[0] == "Error E1042 on startup"
+    assert found("温度过高") == ["泵体温度过高时停机"]
+    assert found("pump") == ["Pump maintenance schedule", "The pump P-2041 overheats"]
+    assert found("pump", ids=store.ids_for_files(["a.pdf"])) == ["The pump P-2041 overheats"]
+
+    # Deleted chunks drop out at once, and from the postings when a term's blocks are merged
+    store.delete(store.ids_for_sources({"b.pdf"}))
+    store.commit()
+    assert found("pump") == ["The pump P-2041 overheats"]
+    # BM25 collection stats follow this connection's own deletions
+    assert store.lexical._collection_stats()[0] == 3
+    for i in range(3):
+        store.extend(_chunks(f"c{i}.pdf", [f"pump unit {i}"]))
+        store.commit()
+    blocks = store._db.execute("SELECT COUNT(*) FROM lexical_postings WHERE term = 'pump'").fetchone()[0]
+    assert blocks <= 2
+    assert len(found("pump", k=10)) == 4
+
+    # A store from before the lexical index is indexed when opened
+    store._db.executescript("DELETE FROM lexical_postings; DELETE FROM lexical_lengths;")
+    store.close()
+    reopened = ChunkStore(str(tmp_path))
+    assert [d.content for d in reopened.get_many(reopened.lexical_search("seal", 5)[1])] == ["Replace the seal kit"]
+
+
+def test_hybrid_retrieval_finds_exact_identifiers(tmp_path):
+    rng = np.random.RandomState(0)
+    docs = [Document(content=f"general note {i} about maintenance", metadata={"source": f"{i}.pdf"}) for i in range(50)]
+    docs.append(Document(content="Fault code XJ-9 means the valve is stuck", metadata={"source": "codes.pdf"}))
+    vectors = rng.randn(len(docs), 16).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors[-1] = -vectors[0]
+    store = VectorStore(index_path=str(tmp_path / "idx"))
+    store.add_documents(docs, vectors)
+    store.save()
+    embedder = MagicMock()
+    # The query embedding lands on unrelated chunks
+    embedder.embed_query.return_value = vectors[0]
+
+    dense = Retriever(embedder, store, hybrid=False).retrieve("what is XJ-9", top_k=5, top_n=5, use_rerank=False)
+    hybrid = Retriever(embedder, store).retrieve("what is XJ-9", top_k=5, top_n=5, use_rerank=False)
+    assert all("XJ-9" not in d.content for d in dense)
+    assert len(hybrid) == 5 and any("XJ-9" in d.content for d in hybrid)
+    assert hybrid[0].content == dense[0].content
+    # Fused results are scored by reciprocal rank fusion, best first
+    assert all(1 / 66 <= d.score <= 2 / 61 for d in hybrid) and [d.score for d in hybrid] == sorted((d.score for d in hybrid), reverse=True)
+    assert store.lexical_search("XJ-9", top_k=1)[0].score > 0
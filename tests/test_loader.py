@@ -0,0 +1,67 @@
+import os
+import time
+import multiprocessing
+import pytest
+from src.kb.ingestion.loader import ParallelLoader, iter_load_documents, LOADERS
+from src.kb.schema import Document
+
+# Fake loaders are registered in the parent and inherited by forked workers
+pytestmark = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(), reason="needs fork start method"
+)
+
+def _ok(file_path):
+    time.sleep(0.05 if "slow" in file_path else 0)
+    return [Document(content=os.path.basename(file_path), metadata={"source": file_path})]
+
+def _boom(file_path):
+    raise ValueError("bad file")
+
+def _hang(file_path):
+    while True:
+        pass
+
+def _crash(file_path):
+    os._exit(1)
+
+@pytest.fixture
+def fake_loaders(monkeypatch):
+    for ext, fn in {".ok": _ok, ".boom": _boom, ".hang": _hang, ".crash": _crash}.items():
+        monkeypatch.setitem(LOADERS, ext, fn)
+
+def _fork_loader(**kwargs):
+    return ParallelLoader(mp_context=multiprocessing.get_context("fork"), **kwargs)
+
+def test_parallel_loader_keeps_input_order(fake_loaders):
+    paths = [f"{'slow' if i % 3 == 0 else 'fast'}_{i}.ok" for i in range(12)]
+    with _fork_loader(workers=4) as loader:
+        results = list(loader.load(paths))
+    
+    assert [r.file_path for r in results] == paths
+    assert all(r.ok for r in results)
+    assert results[5].documents[0].content == paths[5]
+
+def test_parallel_loader_reports_errors_and_timeouts(fake_loaders):
+    paths = ["a.ok", "b.boom", "c.hang", "d.ok"]
+    with _fork_loader(workers=2, timeout=0.5) as loader:
+        results = list(loader.load(paths))
+    
+    assert [r.file_path for r in results] == paths
+    assert results[0].ok and results[3].ok
+    assert "ValueError: bad file" in results[1].error
+    assert "timed out" in results[2].error
+
+def test_parallel_loader_isolates_crashes(fake_loaders):
+    paths = ["a.ok", "b.crash", "c.ok", "d.ok", "e.ok"]
+    with _fork_loader(workers=2, timeout=5) as loader:
+        results = list(loader.load(paths))
+    
+    assert [r.file_path for r in results] == paths
+    assert results[1].error == "worker process crashed"
+    assert all(r.ok for i, r in enumerate(results) if i != 1)
+
+def test_serial_mode(fake_loaders):
+    results = list(iter_load_documents(["x.ok", "y.boom", "z.unknown"], workers=0))
+    assert results[0].documents[0].content == "x.ok"
+    assert not results[1].ok
+    assert results[2].ok and results[2].documents == []
@@ -0,0 +1,70 @@
+import os
+import pytest
+from src.kb.ingestion.manifest import IngestManifest, file_sha256
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def test_manifest_plan_and_roundtrip(tmp_path):
+    data_dir = tmp_path / "raw"
+    data_dir.mkdir()
+    a = str(data_dir / "a.html")
+    b = str(data_dir / "b.html")
+    _write(a, "<p>alpha</p>")
+    _write(b, "<p>beta</p>")
+    
+    manifest_path = str(tmp_path / "index" / "manifest.json")
+    manifest = IngestManifest(manifest_path)
+    
+    # 1. Everything is new on the first run
+    plan = manifest.plan([a, b], scope=str(data_dir))
+    assert plan.new == [a, b]
+    assert plan.changed == [] and plan.deleted == []
+    
+    manifest.record(a, ["a.html_0_0"])
+    manifest.record(b, ["b.html_0_0", "b.html_0_1"])
+    manifest.save()
+    
+    # 2. Reloaded manifest sees both as unchanged
+    reloaded = IngestManifest(manifest_path)
+    assert reloaded.get(b).chunk_ids == ["b.html_0_0", "b.html_0_1"]
+    plan = reloaded.plan([a, b], scope=str(data_dir))
+    assert plan.unchanged == [a, b]
+    assert plan.to_ingest == []
+
+def test_manifest_detects_changes_and_deletions(tmp_path):
+    data_dir = tmp_path / "raw"
+    data_dir.mkdir()
+    a = str(data_dir / "a.html")
+    b = str(data_dir / "b.html")
+    _write(a, "<p>alpha</p>")
+    _write(b, "<p>beta</p>")
+    
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    manifest.record(a, ["a"])
+    manifest.record(b, ["b"])
+    
+    # Touched only: same content, new mtime -> still unchanged, stat refreshed
+    os.utime(a, (1, 1))
+    # Real change
+    _write(b, "<p>beta, revised and longer</p>")
+    
+    plan = manifest.plan([a], scope=str(data_dir))
+    assert plan.unchanged == [a]
+    assert manifest.get(a).mtime == 1
+    # b was not passed in -> deleted
+    assert plan.deleted == [b]
+    
+    plan = manifest.plan([a, b], scope=str(data_dir))
+    assert plan.changed == [b]
+    assert plan.hashes  # hash computed once while planning
+    
+    # Without a scope, nothing is reported as deleted
+    plan = manifest.plan([a], scope=None)
+    assert plan.deleted == []
+
+def test_file_sha256(tmp_path):
+    path = tmp_path / "x.txt"
+    path.write_bytes(b"abc")
+    assert file_sha256(str(path)) == "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
@@ -0,0 +1,89 @@
+import threading
+import numpy as np
+import pytest
+from unittest.mock import patch
+from src.kb.index.vector_store import Embedder
+from src.kb.retrieve.retriever import Reranker
+from src.kb.schema import Document
+from src.kb.serving.model_server import MicroBatcher, ModelServer, connect
+
+def fake_encode(texts, **kwargs):
+    return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setenv("KB_MODEL_SERVER", f"unix:{tmp_path / 'models.sock'}")
+    monkeypatch.setenv("KB_MODEL_SERVER_KEY", str(tmp_path / "models.key"))
+    (tmp_path / "models.key").write_bytes(b"secret")
+    
+    with patch("src.kb.index.vector_store.SentenceTransformer") as mock_st, \
+         patch("src.kb.retrieve.retriever.CrossEncoder") as mock_ce:
+        mock_st.return_value.encode.side_effect = fake_encode
+        mock_st.return_value.tokenizer = None
+        mock_ce.return_value.predict.side_effect = lambda pairs, **kw: np.array([float(len(d)) for _, d in pairs])
+        embedder = Embedder("m", use_server=False)
+        reranker = Reranker("r", use_server=False)
+        model_server = ModelServer(embedder, reranker, max_wait=0.05)
+        ready = threading.Event()
+        threading.Thread(target=model_server.serve_forever, args=(str(tmp_path / "models.sock"), b"secret", ready), daemon=True).start()
+        ready.wait(5)
+        mock_st.reset_mock()
+        mock_ce.reset_mock()
+        yield model_server, mock_st, mock_ce
+        model_server.shutdown()
+
+def test_clients_use_running_server(server):
+    model_server, mock_st, mock_ce = server
+    embedder = Embedder("m")
+    reranker = Reranker("r")
+    # No local models were loaded
+    assert embedder.remote is not None and reranker.remote is not None
+    mock_st.assert_not_called()
+    mock_ce.assert_not_called()
+    
+    np.testing.assert_array_equal(embedder.embed_query("abc"), [3.0, 1.0])
+    vectors = embedder.embed_documents([Document(content="x" * n) for n in (1, 5, 2)])
+    np.testing.assert_array_equal(vectors[:, 0], [1, 5, 2])
+    
+    docs = [Document(content="short"), Document(content="much longer text")]
+    assert reranker.rerank("q", docs, top_n=1)[0].content == "much longer text"
+
+def test_other_model_or_no_server_loads_in_process(server, tmp_path, monkeypatch):
+    assert connect("embedder", "other-model") is None
+    monkeypatch.setenv("KB_MODEL_SERVER", "off")
+    assert connect("embedder", "m") is None
+
+def test_micro_batcher_coalesces_concurrent_requests():
+    calls = []
+    def fn(items):
+        calls.append(list(items))
+        return [i * 10 for i in items]
+    batcher = MicroBatcher(fn, max_wait=0.2)
+    futures = [batcher.submit([i, i + 100]) for i in range(3)]
+    assert [f.result(5) for f in futures] == [[0, 1000], [10, 1010], [20, 1020]]
+    assert len(calls) == 1
+
+def test_concurrent_threads_share_a_batch(server):
+    model_server, _, _ = server
+    embedder = Embedder("m")
+    start = threading.Barrier(4)
+    results = {}
+    def ask(n):
+        start.wait()
+        results[n] = embedder.embed_query("x" * n)
+    threads = [threading.Thread(target=ask, args=(n,)) for n in range(1, 5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert {n: v[0] for n, v in results.items()} == {1: 1.0, 2: 2.0, 3: 3.0, 4: 4.0}
+    # One connection per thread: the requests met in the server's batcher
+    assert model_server._batchers["embed_queries"].calls < 4
+
+def test_rerank_batch_is_one_server_request(server):
+    model_server, _, mock_ce = server
+    reranker = Reranker("r")
+    docs = [[Document(content="short"), Document(content="much longer text")], [], [Document(content="abc")]]
+    results = reranker.rerank_batch(["q1", "q2", "q3"], docs, top_n=1)
+    assert [[d.content for d in r] for r in results] == [["much longer text"], [], ["abc"]]
+    assert model_server._batchers["rerank"].calls == 1 and mock_ce.return_value.predict.call_count == 1
@@ -0,0 +1,81 @@
+import pytest
+from src.kb.ingestion import loader as loader_mod
+from src.kb.ingestion.cache import ParsedTextCache
+from src.kb.ingestion.loader import LOADERS, load_file
+from src.kb.schema import Document
+
+PAGES = [
+    Document(content="Page one text.", metadata={"source": "a.pdf", "file_name": "a.pdf", "page_number": 1, "total_pages": 2}),
+    Document(content="Page two text.", metadata={"source": "a.pdf", "file_name": "a.pdf", "page_number": 2, "total_pages": 2}),
+]
+
+def test_cache_roundtrip_repoints_location(tmp_path):
+    cache = ParsedTextCache(str(tmp_path / "processed"))
+    assert cache.get("b/renamed.pdf", "ab" * 32, "pdf", 1) is None
+    
+    cache.put("ab" * 32, "pdf", 1, PAGES)
+    docs = cache.get("b/renamed.pdf", "ab" * 32, "pdf", 1)
+    
+    assert [d.content for d in docs] == ["Page one text.", "Page two text."]
+    assert docs[1].metadata["page_number"] == 2
+    assert docs[1].metadata["total_pages"] == 2
+    # Location comes from the path we asked for, not from the cached entry
+    assert docs[0].metadata["source"] == "b/renamed.pdf"
+    assert docs[0].metadata["file_name"] == "renamed.pdf"
+    
+    # A different loader version is a miss
+    assert cache.get("b/renamed.pdf", "ab" * 32, "pdf", 2) is None
+
+def test_load_file_uses_cache(tmp_path, monkeypatch):
+    calls = []
+    def fake_loader(file_path):
+        calls.append(file_path)
+        return [Document(content="parsed", metadata={"source": file_path, "page_number": 1})]
+    monkeypatch.setitem(LOADERS, ".pdf", fake_loader)
+    
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(b"%PDF-fake")
+    cache_dir = str(tmp_path / "processed")
+    
+    first = load_file(str(path), cache_dir)
+    second = load_file(str(path), cache_dir)
+    assert len(calls) == 1
+    assert not first.cached and second.cached
+    assert first.sha256 == second.sha256
+    assert second.documents[0].content == "parsed"
+    
+    # Changed content -> new key -> parsed again
+    path.write_bytes(b"%PDF-fake-v2")
+    third = load_file(str(path), cache_dir)
+    assert len(calls) == 2 and not third.cached
+    
+    # Bumping the loader version invalidates
+    monkeypatch.setitem(loader_mod.LOADER_VERSIONS, ".pdf", ("pdf", 99))
+    load_file(str(path), cache_dir)
+    assert len(calls) == 3
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = ParsedTextCache(str(tmp_path))
+    cache.put("cd" * 32, "html", 1, PAGES)
+    entry = tmp_path / "html" / "cd" / f"{'cd' * 32}.v1.json.gz"
+    entry.write_bytes(b"not gzip")
+    assert cache.get("x.html", "cd" * 32, "html", 1) is None
+
+def test_failed_parse_is_reported_and_not_cached(tmp_path, monkeypatch):
+    calls = []
+    def flaky_loader(file_path):
+        calls.append(file_path)
+        if len(calls) == 1:
+            raise ValueError("bad xref")
+        return [Document(content="parsed", metadata={"source": file_path, "page_number": 1})]
+    monkeypatch.setitem(LOADERS, ".pdf", flaky_loader)
+
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(b"%PDF-fake")
+    cache_dir = str(tmp_path / "processed")
+
+    results = list(loader_mod.iter_load_documents([str(path)], cache_dir=cache_dir, workers=0))
+    assert not results[0].ok and "bad xref" in results[0].error
+    # Nothing was cached for the failed parse, so the next run parses again
+    again = load_file(str(path), cache_dir)
+    assert len(calls) == 2 and not again.cached and again.documents[0].content == "parsed"
@@ -53,3 +53,16 @@ def test_pdf_loader_file_not_found(mock_exists):
     mock_exists.return_value = False
     with pytest.raises(FileNotFoundError):
         PDFLoader("non_existent.pdf")
+
+@patch("src.kb.ingestion.pdf_loader.PdfReader")
+@patch("os.path.exists")
+def test_pdf_loader_raises_on_broken_page(mock_exists, mock_pdf_reader):
+    mock_exists.return_value = True
+    good, broken = MagicMock(), MagicMock()
+    good.extract_text.return_value = "Hello World"
+    broken.extract_text.side_effect = ValueError("bad xref")
+    mock_pdf_reader.return_value.pages = [good, broken]
+
+    # No partial result: the error reaches the caller
+    with pytest.raises(ValueError):
+        PDFLoader("broken.pdf").load()
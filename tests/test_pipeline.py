@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from src.kb.chunking.chunker import Chunker
+from src.kb.index.vector_store import VectorStore
+from src.kb.ingestion.manifest import IngestManifest
+from src.kb.ingestion.pipeline import IngestPipeline
+
+class FakeEmbedder:
+    """Deterministic 4-dim embeddings; optionally fails after N calls."""
+    def __init__(self, fail_after=None):
+        self.calls = 0
+        self.batch_sizes = []
+        self.fail_after = fail_after
+
+    def embed_documents(self, documents, show_progress_bar=True):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise RuntimeError("simulated crash")
+        self.batch_sizes.append(len(documents))
+        vecs = np.array([[len(d.content), d.content.count("a"), 1.0, 0.5] for d in documents], dtype="float32")
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+def _make_corpus(data_dir, n_files=5, paragraphs=40):
+    paths = []
+    for i in range(n_files):
+        path = data_dir / f"doc{i}.html"
+        body = "".join(f"<p>File {i} paragraph {j} talks about topic {i * j}.</p>\n" for j in range(paragraphs))
+        path.write_text(f"<html><head><title>Doc {i}</title></head><body>{body}</body></html>", encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+def _pipeline(tmp_path, embedder, **kwargs):
+    store = VectorStore(index_path=str(tmp_path / "index"))
+    manifest = IngestManifest(str(tmp_path / "index" / "manifest.json"))
+    chunker = Chunker(chunk_size=60, chunk_overlap=0)
+    return IngestPipeline(chunker, embedder, store, manifest, **kwargs)
+
+def test_pipeline_streams_in_batches(tmp_path):
+    data_dir = tmp_path / "raw"
+    data_dir.mkdir()
+    paths = _make_corpus(data_dir)
+    
+    embedder = FakeEmbedder()
+    pipeline = _pipeline(tmp_path, embedder, batch_size=8, checkpoint_every=2)
+    stats = pipeline.run(paths)
+    
+    assert stats.files == 5
+    assert stats.chunks == len(pipeline.store.metadata) == pipeline.store.index.ntotal
+    # Never more than one batch handed to the embedder at a time
+    assert max(embedder.batch_sizes) <= 8
+    assert stats.batches == len(embedder.batch_sizes)
+    assert stats.checkpoints >= 2
+    
+    # Every file recorded with the chunk ids it produced
+    for path in paths:
+        record = pipeline.manifest.get(path)
+        assert record is not None
+        assert len(record.chunk_ids) == sum(1 for d in pipeline.store.metadata if d.metadata["source"] == path)
+
+def test_pipeline_resumes_after_crash(tmp_path):
+    data_dir = tmp_path / "raw"
+    data_dir.mkdir()
+    paths = _make_corpus(data_dir, n_files=6)
+    
+    # First run dies after a few batches; some checkpoints were written
+    crashing = _pipeline(tmp_path, FakeEmbedder(fail_after=5), batch_size=4, checkpoint_every=1)
+    with pytest.raises(RuntimeError):
+        crashing.run(paths)
+    
+    manifest = IngestManifest(str(tmp_path / "index" / "manifest.json"))
+    plan = manifest.plan(paths, scope=str(data_dir))
+    assert plan.unchanged  # completed files survive
+    assert plan.new        # the rest is picked up again
+    
+    # Second run only ingests what's left, and doesn't duplicate partial files
+    resumed = _pipeline(tmp_path, FakeEmbedder(), batch_size=4)
+    resumed.run(plan.to_ingest)
+    
+    reference = _pipeline(tmp_path / "ref", FakeEmbedder(), batch_size=4)
+    reference.run(paths)
+    
+    def chunk_keys(store):
+        return sorted((d.metadata["source"], d.metadata["chunk_id"]) for d in store.metadata)
+    
+    assert chunk_keys(resumed.store) == chunk_keys(reference.store)
+    assert resumed.store.index.ntotal == reference.store.index.ntotal
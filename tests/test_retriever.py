@@ -1,6 +1,8 @@
 import pytest
 from unittest.mock import MagicMock, patch
+import numpy as np
 from src.kb.retrieve.retriever import Retriever, Reranker
+from src.kb.index.vector_store import VectorStore
 from src.kb.schema import Document
 
 TEST_DOCS = [
@@ -26,6 +28,7 @@ def test_reranker_logic(mock_ce):
     assert len(reranked) == 2
     assert reranked[0].metadata["id"] == "C"
     assert reranked[0].metadata["rerank_score"] == 0.9
+    assert reranked[0].score == 0.9 and TEST_DOCS[2].score is None
     assert reranked[1].metadata["id"] == "A"
 
 def test_retriever_flow():
@@ -60,3 +63,42 @@ def test_retriever_flow():
     mock_reranker.rerank.assert_not_called()
     assert len(results_no_rerank) == 2
     assert results_no_rerank[0].metadata["id"] == "A" # Original order
+
+def test_retriever_prefilters_by_file(tmp_path):
+    vectors = np.random.RandomState(0).randn(200, 16).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    docs = [Document(content=f"doc {i}", metadata={"source": f"/data/{i % 100}.pdf"}) for i in range(200)]
+    store = VectorStore(index_path=str(tmp_path / "idx"))
+    store.add_documents(docs, vectors)
+    embedder = MagicMock()
+    embedder.embed_query.return_value = vectors[0]
+    
+    results = Retriever(embedder, store).retrieve("q", top_k=5, top_n=5, use_rerank=False, file_filters=["42.pdf"])
+    assert sorted(d.content for d in results) == ["doc 142", "doc 42"]
+
+@patch("src.kb.retrieve.retriever.CrossEncoder")
+def test_retrieve_batch_matches_retrieve(mock_ce, tmp_path):
+    vectors = np.random.RandomState(0).randn(200, 16).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    docs = [Document(content=f"doc {i}", metadata={"source": f"/data/{i % 100}.pdf"}) for i in range(200)]
+    store = VectorStore(index_path=str(tmp_path / "idx"))
+    store.add_documents(docs, vectors)
+    queries = {f"q{i}": vectors[i] + 0.1 * vectors[i + 1] for i in range(6)}
+    queries["q6"] = queries["q0"]
+    embedder = MagicMock()
+    embedder.embed_query.side_effect = lambda q: queries[q]
+    embedder.embed_queries.side_effect = lambda qs: np.array([queries[q] for q in qs])
+    # Score = length of the chunk text times the query number, so every query ranks differently
+    instance = MagicMock()
+    instance.predict.side_effect = lambda pairs: [len(doc) * (int(q[1:]) % 3 - 1) for q, doc in pairs]
+    mock_ce.return_value = instance
+    retriever = Retriever(embedder, store, Reranker("fake/path"))
+    
+    single = [[(d.content, d.metadata["rerank_score"]) for d in retriever.retrieve(q, top_k=10, top_n=3)] for q in queries]
+    instance.predict.reset_mock()
+    batch = retriever.retrieve_batch(list(queries), top_k=10, top_n=3)
+    # One reranker pass; chunks shared between queries keep each query's own score
+    instance.predict.assert_called_once()
+    assert [[(d.content, d.metadata["rerank_score"]) for d in r] for r in batch] == single
+    assert retriever.retrieve_batch(list(queries), top_k=10, top_n=2, use_rerank=False, file_filters=["42.pdf"])[0] == \
+        retriever.retrieve("q0", top_k=10, top_n=2, use_rerank=False, file_filters=["42.pdf"])
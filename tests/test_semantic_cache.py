@@ -0,0 +1,74 @@
+import numpy as np
+from unittest.mock import MagicMock
+from src.kb.index.vector_store import VectorStore
+from src.kb.retrieve.cache import SemanticCache, scope_key
+from src.kb.retrieve.retriever import Retriever
+from src.kb.schema import Document
+
+
+def _unit(n, dim, seed=0):
+    vectors = np.random.RandomState(seed).randn(n, dim).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_semantic_cache_matches_similar_queries(tmp_path):
+    vectors = _unit(4, 16)
+    cache = SemanticCache(str(tmp_path), max_entries=2)
+    scope = scope_key("pump overheating", top_k=10)
+    cache.put("pump overheating", vectors[0], "v1", scope, [(7, 0.9), (3, 0.5)], answer="Replace the seal.")
+
+    # A close paraphrase hits; another question, scope or index version misses
+    entry = cache.get(vectors[0] + 0.05 * vectors[1], "v1", scope)
+    assert (entry.query, entry.results, entry.answer) == ("pump overheating", [(7, 0.9), (3, 0.5)], "Replace the seal.")
+    assert cache.get(vectors[1], "v1", scope) is None
+    assert cache.get(vectors[0], "v1", scope_key("pump overheating", top_k=5)) is None
+    assert cache.get(vectors[0], "v2", scope) is None
+    # Identifiers are part of the scope: these embed alike but are different questions
+    assert scope_key("error E1042", top_k=10) != scope_key("error E1043", top_k=10)
+    assert scope_key("泵体过热", top_k=10) == scope_key("泵过热", top_k=10)
+
+    # Persistent and bounded, least recently used out
+    cache.put("seal kit", vectors[2], "v1", scope, [(1, 0.8)])
+    cache.get(vectors[0], "v1", scope)
+    cache.put("valve", vectors[3], "v1", scope, [(2, 0.7)])
+    reopened = SemanticCache(str(tmp_path))
+    assert len(reopened) == 2 and reopened.get(vectors[2], "v1", scope) is None
+    assert reopened.get(vectors[0], "v1", scope).results == [(7, 0.9), (3, 0.5)]
+
+    # Storing a result for a new index version drops the old ones
+    reopened.put("valve", vectors[3], "v2", scope, [])
+    assert len(reopened) == 1 and cache.get(vectors[0], "v1", scope) is None
+
+
+def test_retriever_reuses_results_until_the_index_changes(tmp_path):
+    vectors = _unit(60, 16)
+    docs = [Document(content=f"note {i}", metadata={"source": f"{i % 6}.pdf"}) for i in range(60)]
+    store = VectorStore(index_path=str(tmp_path / "idx"))
+    store.add_documents(docs[:50], vectors[:50])
+    store.save()
+    version = store.version
+    store.save()
+    assert store.version == version and VectorStore(index_path=str(tmp_path / "idx")).version == version
+
+    queries = {"q": vectors[3], "q paraphrased": vectors[3] + 0.05 * vectors[4], "other": vectors[9]}
+    embedder = MagicMock()
+    embedder.embed_query.side_effect = lambda q: queries[q]
+    retriever = Retriever(embedder, store, cache=SemanticCache(str(tmp_path / "idx")))
+    search = MagicMock(wraps=store.search)
+    store.search = search
+
+    first = retriever.retrieve("q", top_k=5, top_n=5, use_rerank=False)
+    again = retriever.retrieve("q paraphrased", top_k=5, top_n=5, use_rerank=False)
+    assert search.call_count == 1
+    assert [(d.content, d.score) for d in again] == [(d.content, d.score) for d in first]
+    # Other filters or questions are searched
+    retriever.retrieve("q paraphrased", top_k=5, top_n=5, use_rerank=False, file_filters=["3.pdf"])
+    retriever.retrieve("other", top_k=5, top_n=5, use_rerank=False)
+    assert search.call_count == 3
+
+    # A save that changes the index invalidates the cache
+    store.add_documents(docs[50:], vectors[50:])
+    store.save()
+    assert store.version != version
+    retriever.retrieve("q paraphrased", top_k=5, top_n=5, use_rerank=False)
+    assert search.call_count == 4 and len(retriever.cache) == 1
@@ -0,0 +1,99 @@
+import os
+import numpy as np
+from src.kb.index.shards import DEFAULT_COLLECTION, ShardedVectorStore, folder_collection, is_sharded
+from src.kb.index.chunk_store import chunk_vector_id
+from src.kb.index.vector_store import VectorStore
+from src.kb.schema import Document
+
+
+def _unit(n, dim, seed=0):
+    vectors = np.random.RandomState(seed).randn(n, dim).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _docs(data_dir, folder, n):
+    directory = os.path.join(data_dir, folder) if folder else data_dir
+    return [Document(content=f"{folder} chunk {i}", metadata={"source": os.path.join(directory, f"{folder or 'top'}_{i // 5}.pdf"),
+                                                            "chunk_id": str(i)}) for i in range(n)]
+
+
+def test_folder_collection(tmp_path):
+    data_dir = str(tmp_path / "raw")
+    assert folder_collection(os.path.join(data_dir, "papers", "2024", "a.pdf"), data_dir) == "papers"
+    assert folder_collection(os.path.join(data_dir, "a.pdf"), data_dir) == DEFAULT_COLLECTION
+    assert folder_collection(str(tmp_path / "elsewhere" / "a.pdf"), data_dir) == DEFAULT_COLLECTION
+
+
+def test_sharded_store_routes_and_merges_search(tmp_path):
+    data_dir = str(tmp_path / "raw")
+    store = ShardedVectorStore(str(tmp_path / "index"), data_dir=data_dir)
+    docs = _docs(data_dir, "papers", 20) + _docs(data_dir, "manuals", 20) + _docs(data_dir, "", 5)
+    vectors = _unit(len(docs), 16)
+    store.add_documents(docs, vectors)
+
+    assert store.collections == ["default", "manuals", "papers"]
+    assert [len(store.shards[c].metadata) for c in store.collections] == [5, 20, 20]
+    assert docs[0].metadata["category"] == "papers"
+
+    # All collections: the same top-k as one exact search over everything
+    exact = np.argsort(-(vectors @ vectors[25]))[:5]
+    assert [d.content for d in store.search(vectors[25], top_k=5)] == [docs[i].content for i in exact]
+
+    # Routed: only the selected collection is searched
+    results = store.search(vectors[25], top_k=5, collections=["papers"])
+    assert len(results) == 5 and all(d.metadata["category"] == "papers" for d in results)
+    assert store.search(vectors[25], top_k=5, collections=["missing"]) == []
+    batch = store.search_batch(vectors[:10], top_k=5, collections=["default", "papers"])
+    assert batch == [store.search(v, top_k=5, collections=["default", "papers"]) for v in vectors[:10]]
+
+    # File filters still apply across collections
+    ids = store.ids_for_files(["manuals_1.pdf"])
+    assert {os.path.basename(d.metadata["source"]) for d in store.search(vectors[0], top_k=10, ids=ids)} == {"manuals_1.pdf"}
+
+
+def test_sharded_store_saves_and_rebuilds_per_collection(tmp_path):
+    data_dir = str(tmp_path / "raw")
+    index_path = str(tmp_path / "index")
+    store = ShardedVectorStore(index_path, data_dir=data_dir)
+    docs = _docs(data_dir, "papers", 20) + _docs(data_dir, "manuals", 20)
+    vectors = _unit(len(docs), 16)
+    store.add_documents(docs, vectors)
+    store.save()
+    assert is_sharded(index_path)
+
+    # Only the named collection is re-encoded
+    store.rebuild("int8", collections=["manuals"])
+    store.save()
+    reopened = ShardedVectorStore(index_path)
+    assert reopened.data_dir == data_dir
+    assert reopened.shards["manuals"].precision == "int8" and reopened.shards["papers"].precision == "fp32"
+    assert len(reopened.metadata) == 40
+    assert reopened.version == store.version and "manuals:" in store.version
+    assert [reopened.fetch([chunk_vector_id(d) for d in docs[18:22]])[chunk_vector_id(d)].content for d in docs[18:22]] == \
+        [d.content for d in docs[18:22]]
+
+    # A file recategorised leaves its old collection
+    moved = [Document(content=d.content, metadata={**d.metadata, "category": "manuals"}) for d in docs[:5]]
+    assert reopened.upsert(moved, lambda batch: vectors[:len(batch)]) == (5, 0, 5)
+    assert [len(reopened.shards[c].metadata) for c in reopened.collections] == [25, 15]
+
+
+def test_ingest_splits_a_store_into_collections(tmp_path):
+    data_dir = str(tmp_path / "raw")
+    index_path = str(tmp_path / "index")
+    single = VectorStore(index_path)
+    docs = _docs(data_dir, "papers", 10) + _docs(data_dir, "manuals", 10)
+    vectors = _unit(len(docs), 16)
+    single.add_documents(docs, vectors)
+    single.save()
+
+    sharded = ShardedVectorStore(index_path, data_dir=data_dir)
+    assert sharded.import_store(single) == 20
+    sharded.save()
+    single.clear()
+    single.save()
+
+    assert is_sharded(index_path) and len(VectorStore(index_path).metadata) == 0
+    store = ShardedVectorStore(index_path)
+    assert store.collections == ["manuals", "papers"]
+    assert store.search(vectors[3], top_k=1)[0].content == docs[3].content
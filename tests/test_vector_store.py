@@ -3,6 +3,8 @@ import numpy as np
 import os
 import shutil
 from unittest.mock import MagicMock, patch
+import src.kb.index.vector_store as vector_store_module
+from src.kb.index.chunk_store import StaleIndexError
 from src.kb.index.vector_store import Embedder, VectorStore
 from src.kb.schema import Document
 
@@ -59,6 +61,9 @@ def test_vector_store_add_and_search(tmp_path):
     assert len(results) == 2
     assert results[0].content == "Apple is a fruit."
     assert results[1].content == "Banana is yellow." # Close to [1,0]
+    # Scores are the inner products with the query; the stored chunks are left unscored
+    assert [round(d.score, 4) for d in results] == [1.0, 0.9]
+    assert all(d.score is None for d in store.metadata)
     
     # 3. Save and Load
     store.save()
@@ -78,3 +83,365 @@ def test_embedder_call():
         
         embedder.embed_query("test")
         embedder.model.encode.assert_called()
+
+def test_vector_store_delete_by_source(tmp_path):
+    store = VectorStore(index_path=str(tmp_path / "idx"))
+    docs = [
+        Document(content="A1", metadata={"source": "./data/raw/a.pdf"}),
+        Document(content="B1", metadata={"source": "./data/raw/b.pdf"}),
+        Document(content="A2", metadata={"source": "data/raw/a.pdf"}),
+    ]
+    embeddings = np.array([[1.0, 0.0], [0.0, 1.0], [0.9, 0.1]]).astype('float32')
+    store.add_documents(docs, embeddings)
+    
+    # Paths are compared after normalisation
+    removed = store.delete_by_source("data/raw/a.pdf")
+    assert removed == 2
+    assert [d.content for d in store.metadata] == ["B1"]
+    assert store.index.ntotal == 1
+    
+    results = store.search(np.array([1.0, 0.0]).astype('float32'), top_k=2)
+    assert [d.content for d in results] == ["B1"]
+    assert store.delete_by_source(["missing.pdf"]) == 0
+
+def test_embedder_length_bucketed_batches():
+    with patch("src.kb.index.vector_store.SentenceTransformer") as mock_st:
+        model = mock_st.return_value
+        model.tokenizer = None
+        batch_calls = []
+        def fake_encode(texts, batch_size=32, **kwargs):
+            batch_calls.append([len(t) for t in texts])
+            return np.array([[float(len(t)), 1.0] for t in texts])
+        model.encode.side_effect = fake_encode
+        
+        embedder = Embedder("fake_model", max_batch_tokens=200, max_batch_size=4)
+        texts = ["x" * n for n in (30, 600, 3, 90, 9, 300, 12, 45, 6)]
+        embeddings = embedder.embed_documents([Document(content=t) for t in texts])
+        
+        # Original order restored
+        assert embeddings[:, 0].tolist() == [float(len(t)) for t in texts]
+        # Longest first, and each batch respects the padded-token budget (estimate: len // 3 + 2)
+        for call in batch_calls:
+            assert call == sorted(call, reverse=True)
+            assert len(call) <= 4
+            assert len(call) == 1 or len(call) * (call[0] // 3 + 2) <= 200
+        assert sum(len(c) for c in batch_calls) == len(texts)
+
+def _unit(n, dim, seed=0):
+    vectors = np.random.RandomState(seed).randn(n, dim).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+@pytest.mark.parametrize("precision,dim", [("fp16", None), ("int8", None), ("fp32", 16), ("int8", 16)])
+def test_vector_store_compact_storage(tmp_path, precision, dim):
+    vectors = _unit(300, 32)
+    docs = [Document(content=f"doc {i}", metadata={"source": f"{i}.pdf"}) for i in range(300)]
+    store = VectorStore(index_path=str(tmp_path / "idx"), precision=precision, dim=dim)
+    store.add_documents(docs[:150], vectors[:150])
+    store.add_documents(docs[150:], vectors[150:])
+    assert store.index.d == (dim or 32)
+    
+    # Settings come back with the index; queries are truncated the same way
+    store.save()
+    assert store.nbytes < 300 * 32 * 4
+    reloaded = VectorStore(index_path=str(tmp_path / "idx"))
+    assert (reloaded.precision, reloaded.dim) == (precision, dim)
+    hits = sum(reloaded.search(vectors[i], top_k=1)[0].content == f"doc {i}" for i in range(0, 300, 10))
+    assert hits >= 27
+
+def test_int8_range_covers_the_whole_buffer(tmp_path):
+    # The first batch spans a narrow range; later ones must not be clipped to it
+    vectors = _unit(200, 16)
+    vectors[:20] *= 0.1
+    store = VectorStore(index_path=str(tmp_path / "idx"), precision="int8")
+    store.add_documents([Document(content=str(i), metadata={}) for i in range(20)], vectors[:20])
+    store.add_documents([Document(content=str(i), metadata={}) for i in range(20, 200)], vectors[20:])
+    store.save()
+    _, decoded = store.index.export(store.index_path)
+    assert np.abs(decoded - vectors).max() < 0.02
+
+def test_vector_store_rebuild_without_reembedding(tmp_path):
+    vectors = _unit(50, 8)
+    store = VectorStore(index_path=str(tmp_path / "idx"))
+    store.add_documents([Document(content=str(i), metadata={}) for i in range(50)], vectors)
+    
+    store.rebuild("fp16", 4)
+    assert (store.precision, store.dim, store.index.d, store.index.ntotal) == ("fp16", 4, 4, 50)
+    assert store.search(vectors[7], top_k=1)[0].content == "7"
+    with pytest.raises(ValueError):
+        store.rebuild("fp32", None)
+
+def test_evaluate_storage_recall():
+    from src.kb.eval.storage import evaluate_storage
+    vectors = _unit(500, 64)
+    queries = _unit(20, 64, seed=1)
+    results = evaluate_storage(vectors, queries, [("fp32", None), ("fp16", None), ("int8", 32)], k=5)
+    assert [r.bytes_per_vector for r in results] == [256, 128, 32]
+    assert results[0].recall == 1.0
+    assert results[1].recall > 0.95
+    assert 0 < results[2].recall < 1.0
+
+@pytest.mark.parametrize("index_type,params", [("hnsw", {"hnsw_m": 16}), ("ivf", {"nlist": 16, "nprobe": 16}), ("ivfpq", {"nlist": 16, "nprobe": 16, "pq_m": 8, "pq_bits": 4})])
+def test_vector_store_ann_index_types(tmp_path, index_type, params):
+    vectors = _unit(1000, 32)
+    docs = [Document(content=f"doc {i}", metadata={"source": f"{i % 10}.pdf"}) for i in range(1000)]
+    store = VectorStore(index_path=str(tmp_path / "idx"), index_type=index_type, index_params=params)
+    store.add_documents(docs, vectors)
+    store.save()
+    assert store.built_type == index_type
+    
+    # Type and parameters come back with the index
+    reloaded = VectorStore(index_path=str(tmp_path / "idx"))
+    assert (reloaded.index_type, reloaded.built_type) == (index_type, index_type)
+    assert all(reloaded.index_params[k] == v for k, v in params.items())
+    hits = sum(reloaded.search(vectors[i], top_k=1)[0].content == f"doc {i}" for i in range(0, 1000, 20))
+    assert hits >= (40 if index_type == "ivfpq" else 48)
+    
+    # Deleted vectors stay in their (immutable) segment and are skipped until it is merged
+    assert reloaded.delete_by_source("3.pdf") == 100
+    assert len(reloaded.chunks) == reloaded.index.ntotal - len(reloaded.tombstones) == 900
+    assert reloaded.search(vectors[5], top_k=1)[0].content == "doc 5"
+    assert all(d.metadata["source"] != "3.pdf" for d in reloaded.search(vectors[3], top_k=20))
+
+def test_vector_store_auto_index_type(tmp_path, monkeypatch):
+    import src.kb.index.index_types as index_types
+    monkeypatch.setattr(index_types, "AUTO_HNSW_MIN", 200)
+    vectors = _unit(300, 16)
+    store = VectorStore(index_path=str(tmp_path / "idx"))
+    store.add_documents([Document(content=str(i), metadata={}) for i in range(100)], vectors[:100])
+    store.save()
+    assert store.built_type == "flat"
+    
+    store.add_documents([Document(content=str(i), metadata={}) for i in range(100, 300)], vectors[100:])
+    store.save()
+    assert store.built_type == "hnsw"
+    assert VectorStore(index_path=str(tmp_path / "idx")).search(vectors[250], top_k=1)[0].content == "250"
+
+@pytest.mark.parametrize("index_type,params", [("flat", {}), ("hnsw", {"hnsw_m": 16}), ("ivf", {"nlist": 16, "nprobe": 2})])
+def test_vector_store_filtered_search(tmp_path, monkeypatch, index_type, params):
+    import src.kb.index.index_types as index_types
+    vectors = _unit(1000, 32)
+    docs = [Document(content=f"doc {i}", metadata={"source": f"/data/{i % 50}.pdf"}) for i in range(1000)]
+    store = VectorStore(index_path=str(tmp_path / "idx"), index_type=index_type, index_params=params)
+    store.add_documents(docs, vectors)
+    store.save()
+    
+    # A narrow filter still fills top_k, with the exact best matches among its chunks
+    ids = store.ids_for_files(["7.pdf", "8.pdf"])
+    assert len(ids) == 40
+    query = vectors[123]
+    rows = [i for i in range(1000) if i % 50 in (7, 8)]
+    expected = sorted(rows, key=lambda r: -float(vectors[r] @ query))[:10]
+    results = store.search(query, top_k=10, ids=ids)
+    assert [d.content for d in results] == [f"doc {r}" for r in expected]
+    assert store.search(query, top_k=10, ids=[]) == []
+    
+    # Wide filters go through the index with an ID selector
+    monkeypatch.setattr(index_types, "FILTER_EXACT_MAX", 100)
+    ids = store.ids_for_files([f"{i}.pdf" for i in range(25)])
+    results = store.search(vectors[10], top_k=10, ids=ids)
+    assert len(results) == 10
+    assert results[0].content == "doc 10"
+    assert all(int(d.metadata["source"][6:-4]) < 25 for d in results)
+
+@pytest.mark.parametrize("index_type,params", [("flat", {}), ("hnsw", {"hnsw_m": 16}), ("ivf", {"nlist": 16, "nprobe": 4})])
+def test_vector_store_search_batch_matches_search(tmp_path, monkeypatch, index_type, params):
+    import src.kb.index.index_types as index_types
+    vectors = _unit(1000, 32)
+    docs = [Document(content=f"doc {i}", metadata={"source": f"/data/{i % 50}.pdf"}) for i in range(1000)]
+    store = VectorStore(index_path=str(tmp_path / "idx"), index_type=index_type, index_params=params)
+    store.add_documents(docs[:800], vectors[:800])
+    store.save()
+    # Two segments (one buffered) and tombstones
+    store.add_documents(docs[800:], vectors[800:])
+    store.delete_by_source("/data/3.pdf")
+    queries = _unit(12, 32, seed=1)
+    
+    def contents(results):
+        return [[d.content for d in r] for r in results]
+    assert contents(store.search_batch(queries, top_k=8)) == contents(store.search(q, top_k=8) for q in queries)
+    ids = store.ids_for_files(["7.pdf", "8.pdf"])
+    assert contents(store.search_batch(queries, top_k=8, ids=ids)) == contents(store.search(q, top_k=8, ids=ids) for q in queries)
+    # Wide filters: the index with an ID selector, exact scans only for queries it leaves short
+    monkeypatch.setattr(index_types, "FILTER_EXACT_MAX", 100)
+    ids = store.ids_for_files([f"{i}.pdf" for i in range(25)])
+    assert contents(store.search_batch(queries, top_k=8, ids=ids)) == contents(store.search(q, top_k=8, ids=ids) for q in queries)
+    assert store.search_batch(queries[:0], top_k=8) == []
+
+def _file_chunks(source, texts):
+    return [Document(content=t, metadata={"source": source, "chunk_id": f"{source}_1_{i}"}) for i, t in enumerate(texts)]
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_vector_store_upsert_replaces_a_file(tmp_path, index_type):
+    vectors = {t: v for t, v in zip("abcdefgh", _unit(8, 16))}
+    embedded = []
+    def embed(docs):
+        embedded.extend(d.content for d in docs)
+        return np.array([vectors[d.content] for d in docs])
+    
+    store = VectorStore(index_path=str(tmp_path / "idx"), index_type=index_type)
+    assert store.upsert(_file_chunks("x.pdf", "abc"), embed) == (3, 0, 0)
+    store.upsert(_file_chunks("y.pdf", "d"), embed)
+    store.save()
+    
+    # Only the changed chunk is embedded; the dropped one goes; other files are untouched
+    embedded.clear()
+    assert store.upsert(_file_chunks("x.pdf", "ae"), embed) == (1, 1, 2)
+    assert embedded == ["e"]
+    assert sorted(d.content for d in store.metadata) == ["a", "d", "e"]
+    assert store.search(vectors["b"], top_k=3)[0].content != "b"
+    store.save()
+    
+    reopened = VectorStore(index_path=str(tmp_path / "idx"))
+    assert sorted(d.content for d in reopened.metadata) == ["a", "d", "e"]
+    assert reopened.search(vectors["e"], top_k=1)[0].content == "e"
+    # Adding the same chunks again replaces them instead of duplicating
+    reopened.add_documents(_file_chunks("y.pdf", "d"), np.array([vectors["d"]]))
+    assert len(reopened.metadata) == 3
+    assert reopened.index.ntotal - len(reopened.tombstones) == 3
+    
+    reopened.compact()
+    assert not reopened.tombstones and reopened.index.ntotal == 3
+    assert [d.content for d in reopened.search(vectors["a"], top_k=3)][0] == "a"
+
+@pytest.mark.parametrize("index_type,params", [("flat", {}), ("hnsw", {"hnsw_m": 16}), ("ivf", {"nlist": 16})])
+def test_vector_store_mmap_load(tmp_path, index_type, params):
+    vectors = _unit(1000, 16)
+    docs = [Document(content=f"doc {i}", metadata={"source": f"{i % 10}.pdf"}) for i in range(1000)]
+    store = VectorStore(index_path=str(tmp_path / "idx"), index_type=index_type, index_params=params)
+    store.add_documents(docs, vectors)
+    store.save()
+    
+    mapped = VectorStore(index_path=str(tmp_path / "idx"), mmap=True)
+    assert mapped.mapped and mapped.built_type == index_type
+    assert mapped.search(vectors[17], top_k=1)[0].content == "doc 17"
+    assert [d.content for d in mapped.search(vectors[3], top_k=3, ids=mapped.ids_for_files(["3.pdf"]))][0] == "doc 3"
+    
+    # Mapped segments are never modified: additions go to a new segment, deletions to the manifest
+    mapped.delete_by_source("7.pdf")
+    mapped.add_documents([Document(content="new", metadata={"source": "new.pdf"})], _unit(1, 16, seed=5))
+    assert mapped.mapped
+    mapped.save()
+    assert len(mapped.index.segments) == 2
+    reopened = VectorStore(index_path=str(tmp_path / "idx"), mmap=True)
+    assert len(reopened.metadata) == 901
+    assert reopened.search(_unit(1, 16, seed=5)[0], top_k=1)[0].content == "new"
+
+def test_mmap_load_without_flat_mapping(tmp_path, monkeypatch):
+    import faiss
+    # FAISS versions without IO_FLAG_MMAP_IFC read flat segments into memory
+    monkeypatch.delattr(faiss, "IO_FLAG_MMAP_IFC")
+    vectors = _unit(100, 16)
+    store = VectorStore(index_path=str(tmp_path / "idx"))
+    store.add_documents([Document(content=f"doc {i}", metadata={}) for i in range(100)], vectors)
+    store.save()
+    mapped = VectorStore(index_path=str(tmp_path / "idx"), mmap=True)
+    assert mapped.search(vectors[17], top_k=1)[0].content == "doc 17"
+
+def _segment_files(path):
+    return sorted(os.listdir(os.path.join(path, "segments")))
+
+def test_vector_store_saves_new_vectors_as_a_segment(tmp_path):
+    path = str(tmp_path / "idx")
+    vectors = _unit(40, 16)
+    docs = [Document(content=f"doc {i}", metadata={"source": f"{i // 5}.pdf"}) for i in range(40)]
+    store = VectorStore(index_path=path)
+    store.add_documents(docs[:30], vectors[:30])
+    store.save()
+    first = _segment_files(path)
+    written = os.stat(os.path.join(path, "segments", first[0])).st_mtime_ns
+    
+    # Only the new vectors are written; the existing segment file is left alone
+    store.add_documents(docs[30:], vectors[30:])
+    store.delete_by_source("0.pdf")
+    store.save()
+    assert len(_segment_files(path)) == 2
+    assert os.stat(os.path.join(path, "segments", first[0])).st_mtime_ns == written
+    
+    reopened = VectorStore(index_path=path)
+    assert len(reopened.tombstones) == 5 and len(reopened.metadata) == 35
+    assert reopened.search(vectors[35], top_k=1)[0].content == "doc 35"
+    assert all(d.metadata["source"] != "0.pdf" for d in reopened.search(vectors[5], top_k=5))
+
+def test_vector_store_interrupted_save_keeps_the_last_commit(tmp_path, monkeypatch):
+    from src.kb.index.chunk_store import ChunkStore
+    path = str(tmp_path / "idx")
+    vectors = _unit(20, 16)
+    store = VectorStore(index_path=path)
+    store.add_documents([Document(content=f"doc {i}", metadata={}) for i in range(10)], vectors[:10])
+    store.save()
+    
+    # Crash after the new segment is written but before the commit
+    store.add_documents([Document(content=f"doc {i}", metadata={}) for i in range(10, 20)], vectors[10:])
+    def crash(self, meta=None, expected=None):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(ChunkStore, "commit", crash)
+    with pytest.raises(KeyboardInterrupt):
+        store.save()
+    monkeypatch.undo()
+    assert len(_segment_files(path)) == 2
+    
+    reopened = VectorStore(index_path=path)
+    assert len(reopened.metadata) == reopened.index.live == 10
+    # The unlisted file could be another process's save in progress until it is ORPHAN_AGE old
+    reopened.save()
+    assert len(_segment_files(path)) == 2
+    monkeypatch.setattr(vector_store_module, "ORPHAN_AGE", 0)
+    reopened.save()
+    assert len(_segment_files(path)) == 1
+
+def test_vector_store_concurrent_saves_never_lose_data(tmp_path):
+    path = str(tmp_path / "idx")
+    vectors = _unit(20, 16)
+    docs = [Document(content=f"doc {i}", metadata={"source": f"{i}.pdf"}) for i in range(20)]
+    first = VectorStore(index_path=path)
+    first.add_documents(docs[:5], vectors[:5])
+    first.save()
+
+    # Two processes open the same index; both add chunks and save
+    ui, cli = VectorStore(index_path=path, mmap=True), VectorStore(index_path=path)
+    cli.add_documents(docs[5:10], vectors[5:10])
+    cli.save()
+    ui.add_documents(docs[10:13], vectors[10:13])
+    assert ui.stale and not cli.stale
+    with pytest.raises(StaleIndexError):
+        ui.save()
+    # Nothing of the refused save was committed, and the other save's files are intact
+    reopened = VectorStore(index_path=path)
+    assert len(reopened.metadata) == reopened.index.live == 10
+    assert reopened.search(vectors[7], top_k=1)[0].content == "doc 7"
+
+    # Reloaded, the same changes save on top of the other process's
+    ui.reload()
+    ui.add_documents(docs[10:13], vectors[10:13])
+    ui.save()
+    reopened = VectorStore(index_path=path)
+    assert len(reopened.metadata) == reopened.index.live == 13
+    assert [reopened.search(vectors[i], top_k=1)[0].content for i in (2, 7, 12)] == ["doc 2", "doc 7", "doc 12"]
+    assert len(_segment_files(path)) == 3
+
+def test_vector_store_merges_small_segments(tmp_path):
+    path = str(tmp_path / "idx")
+    vectors = _unit(30, 16)
+    store = VectorStore(index_path=path)
+    for n in range(6):
+        store.add_documents([Document(content=f"doc {i}", metadata={"source": f"{n}.pdf"}) for i in range(n * 5, n * 5 + 5)],
+                            vectors[n * 5:n * 5 + 5])
+        store.save()
+    assert len(store.index.segments) == 6
+    
+    # Each save stays small; merging happens on a background thread and is installed by a later save
+    for n in range(6, 10):
+        store.add_documents([Document(content=f"x {n}", metadata={"source": f"{n}.pdf"})], _unit(1, 16, seed=n))
+        store.save(background_merge=True)
+    store.wait_for_merges()
+    assert len(store.index.segments) == 10
+    # Deleted while the merge ran: still deleted in the merged segment
+    store.delete_by_source("1.pdf")
+    store.save(background_merge=True)
+    assert len(store.index.segments) == 1 and store.index.ntotal == 34 and len(store.tombstones) == 5
+    assert len(_segment_files(path)) == 1
+    
+    reopened = VectorStore(index_path=path)
+    assert len(reopened.metadata) == reopened.index.live == 29
+    assert reopened.search(vectors[25], top_k=1)[0].content == "doc 25"
+    assert all(d.metadata["source"] != "1.pdf" for d in reopened.search(vectors[7], top_k=10))